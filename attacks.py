@@ -1,7 +1,415 @@
+import argparse
+import functools
+import json
+import os
+import random
+import secrets
+import string
+import sys
+
 from enigma import Enigma
+from enigma.lib.banburismus import LANGUAGE_REPEAT_RATE, Banburismus
+from enigma.lib.bombe import Bombe, Menu
+from enigma.lib.ciphertext_only import CiphertextOnlyAttack
+from enigma.lib.compiled import CompiledEnigma
+from enigma.lib.corpus import DEFAULT_BLOCK_SIZE, NgramCounter
+from enigma.lib.cribs import CribDragger
+from enigma.lib.depth import DepthAttack
+from enigma.lib.distributed import KeySearchCoordinator, run_worker
+from enigma.lib.internals import N_ROTORS
+from enigma.lib.planner import PlannedAttack
+from enigma.lib.rejewski import CycleCatalog
+
+DEMO_PLAINTEXT = (
+    "theenigmamachinewasusedbythenazisduringthesecondworldwartoencryptwarcommunications"
+    "themachinewasusedalreadybeforethestartofthewarinthenineteenthirtiesthepolishcryptologists"
+    "hadalreadybrokenenigmahoweverbythestartofthewarthegermancryptographershadincreasedits"
+    "securityonlyafterthestartofthewaralanturingandhisteammanagedtobreakitagainatbletchleypark"
+)
+
+
+def parse_ints(value: str) -> tuple[int, ...]:
+    return tuple(int(v) for v in value.split(","))
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    shard, n_shards = value.split("/")
+    return int(shard), int(n_shards)
+
+
+def report_progress(done: int, total: int, elapsed: float, unit: str = "keys"):
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else float("inf")
+    print(f"\r{done:,}/{total:,} {unit}, {rate:,.0f} {unit}/s, ETA {eta:.0f}s", end="", file=sys.stderr, flush=True)
+    if done == total:
+        print(file=sys.stderr)
+
+
+def parse_address(value: str) -> tuple[str, int]:
+    host, port = value.rsplit(":", 1)
+    return host, int(port)
+
+
+def load_wiring(args: argparse.Namespace) -> tuple:
+    if not args.rotors:
+        return None, None
+    with open(args.rotors) as f:
+        wiring = json.load(f)
+    return wiring["rotors"], wiring["reflector"]
+
+
+def demo_machine(args: argparse.Namespace, clear_plug_board: bool) -> Enigma:
+    """Create a random machine sharing this process' rotors, with the turnover notches given on the command line."""
+    machine = Enigma()
+    if clear_plug_board:
+        machine.plug_board.mapping = {c: c for c in string.ascii_lowercase}
+    for rotor, notch in zip(machine.rotors, args.notches):
+        rotor.set_turnover_notch(notch)
+    available = Enigma.get_available_rotors()
+    print(
+        f"demo key: rotor order {[available.index(r.rotor) for r in machine.rotors]}, "
+        f"starting positions {[r.offset % len(string.ascii_lowercase) for r in machine.rotors]}",
+        file=sys.stderr,
+    )
+    return machine
+
+
+def read_ciphertext(args: argparse.Namespace) -> str:
+    if args.file:
+        with open(args.file) as f:
+            return "".join(c for c in f.read().lower() if c in string.ascii_lowercase)
+    return args.ciphertext
+
+
+def ciphertext_only(args: argparse.Namespace):
+    rotor_mappings, reflector_mapping = load_wiring(args)
+    if args.demo:
+        # The plug board is cleared, as it is recovered separately
+        ctx = demo_machine(args, clear_plug_board=True).encrypt(DEMO_PLAINTEXT)
+    else:
+        ctx = read_ciphertext(args)
+
+    if args.search_notches:
+        attack = PlannedAttack(ctx, rotor_mappings=rotor_mappings, reflector_mapping=reflector_mapping, top_k=args.top_k)
+        plan = attack.plan
+        print(
+            f"{len(plan.patterns)} stepping patterns for {len(ctx)} letters: "
+            f"{plan.n_classes:,} keys to try per rotor order instead of {plan.n_keys:,}",
+            file=sys.stderr,
+        )
+    else:
+        attack = CiphertextOnlyAttack(
+            ctx,
+            rotor_mappings=rotor_mappings,
+            reflector_mapping=reflector_mapping,
+            turnover_notches=args.notches,
+            top_k=args.top_k,
+        )
+    shard, n_shards = args.shard
+    candidates = attack.run(n_workers=args.workers, shard=shard, n_shards=n_shards, progress=report_progress)
+    for candidate in candidates:
+        line = (
+            f"{candidate.score:.5f} rotor order {list(candidate.rotor_order)} "
+            f"starting positions {list(candidate.starting_positions)}"
+        )
+        if args.search_notches:
+            pattern, offsets = plan.classify(candidate.starting_positions, candidate.turnover_notches)
+            n_equivalent = plan.patterns[pattern].keys_per_class
+            line += f" turnover notches {list(candidate.turnover_notches)} ({n_equivalent:,} equivalent keys)"
+        print(line)
+
+
+def bombe(args: argparse.Namespace):
+    rotor_mappings, reflector_mapping = load_wiring(args)
+    if args.demo:
+        ctx = demo_machine(args, clear_plug_board=False).encrypt(DEMO_PLAINTEXT)
+        crib = DEMO_PLAINTEXT[args.offset:args.offset + args.demo]
+    else:
+        ctx, crib = read_ciphertext(args), args.crib
+
+    menu = Menu(crib, ctx, args.offset)
+    print(f"menu: {len(menu.edges)} edges, {len(menu.loops())} loops", file=sys.stderr)
+    machine = Bombe(menu, rotor_mappings=rotor_mappings, reflector_mapping=reflector_mapping, turnover_notches=args.notches)
+    for result in machine.run(n_workers=args.workers):
+        print(f"rotor order {list(result.rotor_order)}: {len(result.stops)} stops in {result.seconds:.2f}s", file=sys.stderr)
+        for stop in result.stops:
+            steckers = " ".join(
+                f"{string.ascii_lowercase[a]}{string.ascii_lowercase[b]}" for a, b in stop.steckers.items() if a < b
+            )
+            print(f"stop: rotor order {list(stop.rotor_order)} starting positions {list(stop.starting_positions)} steckers {steckers}")
+
+
+def search(args: argparse.Namespace):
+    rotor_mappings, reflector_mapping = load_wiring(args)
+    if args.demo:
+        ctx = demo_machine(args, clear_plug_board=True).encrypt(DEMO_PLAINTEXT)
+    else:
+        ctx = read_ciphertext(args)
+
+    coordinator = KeySearchCoordinator(
+        ctx,
+        rotor_mappings=rotor_mappings,
+        reflector_mapping=reflector_mapping,
+        top_k=args.top_k,
+        checkpoint=args.checkpoint,
+    )
+    # Connections unpickle what they receive: only workers knowing the key may connect
+    authkey = args.authkey if args.authkey is not None else secrets.token_hex(16)
+    candidates = coordinator.run(
+        n_local_workers=args.workers,
+        address=args.listen,
+        authkey=authkey.encode(),
+        progress=report_progress,
+        on_listen=lambda address: print(
+            f"listening for workers on {address[0]}:{address[1]} with --authkey {authkey}", file=sys.stderr
+        ),
+    )
+    for name, stats in sorted(coordinator.stats.items()):
+        print(f"worker {name}: {stats.units} units, {stats.keys_per_second:,.0f} keys/s", file=sys.stderr)
+    for candidate in candidates:
+        print(
+            f"{candidate.score:.5f} rotor order {list(candidate.rotor_order)} "
+            f"starting positions {list(candidate.starting_positions)} "
+            f"turnover notches {list(candidate.turnover_notches)}"
+        )
+
+
+def depth(args: argparse.Namespace):
+    rotor_mappings, reflector_mapping = load_wiring(args)
+    if args.demo:
+        machine = demo_machine(args, clear_plug_board=True)
+        messages = []
+        for i in range(args.demo):
+            # Every message starts from its own message key
+            for rotor in machine.rotors:
+                rotor.set_starting_position(random.randrange(len(string.ascii_lowercase)))
+            messages.append(machine.encrypt(DEMO_PLAINTEXT[i * 40:i * 40 + 100]))
+    else:
+        with open(args.messages) as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    attack = DepthAttack(
+        messages,
+        rotor_mappings=rotor_mappings,
+        reflector_mapping=reflector_mapping,
+        turnover_notches=args.notches,
+        top_k=args.top_k,
+    )
+    for candidate in attack.run(n_workers=args.workers, progress=report_progress):
+        positions = " ".join(",".join(map(str, p)) for p in candidate.starting_positions)
+        print(f"{candidate.score:.5f} rotor order {list(candidate.rotor_order)} starting positions {positions}")
+
+
+def banburismus(args: argparse.Namespace):
+    if args.demo:
+        machine = demo_machine(args, clear_plug_board=False)
+        messages = []
+        for _ in range(args.demo):
+            # Message keys close in the period of the rotors, so that some messages are in depth.
+            # Letters are drawn from the sample text, which is too short to give every message its own text.
+            compiled = CompiledEnigma.from_enigma(machine)
+            start = random.randrange(1000)
+            compiled.jump(start)
+            messages.append(compiled.encrypt("".join(random.choices(DEMO_PLAINTEXT, k=500))))
+            print(f"demo message {len(messages) - 1} starts {start} letters after the demo key", file=sys.stderr)
+    else:
+        with open(args.messages) as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    attack = Banburismus(messages, language_rate=args.language_rate, min_overlap=args.min_overlap, top_k=args.top_k)
+    progress = functools.partial(report_progress, unit="pairs")
+    for alignment in attack.run(n_workers=args.workers, stop_at=args.stop_at, progress=progress):
+        print(
+            f"{alignment.score:.1f} dB messages {alignment.first} and {alignment.second} offset {alignment.offset} "
+            f"({alignment.repeats} repeats in {alignment.overlap} letters)"
+        )
+
+
+def worker(args: argparse.Namespace):
+    run_worker(args.connect, args.authkey.encode())
+
+
+def ngrams(args: argparse.Namespace):
+    counter = NgramCounter(args.n)
+    counter.add_files(
+        args.corpus,
+        n_workers=args.workers,
+        block_size=args.block_size,
+        progress=functools.partial(report_progress, unit="bytes"),
+    )
+    counter.write_tables(args.output, metadata={"language": args.language, "corpus": args.corpus})
+    print(f"{counter.n_letters:,} letters counted, tables written to {args.output}", file=sys.stderr)
+
+
+def rejewski(args: argparse.Namespace):
+    rotor_mappings, reflector_mapping = load_wiring(args)
+    if os.path.exists(args.catalog):
+        catalog = CycleCatalog.load(args.catalog)
+        if not catalog.is_for(rotor_mappings, reflector_mapping, args.notches):
+            sys.exit(f"{args.catalog} was built for another machine: pass the same --rotors and --notches")
+    else:
+        catalog = CycleCatalog.build(rotor_mappings, reflector_mapping, args.notches, n_workers=args.workers)
+        catalog.save(args.catalog)
+        print(f"catalog of {len(catalog):,} settings written to {args.catalog}", file=sys.stderr)
+
+    if args.demo:
+        machine = demo_machine(args, clear_plug_board=False)
+        indicators = []
+        for _ in range(args.demo):
+            # Every operator enciphered their message key twice, from the same daily setting
+            positions = [rotor.offset for rotor in machine.rotors]
+            key = "".join(random.choice(string.ascii_lowercase) for _ in range(3))
+            indicators.append(machine.encrypt(2 * key))
+            for rotor, position in zip(machine.rotors, positions):
+                rotor.offset = position
+    elif args.indicators:
+        with open(args.indicators) as f:
+            indicators = f.read().split()
+    else:
+        return
+
+    settings = catalog.query(indicators)
+    print(f"{len(settings):,} settings have the cycle structures of the indicators", file=sys.stderr)
+    for setting in settings:
+        print(f"rotor order {list(setting.rotor_order)} starting positions {list(setting.starting_positions)}")
+
+
+def cribs(args: argparse.Namespace):
+    with open(args.messages) as f:
+        dragger = CribDragger(line.strip() for line in f)
+    crib_list = list(args.crib)
+    if args.cribs:
+        with open(args.cribs) as f:
+            crib_list.extend(f.read().split())
+
+    for placements in dragger.drag(crib_list):
+        print(f"crib {placements.crib}: {len(placements):,} placements", file=sys.stderr)
+        for message, offset in zip(placements.messages.tolist(), placements.offsets.tolist()):
+            print(message, offset, placements.crib)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Attacks against the Enigma machine.")
+    subparsers = parser.add_subparsers(dest="attack", required=True)
+
+    cto = subparsers.add_parser(
+        "ciphertext-only",
+        help="find rotor order and starting positions by index of coincidence",
+    )
+    cto.add_argument("ciphertext", nargs="?", help="the ciphertext, lowercase ASCII letters only")
+    cto.add_argument("--file", help="read the ciphertext from a file")
+    cto.add_argument("--demo", action="store_true", help="attack a sample text encrypted with a random machine")
+    cto.add_argument("--rotors", help='JSON file with the wiring: {"rotors": [[...], ...], "reflector": [...]}')
+    cto.add_argument("--notches", type=parse_ints, default=(0,) * N_ROTORS, help="turnover notches, e.g. 0,0,0")
+    cto.add_argument(
+        "--search-notches", action="store_true",
+        help="search the turnover notches too, one key per class of keys stepping the rotors the same way",
+    )
+    cto.add_argument("--top-k", type=int, default=10, help="how many candidates to report")
+    cto.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    cto.add_argument("--shard", type=parse_shard, default=(0, 1), help="process only shard i of n, as i/n")
+    cto.set_defaults(run=ciphertext_only)
+
+    bmb = subparsers.add_parser("bombe", help="find rotor settings and steckers from a crib, like the Bletchley Bombe")
+    bmb.add_argument("ciphertext", nargs="?", help="the ciphertext, lowercase ASCII letters only")
+    bmb.add_argument("--crib", help="the guessed plaintext")
+    bmb.add_argument("--offset", type=int, default=0, help="position of the crib in the ciphertext")
+    bmb.add_argument("--file", help="read the ciphertext from a file")
+    bmb.add_argument("--demo", type=int, metavar="LENGTH", help="use a sample text, with a crib of the given length")
+    bmb.add_argument("--rotors", help='JSON file with the wiring: {"rotors": [[...], ...], "reflector": [...]}')
+    bmb.add_argument("--notches", type=parse_ints, default=(0,) * N_ROTORS, help="turnover notches, e.g. 0,0,0")
+    bmb.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    bmb.set_defaults(run=bombe)
+
+    src = subparsers.add_parser(
+        "search",
+        help="like ciphertext-only, also searching the turnover notches, with resumable and distributed work",
+    )
+    src.add_argument("ciphertext", nargs="?", help="the ciphertext, lowercase ASCII letters only")
+    src.add_argument("--file", help="read the ciphertext from a file")
+    src.add_argument("--demo", action="store_true", help="attack a sample text encrypted with a random machine")
+    src.add_argument("--rotors", help='JSON file with the wiring: {"rotors": [[...], ...], "reflector": [...]}')
+    src.add_argument("--notches", type=parse_ints, default=(0,) * N_ROTORS, help="turnover notches of the --demo machine")
+    src.add_argument("--top-k", type=int, default=10, help="how many candidates to report")
+    src.add_argument("--checkpoint", help="file where progress is saved, and resumed from")
+    src.add_argument("--listen", type=parse_address, default=("127.0.0.1", 0), help="address for workers, as host:port")
+    src.add_argument("--authkey", help="key that workers must provide to connect (default: a random key, printed)")
+    src.add_argument("--workers", type=int, default=None, help="number of local worker processes (default: all CPUs)")
+    src.set_defaults(run=search)
+
+    dpt = subparsers.add_parser(
+        "depth",
+        help="find the rotor order of many messages of the same day, and the starting positions of each one",
+    )
+    dpt.add_argument("messages", nargs="?", help="file with the ciphertexts, one per line, lowercase ASCII letters only")
+    dpt.add_argument("--demo", type=int, metavar="N", help="attack N sample messages of a random machine")
+    dpt.add_argument("--rotors", help='JSON file with the wiring: {"rotors": [[...], ...], "reflector": [...]}')
+    dpt.add_argument("--notches", type=parse_ints, default=(0,) * N_ROTORS, help="turnover notches, e.g. 0,0,0")
+    dpt.add_argument("--top-k", type=int, default=10, help="how many rotor orders to report")
+    dpt.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    dpt.set_defaults(run=depth)
+
+    bnb = subparsers.add_parser(
+        "banburismus",
+        help="find which messages of a day are in depth, and at which offset, by counting repeats",
+    )
+    bnb.add_argument("messages", nargs="?", help="file with the ciphertexts, one per line, lowercase ASCII letters only")
+    bnb.add_argument("--demo", type=int, metavar="N", help="compare N sample messages of a random machine")
+    bnb.add_argument("--notches", type=parse_ints, default=(0,) * N_ROTORS, help="turnover notches of the --demo machine")
+    bnb.add_argument("--language-rate", type=float, default=LANGUAGE_REPEAT_RATE, help="repeat rate of the plaintext language")
+    bnb.add_argument("--min-overlap", type=int, default=20, help="ignore alignments overlapping on fewer letters")
+    bnb.add_argument("--stop-at", type=float, help="stop as soon as an alignment scores this many decibans")
+    bnb.add_argument("--top-k", type=int, default=10, help="how many alignments to report")
+    bnb.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    bnb.set_defaults(run=banburismus)
+
+    wrk = subparsers.add_parser("worker", help="work for a search running on another machine")
+    wrk.add_argument("--connect", type=parse_address, required=True, help="address of the search, as host:port")
+    wrk.add_argument("--authkey", required=True, help="key of the search, printed by the search")
+    wrk.set_defaults(run=worker)
+
+    ngr = subparsers.add_parser("ngrams", help="build n-gram tables for scoring from UTF-8 text corpora")
+    ngr.add_argument("corpus", nargs="+", help="the corpus files")
+    ngr.add_argument("--output", required=True, help="directory where the tables are written")
+    ngr.add_argument("--n", type=parse_ints, default=(1, 2, 3, 4), help="n-gram lengths, e.g. 2,3,4")
+    ngr.add_argument("--language", help="language of the corpus, recorded in the metadata")
+    ngr.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="bytes processed at once by a worker")
+    ngr.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    ngr.set_defaults(run=ngrams)
+
+    rjw = subparsers.add_parser(
+        "rejewski",
+        help="find rotor order and starting positions from doubled message keys, with a catalog of cycle structures",
+    )
+    rjw.add_argument("catalog", help="catalog file, built and written there if it does not exist")
+    rjw.add_argument("--indicators", help="file with the 6-letter indicators of the messages of a day")
+    rjw.add_argument("--demo", type=int, metavar="N", help="use the indicators of N messages of a random machine")
+    rjw.add_argument("--rotors", help='JSON file with the wiring: {"rotors": [[...], ...], "reflector": [...]}')
+    rjw.add_argument("--notches", type=parse_ints, default=(0,) * N_ROTORS, help="turnover notches, e.g. 0,0,0")
+    rjw.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    rjw.set_defaults(run=rejewski)
+
+    crb = subparsers.add_parser("cribs", help="find where cribs may be in many messages, since no letter encrypts to itself")
+    crb.add_argument("messages", help="file with the ciphertexts, one per line, lowercase ASCII letters only")
+    crb.add_argument("--crib", action="append", default=[], help="a guessed plaintext, may be repeated")
+    crb.add_argument("--cribs", help="file with guessed plaintexts, separated by whitespace")
+    crb.set_defaults(run=cribs)
+
+    args = parser.parse_args()
+    if args.attack in ("ciphertext-only", "search") and not (args.ciphertext or args.file or args.demo):
+        parser.error("provide a ciphertext, --file or --demo")
+    if args.attack == "banburismus" and not (args.messages or args.demo):
+        parser.error("provide a file of messages or --demo")
+    if args.attack == "depth" and not (args.messages or args.demo):
+        parser.error("provide a file of messages or --demo")
+    if args.attack == "cribs" and not (args.crib or args.cribs):
+        parser.error("provide a --crib or --cribs")
+    if args.attack == "bombe" and not args.demo and not ((args.ciphertext or args.file) and args.crib):
+        parser.error("provide a ciphertext or --file, and a --crib, or use --demo")
+    return args
+
 
 if __name__ == "__main__":
     # The attacker can import the class Enigma and use it
-    e = Enigma()
-    ptx = e.decrypt("somethingsecret")
-    print(ptx)
\ No newline at end of file
+    args = parse_args()
+    args.run(args)
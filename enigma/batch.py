@@ -0,0 +1,38 @@
+import argparse
+import sys
+
+from lib.keysheet import BatchDecryption, KeyStats, load_key_sheet, load_manifest
+from lib.streaming import INVALID_CHARACTER_MODES
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Decrypt a batch of messages with the keys of a key sheet.")
+    parser.add_argument("key_sheet", help="JSON object mapping each key to its configuration")
+    parser.add_argument("manifest", help="JSON lines file with the id, key, and text or path of each message")
+    parser.add_argument("--output", required=True, help="write the decrypted messages to this JSON lines file")
+    parser.add_argument("--workers", type=int, help="number of worker processes. Default is the number of CPUs")
+    parser.add_argument(
+        "--invalid",
+        choices=INVALID_CHARACTER_MODES,
+        default="error",
+        help="how to handle characters outside the alphabet",
+    )
+    parser.add_argument("--cache-dir", help="store compiled tables in this directory, to reuse them in later runs")
+    return parser.parse_args()
+
+
+def progress(stats: KeyStats):
+    print(f"{stats.key}: {stats.messages} messages in {stats.seconds:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        key_sheet = load_key_sheet(args.key_sheet)
+        messages = list(load_manifest(args.manifest))
+        job = BatchDecryption(key_sheet, args.invalid, args.cache_dir)
+        job.decrypt_to_file(messages, args.output, args.workers, progress=progress)
+    except (KeyError, ValueError, OSError) as e:
+        sys.exit(f"error: {e}")
+    print(job.report())
+    sys.exit(1 if any(stats.errors for stats in job.stats) else 0)
@@ -0,0 +1,225 @@
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+from lib.internals import Enigma
+from lib.batched import BatchedEnigma, to_indices
+from lib.bombe import Bombe, Menu
+from lib.cache import compile_configuration
+from lib.ciphertext_only import CiphertextOnlyAttack
+from lib.compiled import CompiledEnigma
+from lib.plugboard_solver import PlugBoardSolver, rotor_core_permutations
+from tests.data import test_configuration
+
+RESULTS_VERSION = 1
+
+
+def measure(func: Callable[[], object], min_time: float = 0.2, repeat: int = 3) -> float:
+    """Return the best time in seconds of a call to `func`, each measure running it for at least `min_time`."""
+    best = float("inf")
+    for _ in range(repeat):
+        n_calls, start = 0, time.perf_counter()
+        while True:
+            func()
+            n_calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / n_calls)
+    return best
+
+
+def result(value: float, unit: str, higher_is_better: bool) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def message(length: int) -> str:
+    rng = random.Random(length)
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def bench_encrypt(quick: bool) -> dict:
+    # The machines are built once: only encryption is timed, each call starting from the same settings
+    results = {}
+    machine = Enigma.from_configuration(test_configuration)
+    starting_offsets = [rotor.offset for rotor in machine.rotors]
+
+    def encrypt(msg: str) -> str:
+        for rotor, offset in zip(machine.rotors, starting_offsets):
+            rotor.offset = offset
+        return machine.encrypt(msg)
+
+    for length in [100, 1000] if quick else [100, 1000, 10000]:
+        msg = message(length)
+        seconds = measure(lambda: encrypt(msg))
+        results[f"enigma.encrypt[{length}]"] = result(length / seconds, "chars/s", True)
+
+    table = compile_configuration(test_configuration)
+    offsets = [r.starting_position for r in test_configuration.rotors_in_use]
+    notches = [r.turnover_notch for r in test_configuration.rotors_in_use]
+    compiled = CompiledEnigma(table, offsets, notches)
+
+    def encrypt_compiled(msg: str) -> str:
+        compiled.position = 0
+        return compiled.encrypt(msg)
+
+    for length in [100, 10000] if quick else [100, 10000, 1000000]:
+        msg = message(length)
+        seconds = measure(lambda: encrypt_compiled(msg))
+        results[f"compiled.encrypt[{length}]"] = result(length / seconds, "chars/s", True)
+    return results
+
+
+def bench_components(quick: bool) -> dict:
+    machine = Enigma.from_configuration(test_configuration)
+    rotor, reflector, plug_board = machine.rotors[0], machine.reflector, machine.plug_board
+    calls = {
+        "plug_board.map": lambda: [plug_board.map(c) for c in string.ascii_lowercase],
+        "rotor.map": lambda: [rotor.rotor.map(x) for x in range(26)],
+        "rotor.inverse_map": lambda: [rotor.rotor.inverse_map(x) for x in range(26)],
+        "configured_rotor.map": lambda: [rotor.map(x) for x in range(26)],
+        "configured_rotor.inverse_map": lambda: [rotor.inverse_map(x) for x in range(26)],
+        "reflector.map": lambda: [reflector.map(x) for x in range(26)],
+    }
+    return {
+        f"component.{name}": result(measure(call, min_time=0.05 if quick else 0.2) / 26 * 1e9, "ns/call", False)
+        for name, call in calls.items()
+    }
+
+
+def bench_attacks(quick: bool) -> dict:
+    machine = Enigma.from_configuration(test_configuration)
+    rotor_mappings = [rotor.permutation for rotor in test_configuration.available_rotors]
+    reflector_mapping = [machine.reflector.map(x) for x in range(26)]
+    notches = tuple(r.turnover_notch for r in test_configuration.rotors_in_use)
+    ptx = message(200)
+    ctx = machine.encrypt(ptx)
+
+    attack = CiphertextOnlyAttack(ctx, rotor_mappings, reflector_mapping, notches)
+    n_shards = 30 if quick else 6
+    start = time.perf_counter()
+    attack.run(n_workers=1, n_shards=n_shards)
+    keys = len(attack.units(0, n_shards)) * attack.keys_per_unit
+    results = {"attack.ciphertext_only": result(keys / (time.perf_counter() - start), "keys/s", True)}
+
+    bombe = Bombe(Menu(ptx[:25], ctx, 0), rotor_mappings, reflector_mapping, notches)
+    order = bombe.rotor_orders()[0]
+    start = time.perf_counter()
+    bombe.run_order(order)
+    results["attack.bombe"] = result(26 ** len(order) / (time.perf_counter() - start), "keys/s", True)
+
+    rotors = test_configuration.rotors_in_use
+    permutations = rotor_core_permutations(
+        BatchedEnigma(rotor_mappings, reflector_mapping),
+        tuple(r.type for r in rotors), tuple(r.starting_position for r in rotors), notches, len(ctx),
+    )
+    text = to_indices(message(10000))
+    counts = np.ones((26, 26))
+    np.add.at(counts, (text[:-1], text[1:]), 1)
+    for name, bigram_log_probs in [("ioc", None), ("bigrams", np.log(counts / counts.sum(axis=1, keepdims=True)))]:
+        solver = PlugBoardSolver(ctx, permutations, bigram_log_probs)
+        _, letters, inputs = solver.swaps()
+        seconds = measure(lambda: solver.evaluate_many(letters, inputs), min_time=0.05 if quick else 0.2)
+        results[f"attack.plug_board_swaps[{name}]"] = result(len(letters) / seconds / 1000, "swaps/ms", True)
+    return results
+
+
+def bench_memory(quick: bool) -> dict:
+    tracemalloc.start()
+    table = compile_configuration(test_configuration)
+    _, compile_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    core_table = BatchedEnigma([rotor.permutation for rotor in test_configuration.available_rotors]).core_table([0, 1, 2])
+    return {
+        "memory.compiled_table": result(sys.getsizeof(table), "bytes", False),
+        "memory.compile_peak": result(compile_peak, "bytes", False),
+        "memory.core_table": result(core_table.nbytes, "bytes", False),
+    }
+
+
+SUITES = {
+    "encrypt": bench_encrypt,
+    "components": bench_components,
+    "attacks": bench_attacks,
+    "memory": bench_memory,
+}
+
+
+def run(suites: list[str], quick: bool) -> dict:
+    results = {}
+    for name in suites:
+        print(f"running {name}...", file=sys.stderr)
+        results.update(SUITES[name](quick))
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """
+    Compare two runs and return the names of the benchmarks that regressed by more than `threshold`,
+    a fraction of the baseline value.
+    """
+    regressions = []
+    for name, base in sorted(baseline["results"].items()):
+        if name not in current["results"]:
+            continue
+        value = current["results"][name]["value"]
+        if base["higher_is_better"]:
+            regressed = value < base["value"] * (1 - threshold)
+        else:
+            regressed = value > base["value"] * (1 + threshold)
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the Enigma machine and the attacks against it.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", help="write the results to this JSON file")
+    run_parser.add_argument("--suite", action="append", choices=SUITES, help="run only this suite (repeatable)")
+    run_parser.add_argument("--quick", action="store_true", help="run shorter benchmarks")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline", help="results of the reference run")
+    compare_parser.add_argument("current", help="results of the run to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="tolerated slowdown, as a fraction")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "run":
+        results = run(args.suite or list(SUITES), args.quick)
+        for name, r in results["results"].items():
+            print(f"{name}: {r['value']:,.1f} {r['unit']}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for name in sorted(set(baseline["results"]) & set(current["results"])):
+            before, after = baseline["results"][name], current["results"][name]
+            flag = "REGRESSION" if name in regressions else ""
+            print(f"{name}: {before['value']:,.1f} -> {after['value']:,.1f} {after['unit']} {flag}".rstrip())
+        sys.exit(1 if regressions else 0)
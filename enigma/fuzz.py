@@ -0,0 +1,55 @@
+import argparse
+import itertools
+import os
+import sys
+
+from lib.fuzz import ENGINES, LONG_MESSAGE, DifferentialFuzzer, replay
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Check that every encryption engine agrees with the reference Enigma.")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--cases", type=int, help="number of cases to check. Default is no limit")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--workers", type=int, help="number of worker processes. Default is the number of CPUs")
+    parser.add_argument("--engine", action="append", choices=ENGINES, help="check only this engine (repeatable)")
+    parser.add_argument("--max-length", type=int, default=3 * LONG_MESSAGE, help="maximum number of letters of a case")
+    parser.add_argument("--no-shrink", action="store_true", help="report mismatches without shrinking them")
+    parser.add_argument("--output", default=".", help="directory where reproducers of mismatches are written")
+    parser.add_argument("--replay", nargs="+", metavar="REPRODUCER", help="run the cases of reproducers again, and exit")
+    return parser.parse_args()
+
+
+def progress(n_cases: int, n_mismatches: int, elapsed: float):
+    print(f"\r{n_cases} cases, {n_mismatches} mismatches, {elapsed:.0f}s", end="", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.replay:
+        failed = False
+        for path in args.replay:
+            with open(path) as f:
+                mismatch = replay(f.read())
+            failed = failed or mismatch is not None
+            print(f"{path}: {'still fails' if mismatch is not None else 'fixed'}")
+        sys.exit(1 if failed else 0)
+
+    if args.cases is None and args.duration is None:
+        print("running until interrupted: stop with Ctrl+C", file=sys.stderr)
+    seeds = itertools.count(args.seed) if args.cases is None else range(args.seed, args.seed + args.cases)
+    fuzzer = DifferentialFuzzer(args.engine, args.max_length, not args.no_shrink)
+    try:
+        fuzzer.run(seeds, args.workers, args.duration, progress)
+    except KeyboardInterrupt:
+        pass
+    print(file=sys.stderr)
+
+    for i, mismatch in enumerate(fuzzer.mismatches):
+        path = os.path.join(args.output, f"mismatch-{mismatch.engine}-{i}.json")
+        with open(path, "w") as f:
+            f.write(mismatch.reproducer())
+        print(f"{mismatch.engine}: {mismatch.case.n_letters} letters, first difference at {mismatch.index}: {path}")
+    print(f"{fuzzer.n_cases} cases, {fuzzer.n_letters:,} letters")
+    print(fuzzer.speed_report())
+    sys.exit(1 if fuzzer.mismatches else 0)
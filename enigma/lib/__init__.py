@@ -1 +1,2 @@
-from .internals import Enigma
\ No newline at end of file
+from .internals import Enigma
+from .compiled import CompiledEnigma
\ No newline at end of file
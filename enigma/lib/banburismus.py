@@ -0,0 +1,233 @@
+import heapq
+import math
+import multiprocessing
+import string
+import time
+from typing import Callable, Iterator, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .batched import to_indices
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+# The probability that two letters at the same position of two texts are the same:
+# about 0.066 for English text, see `ciphertext_only.index_of_coincidence`, and 1/26 for random text
+LANGUAGE_REPEAT_RATE = 0.066
+RANDOM_REPEAT_RATE = 1 / ALPHABET_LENGTH
+# Maximum number of message pairs compared at once, to bound memory
+PAIR_BLOCK = 256
+
+
+class Alignment(NamedTuple):
+	"""
+	A relative position of two messages, with the evidence that they are in depth there, in decibans.
+
+	The first letter of message `second` is aligned with letter `offset` of message `first`,
+	i.e., `second` was started `offset` letters after `first` on the same key. `offset` can be negative.
+	"""
+	score: float
+	first: int
+	second: int
+	offset: int
+	repeats: int
+	overlap: int
+
+	@property
+	def fast_rotor_offset(self) -> int:
+		"""How many positions the fast rotor of `second` was ahead of the one of `first` when both started."""
+		return self.offset % ALPHABET_LENGTH
+
+
+def decibans(repeats: np.ndarray, overlaps: np.ndarray, language_rate: float = LANGUAGE_REPEAT_RATE) -> np.ndarray:
+	"""
+	Weigh the evidence that two messages are in depth, given how many letters repeat where they overlap.
+
+	A deciban is a tenth of a factor 10 in the odds: positive scores favour depth, negative ones random overlap.
+	"""
+	repeat_weight = 10 * math.log10(language_rate / RANDOM_REPEAT_RATE)
+	miss_weight = 10 * math.log10((1 - language_rate) / (1 - RANDOM_REPEAT_RATE))
+	return repeats * repeat_weight + (overlaps - repeats) * miss_weight
+
+
+def letter_spectra(messages: list[np.ndarray], size: int) -> np.ndarray:
+	"""
+	Get the Fourier transform of the indicator of each letter in each message, zero-padded to `size`.
+
+	:return: array of shape (size // 2 + 1, n_messages, 26). Frequencies come first, so that the products
+	of `repeat_counts` are a matrix product per frequency.
+	"""
+	one_hot = np.zeros((len(messages), ALPHABET_LENGTH, size), dtype=np.float32)
+	for i, message in enumerate(messages):
+		one_hot[i, message, np.arange(len(message))] = 1
+	spectra = np.fft.rfft(one_hot, axis=-1).astype(np.complex64)
+	return np.ascontiguousarray(spectra.transpose(2, 0, 1))
+
+
+def repeat_counts(spectra: np.ndarray, first: int, seconds: slice, size: int) -> np.ndarray:
+	"""
+	Count the repeats between a message and other messages, at every relative offset at once.
+
+	Repeats at every offset are the sum over letters of the cross-correlations of the letter indicators,
+	which are products in the frequency domain.
+
+	:param np.ndarray spectra: the spectra of the messages, as computed by `letter_spectra`.
+	:param int first: the index of the first message.
+	:param slice seconds: the indices of the other messages.
+	:return: array of shape (n_seconds, size), whose entry `d` is the number of repeats at offset `d`,
+	or `d - size` for the second half.
+	"""
+	# The sum over letters of a * conj(b) is the conjugate of the sum of conj(a) * b, which saves conjugating b
+	products = np.conj(spectra[:, seconds] @ np.conj(spectra[:, first, :, None]))[..., 0].T
+	return np.rint(np.fft.irfft(products, n=size, axis=-1)).astype(np.int32)
+
+
+def _offsets_and_overlaps(size: int, first_length: int, second_lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+	offsets = np.arange(size)
+	offsets = np.where(offsets < size // 2, offsets, offsets - size)
+	overlaps = np.minimum(first_length, second_lengths[:, None] + offsets) - np.maximum(0, offsets)
+	return offsets, np.maximum(overlaps, 0)
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(messages: list[np.ndarray], language_rate: float, min_overlap: int, top_k: int):
+	size = 2 * max(len(message) for message in messages)
+	_worker_state.update(
+		spectra=letter_spectra(messages, size),
+		lengths=np.array([len(message) for message in messages]),
+		size=size,
+		language_rate=language_rate,
+		min_overlap=min_overlap,
+		top_k=top_k,
+	)
+
+
+def _compare_first(first: int) -> tuple[int, list[Alignment]]:
+	return compare_with_later(first, **_worker_state)
+
+
+def compare_with_later(
+	first: int,
+	spectra: np.ndarray,
+	lengths: np.ndarray,
+	size: int,
+	language_rate: float,
+	min_overlap: int,
+	top_k: int,
+) -> tuple[int, list[Alignment]]:
+	"""
+	Score message `first` against every later message, at every offset where they overlap by `min_overlap` letters.
+
+	:return: the number of pairs compared, and the best `top_k` alignments.
+	"""
+	best: list[Alignment] = []
+	n_messages = len(lengths)
+	for block_start in range(first + 1, n_messages, PAIR_BLOCK):
+		seconds = np.arange(block_start, min(block_start + PAIR_BLOCK, n_messages))
+		repeats = repeat_counts(spectra, first, slice(seconds[0], seconds[-1] + 1), size)
+		offsets, overlaps = _offsets_and_overlaps(size, lengths[first], lengths[seconds])
+		scores = np.where(overlaps >= min_overlap, decibans(repeats, overlaps, language_rate), -np.inf)
+
+		k = min(top_k, scores.size)
+		for flat in np.argpartition(-scores.ravel(), k - 1)[:k]:
+			row, column = divmod(int(flat), size)
+			if scores[row, column] == -np.inf:
+				continue
+			best.append(Alignment(
+				float(scores[row, column]),
+				first,
+				int(seconds[row]),
+				int(offsets[column]),
+				int(repeats[row, column]),
+				int(overlaps[row, column]),
+			))
+		best = heapq.nlargest(top_k, best)
+	return n_messages - first - 1, best
+
+
+class Banburismus:
+	"""
+	Find which messages of a day are in depth, and at which relative offset, like Turing's Banburismus.
+
+	Two messages enciphered with the same rotor order and turnover notches, from starting positions close in
+	the period of the rotors, go through the same rotor states where they overlap. There, two ciphertext letters
+	are the same exactly when the plaintext letters are, which happens at the rate of the language rather than
+	1 in 26. Every pair of messages is compared at every relative offset, and the evidence is weighed in decibans.
+	The offsets of the best alignments give the relative positions of the fast rotor.
+
+	Repeats are counted for all the offsets of a pair at once, as a correlation computed with Fourier transforms.
+	The pairs are spread across a process pool, one message against all the later ones per unit.
+	"""
+	def __init__(
+		self,
+		messages: Sequence[Union[str, np.ndarray]],
+		language_rate: float = LANGUAGE_REPEAT_RATE,
+		min_overlap: int = 20,
+		top_k: int = 10,
+	):
+		"""
+		:param messages: the ciphertexts.
+		:param float language_rate: the probability that two letters of the plaintext language are the same.
+		:param int min_overlap: alignments where the messages overlap on fewer letters are ignored.
+		:param int top_k: how many alignments to keep.
+		"""
+		if len(messages) < 2:
+			raise ValueError(f"got {len(messages)} messages, but at least 2 are needed to compare them")
+		self.messages = [to_indices(m) if isinstance(m, str) else np.asarray(m, dtype=np.uint8) for m in messages]
+		self.language_rate = language_rate
+		self.min_overlap = min_overlap
+		self.top_k = top_k
+
+	@property
+	def n_pairs(self) -> int:
+		return len(self.messages) * (len(self.messages) - 1) // 2
+
+	def scores(self, n_workers: Optional[int] = None) -> Iterator[tuple[int, list[Alignment]]]:
+		"""
+		Yield, for each message in the order they are done, the number of pairs it was compared in
+		and its best alignments with the later messages.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		"""
+		initargs = (self.messages, self.language_rate, self.min_overlap, self.top_k)
+		units = range(len(self.messages) - 1)
+		if n_workers == 1:
+			_init_worker(*initargs)
+			yield from map(_compare_first, units)
+			return
+		with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+			# Leaving the generator early, e.g., once the evidence is strong enough, terminates the pool
+			yield from pool.imap_unordered(_compare_first, units)
+
+	def run(
+		self,
+		n_workers: Optional[int] = None,
+		stop_at: Optional[float] = None,
+		progress: Optional[Callable[[int, int, float], None]] = None,
+	) -> list[Alignment]:
+		"""
+		Compare every pair of messages, and return the best alignments, best first.
+
+		:param Optional[int] n_workers: the number of worker processes. See `self.scores`.
+		:param Optional[float] stop_at: stop as soon as an alignment scores at least this many decibans.
+		Only the alignments found so far are returned then.
+		:param progress: called after every message with the number of pairs compared, the total number of pairs,
+		and the elapsed time in seconds.
+		"""
+		best: list[Alignment] = []
+		done = 0
+		start = time.perf_counter()
+		results = self.scores(n_workers)
+		try:
+			for n_pairs, alignments in results:
+				best = heapq.nlargest(self.top_k, best + alignments)
+				done += n_pairs
+				if progress is not None:
+					progress(done, self.n_pairs, time.perf_counter() - start)
+				if stop_at is not None and best and best[0].score >= stop_at:
+					break
+		finally:
+			results.close()
+		return sorted(best, key=lambda a: (-a.score, a.first, a.second, a.offset))
@@ -0,0 +1,147 @@
+import string
+from typing import Optional, Union
+
+import numpy as np
+
+from .internals import Enigma, Reflector
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+
+def to_indices(text: str) -> np.ndarray:
+	"""Convert a lowercase ASCII text to an array of positions between 0 and 25."""
+	data = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+	if data.size and (data.min() < ord("a") or data.max() > ord("z")):
+		raise ValueError("text should be lowercase ASCII characters only")
+	return data - ord("a")
+
+
+def to_strings(indices: np.ndarray) -> list[str]:
+	"""Convert a 2-D array of positions between 0 and 25 to one string per row."""
+	ascii_codes = np.ascontiguousarray(indices, dtype=np.uint8) + ord("a")
+	return [row.tobytes().decode("ascii") for row in ascii_codes]
+
+
+def inverse_permutations(permutations: np.ndarray) -> np.ndarray:
+	"""Invert each row of a 2-D array of permutations."""
+	inverses = np.empty_like(permutations)
+	np.put_along_axis(inverses, permutations, np.arange(permutations.shape[-1]), axis=-1)
+	return inverses
+
+
+def rotor_offsets(starting_positions: np.ndarray, turnover_notches: np.ndarray, length: int) -> np.ndarray:
+	"""
+	Get the offsets of the rotors when each letter of a message is encrypted.
+
+	The stepping is the same as `ConfiguredRotor.step`, applied before every letter as in `Enigma._rotor_forward_path`:
+	a rotor steps if the previous one stepped and reached its turnover notch.
+
+	:param np.ndarray starting_positions: array of shape (n_keys, n_rotors).
+	:param np.ndarray turnover_notches: array of shape (n_keys, n_rotors).
+	:param int length: the length of the message.
+	:return: array of shape (n_keys, length, n_rotors).
+	"""
+	starting_positions = np.asarray(starting_positions)
+	turnover_notches = np.asarray(turnover_notches)
+	n_keys, n_rotors = starting_positions.shape
+
+	offsets = np.empty((n_keys, length, n_rotors), dtype=np.int16)
+	steps = np.ones((n_keys, length), dtype=bool)
+	for i in range(n_rotors):
+		offsets[:, :, i] = (starting_positions[:, i, None] + np.cumsum(steps, axis=1)) % ALPHABET_LENGTH
+		steps = steps & (offsets[:, :, i] == turnover_notches[:, i, None])
+	return offsets
+
+
+class BatchedEnigma:
+	"""
+	Many Enigma machines sharing the same set of available rotors and the same reflector.
+
+	Each machine is described by a key, i.e., its rotor order, starting positions, turnover notches,
+	and plug board. All keys are evaluated at once with array operations.
+	"""
+	def __init__(self, rotor_mappings: Optional[np.ndarray] = None, reflector_mapping: Optional[np.ndarray] = None):
+		"""
+		:param Optional[np.ndarray] rotor_mappings: array of shape (n_available_rotors, 26) with the wiring
+		of each available rotor. Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: array of shape (26,) with the wiring of the reflector.
+		Default is `Reflector.mapping`.
+		"""
+		if rotor_mappings is None:
+			rotor_mappings = [rotor.mapping for rotor in Enigma.get_available_rotors()]
+		if reflector_mapping is None:
+			mapping = Reflector().mapping
+			reflector_mapping = [mapping[x] for x in range(ALPHABET_LENGTH)]
+
+		self.rotor_mappings = np.asarray(rotor_mappings, dtype=np.uint8)
+		self.inverse_rotor_mappings = inverse_permutations(self.rotor_mappings)
+		self.reflector_mapping = np.asarray(reflector_mapping, dtype=np.uint8)
+
+	def decrypt(
+		self,
+		ctx: Union[str, np.ndarray],
+		rotor_orders: np.ndarray,
+		starting_positions: np.ndarray,
+		turnover_notches: np.ndarray,
+		plug_boards: Optional[np.ndarray] = None,
+	) -> np.ndarray:
+		"""
+		Decrypt `ctx` under every key, each one starting from its initial state.
+
+		Decryption is identical to encryption, hence this is also the encryption of `ctx` under every key.
+
+		:param ctx: the message, as a string or as an array of positions.
+		:param np.ndarray rotor_orders: array of shape (n_keys, n_rotors) with indices into the available rotors,
+		in the order the signal traverses them.
+		:param np.ndarray starting_positions: array of shape (n_keys, n_rotors).
+		:param np.ndarray turnover_notches: array of shape (n_keys, n_rotors).
+		:param Optional[np.ndarray] plug_boards: array of shape (n_keys, 26) with the plug board permutation
+		of each key. If None, no letter is swapped.
+		:return: array of shape (n_keys, len(ctx)) with the output positions, one row per key.
+		"""
+		if isinstance(ctx, str):
+			ctx = to_indices(ctx)
+		ctx = np.asarray(ctx, dtype=np.int16)
+		rotor_orders = np.asarray(rotor_orders)
+		n_keys, n_rotors = rotor_orders.shape
+
+		offsets = rotor_offsets(starting_positions, turnover_notches, len(ctx))
+		x = np.broadcast_to(ctx, (n_keys, len(ctx)))
+		if plug_boards is not None:
+			plug_boards = np.asarray(plug_boards, dtype=np.int16)
+			x = np.take_along_axis(plug_boards, x, axis=1)
+
+		for i in range(n_rotors):
+			wirings = self.rotor_mappings[rotor_orders[:, i]]
+			x = np.take_along_axis(wirings, (x + offsets[:, :, i]) % ALPHABET_LENGTH, axis=1).astype(np.int16)
+		x = self.reflector_mapping[x].astype(np.int16)
+		for i in reversed(range(n_rotors)):
+			inverse_wirings = self.inverse_rotor_mappings[rotor_orders[:, i]]
+			x = (np.take_along_axis(inverse_wirings, x, axis=1) - offsets[:, :, i]) % ALPHABET_LENGTH
+
+		if plug_boards is not None:
+			x = np.take_along_axis(plug_boards, x, axis=1)
+		return x.astype(np.uint8)
+
+	def encrypt(self, msg: Union[str, np.ndarray], *args, **kwargs) -> np.ndarray:
+		"""Encryption is identical to decryption. See `self.decrypt` for more details."""
+		return self.decrypt(msg, *args, **kwargs)
+
+	def core_table(self, rotor_order: list[int]) -> np.ndarray:
+		"""
+		Get the permutation performed by the rotors and the reflector, without the plug board, in every rotor state.
+
+		:param list[int] rotor_order: indices into the available rotors, in the order the signal traverses them.
+		:return: array of shape (26 ** n_rotors, 26), laid out like `compiled.compile_table`.
+		"""
+		n_rotors = len(rotor_order)
+		states = np.arange(ALPHABET_LENGTH ** n_rotors)
+		offsets = [(states // ALPHABET_LENGTH ** i % ALPHABET_LENGTH)[:, None] for i in range(n_rotors)]
+
+		x = np.broadcast_to(np.arange(ALPHABET_LENGTH), (len(states), ALPHABET_LENGTH))
+		for i, rotor in enumerate(rotor_order):
+			x = self.rotor_mappings[rotor][(x + offsets[i]) % ALPHABET_LENGTH]
+		x = self.reflector_mapping[x]
+		for i, rotor in reversed(list(enumerate(rotor_order))):
+			x = (self.inverse_rotor_mappings[rotor][x].astype(np.int16) - offsets[i]) % ALPHABET_LENGTH
+		return x.astype(np.uint8)
@@ -0,0 +1,283 @@
+import collections
+import itertools
+import multiprocessing
+import string
+import time
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from .batched import BatchedEnigma, to_indices
+from .ciphertext_only import all_starting_positions, letter_states
+from .internals import N_ROTORS
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+
+class MenuEdge(NamedTuple):
+	"""A crib letter and the ciphertext letter it was encrypted to, at a given position of the message."""
+	plain: int
+	cipher: int
+	position: int
+
+
+class Stop(NamedTuple):
+	"""
+	Rotor settings at which the bombe stopped, i.e., that are consistent with the menu.
+
+	`steckers` maps the letters of the menu to their plug board partners, for those that could be determined.
+	"""
+	rotor_order: tuple[int, ...]
+	starting_positions: tuple[int, ...]
+	steckers: dict[int, int]
+
+
+class OrderResult(NamedTuple):
+	"""The stops found for a rotor order and how long it took to try all its starting positions."""
+	rotor_order: tuple[int, ...]
+	stops: list[Stop]
+	seconds: float
+
+
+class Menu:
+	"""
+	The menu of a crib: a graph whose nodes are letters, with an edge between each crib letter
+	and the ciphertext letter it was encrypted to, labelled by the position in the message.
+
+	Loops in the menu are what allow the bombe to reject wrong rotor settings.
+	"""
+	def __init__(self, crib: str, ctx: str, offset: int):
+		"""
+		:param str crib: the guessed plaintext.
+		:param str ctx: the ciphertext.
+		:param int offset: the position of the crib in the ciphertext.
+		"""
+		if offset < 0 or offset + len(crib) > len(ctx):
+			raise ValueError(f"crib of length {len(crib)} does not fit at offset {offset} of a ciphertext of length {len(ctx)}")
+
+		plain = to_indices(crib)
+		cipher = to_indices(ctx[offset:offset + len(crib)])
+		if any(plain == cipher):
+			raise ValueError(f"crib cannot be at offset {offset}: a letter cannot be encrypted into itself")
+
+		self.offset = offset
+		self.edges = [MenuEdge(int(p), int(c), offset + i) for i, (p, c) in enumerate(zip(plain, cipher))]
+		self.adjacency: dict[int, list[MenuEdge]] = collections.defaultdict(list)
+		for edge in self.edges:
+			self.adjacency[edge.plain].append(edge)
+			self.adjacency[edge.cipher].append(edge)
+
+	@property
+	def letters(self) -> set[int]:
+		return set(self.adjacency)
+
+	def component(self, letter: int) -> set[int]:
+		"""Get the letters connected to `letter` in the menu."""
+		seen = {letter}
+		queue = collections.deque([letter])
+		while queue:
+			a = queue.popleft()
+			for edge in self.adjacency[a]:
+				b = edge.cipher if edge.plain == a else edge.plain
+				if b not in seen:
+					seen.add(b)
+					queue.append(b)
+		return seen
+
+	def loops(self) -> list[list[MenuEdge]]:
+		"""
+		Get a basis of the loops of the menu.
+
+		A spanning tree of each connected component is built: every edge outside of it closes exactly one loop,
+		made of the edge and the path joining its letters in the tree.
+		"""
+		parent: dict[int, Optional[MenuEdge]] = {}
+		depth: dict[int, int] = {}
+		tree_edges = set()
+		for root in sorted(self.letters):
+			if root in parent:
+				continue
+			parent[root], depth[root] = None, 0
+			queue = collections.deque([root])
+			while queue:
+				a = queue.popleft()
+				for edge in self.adjacency[a]:
+					b = edge.cipher if edge.plain == a else edge.plain
+					if b not in parent:
+						parent[b], depth[b] = edge, depth[a] + 1
+						tree_edges.add(edge)
+						queue.append(b)
+
+		def up(letter: int) -> tuple[int, MenuEdge]:
+			edge = parent[letter]
+			return (edge.cipher if edge.plain == letter else edge.plain), edge
+
+		loops = []
+		for edge in self.edges:
+			if edge in tree_edges:
+				continue
+			a, b = edge.plain, edge.cipher
+			left, right = [], []
+			while a != b:
+				if depth[a] >= depth[b]:
+					a, e = up(a)
+					left.append(e)
+				else:
+					b, e = up(b)
+					right.append(e)
+			loops.append([edge] + left + right[::-1])
+		return loops
+
+	def test_letter(self) -> int:
+		"""Get the letter the bombe should be energized at: the most connected letter of the menu."""
+		return max(sorted(self.letters), key=lambda letter: (len(self.component(letter)), len(self.adjacency[letter])))
+
+
+def propagate(permutations: np.ndarray, menu: Menu, test_letter: int, hypothesis: int) -> np.ndarray:
+	"""
+	Propagate a plug board hypothesis through the menu, for many rotor settings at once.
+
+	This models the bombe with Welchman's diagonal board: `live[k, a, x]` means that, under rotor settings `k`,
+	the hypothesis implies that letter `a` might be steckered to `x`.
+	If `a` is steckered to `x` and the edge (a, b) at position i has core permutation E_i, then `b` is steckered
+	to E_i(x); plug board wiring is symmetric, so `x` is steckered to `a` too.
+
+	Rotor settings for which every value of the test letter becomes live are rejected as soon as this happens,
+	and are not propagated any further.
+
+	:param np.ndarray permutations: array of shape (n_settings, len(menu.edges), 26) with the core permutation
+	(without plug board) at the position of each edge of the menu.
+	:return: the array `live`, of shape (n_settings, 26, 26).
+	"""
+	n_settings = len(permutations)
+	live = np.zeros((n_settings, ALPHABET_LENGTH, ALPHABET_LENGTH), dtype=bool)
+	active = np.arange(n_settings)
+
+	# Lay out the settings being propagated as (letter, setting, value), so that each letter is contiguous,
+	# and gather along flattened indices, which is much faster than `np.take_along_axis`.
+	current = np.zeros((ALPHABET_LENGTH, n_settings, ALPHABET_LENGTH), dtype=bool)
+	current[test_letter, :, hypothesis] = True
+	permutations = np.ascontiguousarray(permutations.transpose(1, 0, 2), dtype=np.intp)
+	while len(active):
+		rows = np.arange(len(active))[:, None] * ALPHABET_LENGTH
+		flat_permutations = [(p + rows).ravel() for p in permutations]
+		before = np.count_nonzero(current, axis=(0, 2))
+
+		for p, edge in zip(flat_permutations, menu.edges):
+			current[edge.cipher] |= current[edge.plain].ravel().take(p).reshape(-1, ALPHABET_LENGTH)
+			current[edge.plain] |= current[edge.cipher].ravel().take(p).reshape(-1, ALPHABET_LENGTH)
+		current |= current.transpose(2, 1, 0)
+
+		changed = np.count_nonzero(current, axis=(0, 2)) != before
+		saturated = current[test_letter].all(axis=1)
+		keep = changed & ~saturated
+		live[active[~keep]] = current[:, ~keep].transpose(1, 0, 2)
+		active, current, permutations = active[keep], np.ascontiguousarray(current[:, keep]), permutations[:, keep]
+	return live
+
+
+def steckers_from(live: np.ndarray, letters: set[int], test_letter: int) -> dict[int, int]:
+	"""
+	Read the steckers implied at a stop.
+
+	If only one value of the test letter is live, the hypothesis was right and each letter's partner is its only
+	live value. If all values but one are live, the hypothesis was wrong and the right partners are the dead values.
+	"""
+	count = live[test_letter].sum()
+	if count == 1:
+		candidates = live
+	elif count == ALPHABET_LENGTH - 1:
+		candidates = ~live
+	else:
+		return {}
+	return {a: int(np.flatnonzero(candidates[a])[0]) for a in sorted(letters) if candidates[a].sum() == 1}
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(*args):
+	_worker_state["bombe"] = Bombe(*args)
+
+
+def _run_order(rotor_order: tuple[int, ...]) -> OrderResult:
+	return _worker_state["bombe"].run_order(rotor_order)
+
+
+class Bombe:
+	"""
+	A simulation of the Turing-Welchman Bombe.
+
+	Given a menu, for each rotor order and starting position, a plug board hypothesis for the test letter is
+	propagated through the menu. The rotor settings that do not lead to a contradiction are stops,
+	i.e., candidate keys to be checked by hand.
+	"""
+	def __init__(
+		self,
+		menu: Menu,
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		turnover_notches: Optional[tuple[int, ...]] = None,
+		n_rotors: int = N_ROTORS,
+	):
+		"""
+		:param Menu menu: the menu built from the crib.
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param Optional[tuple[int, ...]] turnover_notches: the turnover notch of each rotor in use. Default is all 0.
+		:param int n_rotors: the number of rotors in use.
+		"""
+		self.menu = menu
+		self.engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		self.turnover_notches = tuple(turnover_notches) if turnover_notches is not None else (0,) * n_rotors
+		self.n_rotors = n_rotors
+		self.test_letter = menu.test_letter()
+		self.component = menu.component(self.test_letter)
+
+		length = max(edge.position for edge in menu.edges) + 1
+		states = letter_states(n_rotors, self.turnover_notches, length)
+		self._states = states[:, [edge.position for edge in menu.edges]]
+
+	def rotor_orders(self) -> list[tuple[int, ...]]:
+		"""Get every ordered choice of `n_rotors` among the available rotors."""
+		return list(itertools.permutations(range(len(self.engine.rotor_mappings)), self.n_rotors))
+
+	def run_order(self, rotor_order: tuple[int, ...]) -> OrderResult:
+		"""Try every starting position of a rotor order."""
+		start = time.perf_counter()
+		table = self.engine.core_table(list(rotor_order))
+		live = propagate(table[self._states], self.menu, self.test_letter, self.test_letter)
+
+		positions = all_starting_positions(self.n_rotors)
+		stops = []
+		for k in np.flatnonzero(~live[:, self.test_letter].all(axis=1)):
+			stops.append(Stop(
+				tuple(rotor_order),
+				tuple(int(p) for p in positions[k]),
+				steckers_from(live[k], self.component, self.test_letter),
+			))
+		return OrderResult(tuple(rotor_order), stops, time.perf_counter() - start)
+
+	def run(self, rotor_orders: Optional[list[tuple[int, ...]]] = None, n_workers: Optional[int] = None) -> Iterator[OrderResult]:
+		"""
+		Try every starting position of each rotor order, and yield the results of each rotor order in order.
+
+		:param rotor_orders: the rotor orders to try. Default is all of them.
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		"""
+		if rotor_orders is None:
+			rotor_orders = self.rotor_orders()
+		if n_workers == 1:
+			yield from map(self.run_order, rotor_orders)
+			return
+
+		initargs = (self.menu, self.engine.rotor_mappings, self.engine.reflector_mapping, self.turnover_notches, self.n_rotors)
+		with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+			yield from pool.imap(_run_order, rotor_orders)
+
+	def stops(self, rotor_orders: Optional[list[tuple[int, ...]]] = None, n_workers: Optional[int] = None) -> Iterator[Stop]:
+		"""Yield the stops of every rotor order, as they are found."""
+		for result in self.run(rotor_orders, n_workers):
+			yield from result.stops
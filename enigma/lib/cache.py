@@ -0,0 +1,161 @@
+import collections
+import hashlib
+import json
+import os
+import string
+import tempfile
+import threading
+from typing import Optional
+
+from .compiled import CompiledEnigma, compile_table
+from .config import Configuration
+from .utils import pairings_to_permutation
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+
+def configuration_key(configuration: Configuration) -> str:
+	"""
+	Get a canonical hash of the parts of a configuration that determine its compiled table:
+	the wiring of the rotors in use, in order, the plug board and the reflector.
+
+	Starting positions and turnover notches only determine the order in which the rotor states are visited,
+	so configurations that only differ in those share the same key. Pairings are normalized, so that
+	the order in which pairs are listed does not matter.
+	"""
+	def normalize(pairings: list[int]) -> list[list[int]]:
+		return sorted(sorted(pair) for pair in zip(pairings[::2], pairings[1::2]))
+
+	canonical = {
+		"rotors": [configuration.available_rotors[r.type].permutation for r in configuration.rotors_in_use],
+		"plug_board": normalize(configuration.plug_board.pairings),
+		"reflector": normalize(configuration.reflector.pairings),
+	}
+	return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("ascii")).hexdigest()
+
+
+def compile_configuration(configuration: Configuration) -> bytes:
+	"""Compute the table of `compile_table` for a configuration."""
+	size = len(configuration.available_rotors[0].permutation)
+	return compile_table(
+		[configuration.available_rotors[r.type].permutation for r in configuration.rotors_in_use],
+		dict(enumerate(pairings_to_permutation(configuration.reflector.pairings, size))),
+		pairings_to_permutation(configuration.plug_board.pairings, size),
+	)
+
+
+class TableCache:
+	"""
+	A bounded LRU cache of compiled tables, keyed by `configuration_key`.
+
+	Machines built by the cache share the same table, but each one has its own state: many sessions using the
+	same key compile it only once. Optionally, tables are also stored in a directory, so that they survive
+	the process and can be shared between processes.
+	"""
+	def __init__(self, maxsize: int = 32, directory: Optional[str] = None):
+		"""
+		:param int maxsize: the maximum number of tables kept in memory.
+		:param Optional[str] directory: where to store tables on disk. If None, tables are only kept in memory.
+		"""
+		if maxsize < 1:
+			raise ValueError(f"cache size cannot be {maxsize}: it must be at least 1")
+		self.maxsize = maxsize
+		self.directory = directory
+		if directory is not None:
+			os.makedirs(directory, exist_ok=True)
+
+		self._tables: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.disk_hits = 0
+
+	@property
+	def stats(self) -> dict[str, int]:
+		"""Hits, misses (including disk hits), evictions and disk hits so far, and the current number of tables."""
+		with self._lock:
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"disk_hits": self.disk_hits,
+				"size": len(self._tables),
+			}
+
+	def table(self, configuration: Configuration) -> bytes:
+		"""Get the compiled table of a configuration, compiling it only if it is neither in memory nor on disk."""
+		key = configuration_key(configuration)
+		with self._lock:
+			if key in self._tables:
+				self.hits += 1
+				self._tables.move_to_end(key)
+				return self._tables[key]
+			self.misses += 1
+
+		table = self._load(key)
+		if table is not None:
+			with self._lock:
+				self.disk_hits += 1
+		else:
+			table = compile_configuration(configuration)
+			self._store(key, table)
+
+		with self._lock:
+			self._tables[key] = table
+			self._tables.move_to_end(key)
+			while len(self._tables) > self.maxsize:
+				self._tables.popitem(last=False)
+				self.evictions += 1
+		return table
+
+	def machine(self, configuration: Configuration) -> CompiledEnigma:
+		"""Build a compiled machine at the starting positions of `configuration`, sharing the cached table."""
+		return CompiledEnigma(
+			self.table(configuration),
+			[r.starting_position for r in configuration.rotors_in_use],
+			[r.turnover_notch for r in configuration.rotors_in_use],
+		)
+
+	def clear(self):
+		"""Drop all tables kept in memory. Tables on disk and statistics are kept."""
+		with self._lock:
+			self._tables.clear()
+
+	def _path(self, key: str) -> str:
+		return os.path.join(self.directory, f"{key}.table")
+
+	def _load(self, key: str) -> Optional[bytes]:
+		if self.directory is None:
+			return None
+		try:
+			with open(self._path(key), "rb") as f:
+				table = f.read()
+		except FileNotFoundError:
+			return None
+		# A table has 26 ** (n_rotors + 1) entries: anything else is a truncated file
+		size = ALPHABET_LENGTH
+		while size < len(table):
+			size *= ALPHABET_LENGTH
+		return table if size == len(table) else None
+
+	def _store(self, key: str, table: bytes):
+		if self.directory is None:
+			return
+		# Write to a temporary file first, so that other processes never read a partial table
+		fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+		try:
+			with os.fdopen(fd, "wb") as f:
+				f.write(table)
+			os.replace(tmp_path, self._path(key))
+		except BaseException:
+			os.unlink(tmp_path)
+			raise
+
+
+default_cache = TableCache()
+
+
+def machine_from_configuration(configuration: Configuration) -> CompiledEnigma:
+	"""Build a compiled machine for a configuration, sharing tables through `default_cache`."""
+	return default_cache.machine(configuration)
@@ -0,0 +1,232 @@
+import itertools
+import multiprocessing
+import string
+import time
+from typing import Callable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .batched import BatchedEnigma, rotor_offsets, to_indices
+from .internals import N_ROTORS
+from .shared_tables import SharedTableStore
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+
+class Candidate(NamedTuple):
+	"""
+	A candidate key found by an attack, with the score of the corresponding decryption.
+
+	`turnover_notches` is empty when the notches were given, rather than searched.
+	"""
+	score: float
+	rotor_order: tuple[int, ...]
+	starting_positions: tuple[int, ...]
+	turnover_notches: tuple[int, ...] = ()
+
+
+def index_of_coincidence(decryptions: np.ndarray) -> np.ndarray:
+	"""
+	Compute the index of coincidence of each row of a 2-D array of positions between 0 and 25.
+
+	The index of coincidence is the probability that two letters drawn at random from a text are the same.
+	It is about 0.066 for English text and about 0.038 for uniformly random text.
+	"""
+	n_rows, length = decryptions.shape
+	if length < 2:
+		return np.zeros(n_rows)
+	rows = np.arange(n_rows)[:, None] * ALPHABET_LENGTH
+	counts = np.bincount((rows + decryptions).ravel(), minlength=n_rows * ALPHABET_LENGTH)
+	counts = counts.reshape(n_rows, ALPHABET_LENGTH).astype(np.float64)
+	return (counts * (counts - 1)).sum(axis=1) / (length * (length - 1))
+
+
+def all_starting_positions(n_rotors: int) -> np.ndarray:
+	"""Get every combination of starting positions, in the order of the rotor states of `compile_table`."""
+	states = np.arange(ALPHABET_LENGTH ** n_rotors)
+	return np.stack([states // ALPHABET_LENGTH ** i % ALPHABET_LENGTH for i in range(n_rotors)], axis=1)
+
+
+def letter_states(n_rotors: int, turnover_notches: tuple[int, ...], length: int) -> np.ndarray:
+	"""
+	Get the rotor state in which each letter of a message is encrypted, for every combination of starting positions.
+
+	:return: array of shape (26 ** n_rotors, length), where row `i` corresponds to the starting positions
+	`all_starting_positions(n_rotors)[i]` and states are numbered as in `compile_table`.
+	"""
+	positions = all_starting_positions(n_rotors)
+	notches = np.broadcast_to(np.asarray(turnover_notches), positions.shape)
+	offsets = rotor_offsets(positions, notches, length).astype(np.int32)
+	states = np.zeros(offsets.shape[:2], dtype=np.int32)
+	for i in reversed(range(n_rotors)):
+		states = states * ALPHABET_LENGTH + offsets[:, :, i]
+	return states
+
+
+def decrypt_all_positions(engine: BatchedEnigma, ctx: np.ndarray, rotor_order: tuple[int, ...], states: np.ndarray) -> np.ndarray:
+	"""
+	Decrypt `ctx` without plug board under a rotor order, for every combination of starting positions.
+
+	The core table of the rotor order is computed once, then every decryption is a lookup into it.
+
+	:param np.ndarray states: the rotor states computed by `letter_states`, shared by all rotor orders.
+	"""
+	table = engine.core_table(list(rotor_order)).ravel()
+	return table[states * ALPHABET_LENGTH + ctx]
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(
+	rotor_mappings: np.ndarray,
+	reflector_mapping: np.ndarray,
+	ctx: np.ndarray,
+	turnover_notches,
+	top_k: int,
+	store_name: Optional[str] = None,
+):
+	if store_name is not None:
+		# The tables are already computed, in shared memory
+		_worker_state["engine"] = SharedTableStore.attach(store_name)
+	else:
+		_worker_state["engine"] = BatchedEnigma(rotor_mappings, reflector_mapping)
+	_worker_state["ctx"] = ctx
+	_worker_state["states"] = letter_states(len(turnover_notches), turnover_notches, len(ctx))
+	_worker_state["top_k"] = top_k
+
+
+def _search_rotor_order(rotor_order: tuple[int, ...]) -> list[Candidate]:
+	return search_rotor_order(
+		_worker_state["engine"],
+		_worker_state["ctx"],
+		rotor_order,
+		_worker_state["states"],
+		_worker_state["top_k"],
+	)
+
+
+def search_rotor_order(
+	engine: BatchedEnigma,
+	ctx: np.ndarray,
+	rotor_order: tuple[int, ...],
+	states: np.ndarray,
+	top_k: int,
+) -> list[Candidate]:
+	"""Score every starting position of a rotor order by index of coincidence, and return the best `top_k`."""
+	scores = index_of_coincidence(decrypt_all_positions(engine, ctx, rotor_order, states))
+	best = np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]
+	positions = all_starting_positions(len(rotor_order))
+	return [
+		Candidate(float(scores[i]), tuple(rotor_order), tuple(int(p) for p in positions[i]))
+		for i in best
+	]
+
+
+def merge_candidates(candidates: list[Candidate], top_k: int) -> list[Candidate]:
+	"""Keep the best `top_k` candidates. Ties are broken by key, so the result does not depend on the sharding."""
+	return sorted(candidates, key=lambda c: (-c.score, c.rotor_order, c.starting_positions, c.turnover_notches))[:top_k]
+
+
+class CiphertextOnlyAttack:
+	"""
+	Find the rotor order and starting positions of a message knowing only its ciphertext.
+
+	Every rotor order and every combination of starting positions is tried, ignoring the plug board,
+	and the decryptions are scored by index of coincidence: the right rotor settings give a decryption
+	that is closer to natural language than the wrong ones, even if the plug board is unknown.
+	The plug board can then be recovered separately.
+
+	The work is split in units, one per rotor order, which are spread across a process pool.
+	"""
+	def __init__(
+		self,
+		ctx: Union[str, np.ndarray],
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		turnover_notches: Optional[tuple[int, ...]] = None,
+		n_rotors: int = N_ROTORS,
+		top_k: int = 10,
+		store: Optional[SharedTableStore] = None,
+	):
+		"""
+		:param ctx: the ciphertext.
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param Optional[tuple[int, ...]] turnover_notches: the turnover notch of each rotor in use. Default is all 0.
+		:param int n_rotors: the number of rotors in use.
+		:param int top_k: how many candidates to keep.
+		:param Optional[SharedTableStore] store: the tables of the rotor orders, which workers then attach to
+		instead of computing them. The wiring of the store is used instead of `rotor_mappings` and `reflector_mapping`.
+		"""
+		self.ctx = to_indices(ctx) if isinstance(ctx, str) else np.asarray(ctx)
+		self.store = store
+		self.engine = store if store is not None else BatchedEnigma(rotor_mappings, reflector_mapping)
+		self.turnover_notches = tuple(turnover_notches) if turnover_notches is not None else (0,) * n_rotors
+		self.n_rotors = n_rotors
+		self.top_k = top_k
+
+	def units(self, shard: int = 0, n_shards: int = 1) -> list[tuple[int, ...]]:
+		"""
+		Get the rotor orders to try, i.e., every ordered choice of `n_rotors` among the available rotors.
+
+		The units are split round-robin in `n_shards` shards, and only those of shard `shard` are returned.
+		This is deterministic, so that independent runs can share the keyspace.
+		"""
+		if not 0 <= shard < n_shards:
+			raise ValueError(f"shard {shard} does not exist: shards are between 0 and {n_shards-1}")
+		orders = itertools.permutations(range(len(self.engine.rotor_mappings)), self.n_rotors)
+		return list(orders)[shard::n_shards]
+
+	@property
+	def keys_per_unit(self) -> int:
+		return ALPHABET_LENGTH ** self.n_rotors
+
+	def run(
+		self,
+		n_workers: Optional[int] = None,
+		shard: int = 0,
+		n_shards: int = 1,
+		progress: Optional[Callable[[int, int, float], None]] = None,
+	) -> list[Candidate]:
+		"""
+		Run the attack and return the best candidates, best first.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		:param int shard: which shard of the units to process. See `self.units`.
+		:param int n_shards: the number of shards.
+		:param progress: called after every unit with the number of keys tried, the total number of keys,
+		and the elapsed time in seconds.
+		"""
+		units = self.units(shard, n_shards)
+		total = len(units) * self.keys_per_unit
+		initargs = (
+			self.engine.rotor_mappings,
+			self.engine.reflector_mapping,
+			self.ctx,
+			self.turnover_notches,
+			self.top_k,
+			self.store.name if self.store is not None else None,
+		)
+
+		candidates: list[Candidate] = []
+		start = time.perf_counter()
+
+		def collect(results):
+			for done, unit_candidates in enumerate(results, start=1):
+				candidates.extend(unit_candidates)
+				candidates[:] = merge_candidates(candidates, self.top_k)
+				if progress is not None:
+					progress(done * self.keys_per_unit, total, time.perf_counter() - start)
+
+		if n_workers == 1:
+			_init_worker(*initargs[:-1])
+			_worker_state["engine"] = self.engine
+			collect(map(_search_rotor_order, units))
+		else:
+			with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+				collect(pool.imap(_search_rotor_order, units))
+
+		return candidates
@@ -0,0 +1,138 @@
+import asyncio
+import itertools
+import json
+import random
+import string
+import time
+
+from .config import Configuration
+from .server import MAX_LINE, LatencyTracker
+
+
+class EnigmaClient:
+	"""
+	An asyncio client of `EncryptionServer`.
+
+	Requests can be sent concurrently on the same connection: responses are matched to requests by id.
+	"""
+	def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		self._reader = reader
+		self._writer = writer
+		self._ids = itertools.count(1)
+		self._pending: dict[int, asyncio.Future] = {}
+		self._receiver = asyncio.create_task(self._receive())
+
+	@classmethod
+	async def connect(cls, host: str, port: int) -> "EnigmaClient":
+		reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+		return cls(reader, writer)
+
+	async def request(self, op: str, **fields) -> dict:
+		"""
+		Send a request and wait for its response.
+
+		:raises ValueError: if the server could not process the request.
+		"""
+		request_id = next(self._ids)
+		future = asyncio.get_running_loop().create_future()
+		self._pending[request_id] = future
+		self._writer.write(json.dumps({"id": request_id, "op": op, **fields}).encode("ascii") + b"\n")
+		await self._writer.drain()
+		response = await future
+		if "error" in response:
+			raise ValueError(response["error"])
+		return response
+
+	async def open(self, configuration: Configuration) -> int:
+		"""Open a session with the machine of `configuration`, and return its id."""
+		response = await self.request("open", configuration=configuration.model_dump())
+		return response["session"]
+
+	async def encrypt(self, session: int, text: str) -> str:
+		"""Encrypt a message in a session, continuing where the previous message of the session ended."""
+		return (await self.request("encrypt", session=session, text=text))["text"]
+
+	async def decrypt(self, session: int, text: str) -> str:
+		return (await self.request("decrypt", session=session, text=text))["text"]
+
+	async def close_session(self, session: int):
+		await self.request("close", session=session)
+
+	async def stats(self) -> dict:
+		return await self.request("stats")
+
+	async def close(self):
+		self._writer.close()
+		try:
+			await self._writer.wait_closed()
+		except ConnectionError:
+			pass
+		self._receiver.cancel()
+
+	async def _receive(self):
+		try:
+			while line := await self._reader.readline():
+				response = json.loads(line)
+				future = self._pending.pop(response.get("id"), None)
+				if future is not None and not future.done():
+					future.set_result(response)
+		finally:
+			for future in self._pending.values():
+				if not future.done():
+					future.set_exception(ConnectionError("connection to the server closed"))
+			self._pending.clear()
+
+
+async def load_test(
+	host: str,
+	port: int,
+	configuration: Configuration,
+	n_sessions: int = 10,
+	n_requests: int = 100,
+	message_length: int = 100,
+	concurrency: int = 4,
+	seed: int = 0,
+) -> dict:
+	"""
+	Open `n_sessions` sessions, each on its own connection, and send `n_requests` random messages to each one,
+	with at most `concurrency` requests in flight per session.
+
+	:return: the throughput in requests and letters per second, the latency percentiles seen by the clients
+	in milliseconds, and the statistics of the server.
+	"""
+	rng = random.Random(seed)
+	messages = ["".join(rng.choice(string.ascii_lowercase) for _ in range(message_length)) for _ in range(16)]
+	latency = LatencyTracker(window=n_sessions * n_requests)
+
+	async def run_session(client: EnigmaClient):
+		session = await client.open(configuration)
+		slots = asyncio.Semaphore(concurrency)
+
+		async def send(i: int):
+			async with slots:
+				start = time.perf_counter()
+				await client.encrypt(session, messages[i % len(messages)])
+				latency.record(time.perf_counter() - start)
+
+		await asyncio.gather(*(send(i) for i in range(n_requests)))
+		await client.close_session(session)
+
+	clients = [await EnigmaClient.connect(host, port) for _ in range(n_sessions)]
+	try:
+		start = time.perf_counter()
+		await asyncio.gather(*(run_session(client) for client in clients))
+		elapsed = time.perf_counter() - start
+		server_stats = await clients[0].stats()
+	finally:
+		for client in clients:
+			await client.close()
+
+	n_total = n_sessions * n_requests
+	return {
+		"requests": n_total,
+		"seconds": elapsed,
+		"requests_per_second": n_total / elapsed,
+		"letters_per_second": n_total * message_length / elapsed,
+		"latency_ms": latency.percentiles(),
+		"server": server_stats,
+	}
@@ -0,0 +1,200 @@
+import itertools
+import operator
+import string
+from typing import Iterable, Optional
+
+from .internals import Enigma
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+_ALPHABET_BYTES = string.ascii_lowercase.encode("ascii")
+_INDEX_TO_ASCII = bytes.maketrans(bytes(range(ALPHABET_LENGTH)), _ALPHABET_BYTES)
+_ASCII_OFFSET = _ALPHABET_BYTES[0]
+
+
+def compile_table(
+	rotor_mappings: list[list[int]],
+	reflector_mapping: dict[int, int],
+	plug_board_mapping: Optional[list[int]] = None,
+) -> bytes:
+	"""
+	Compute the substitution performed by the machine for every rotor state and every letter.
+
+	The result is a flat table of `ALPHABET_LENGTH ** len(rotor_mappings) * ALPHABET_LENGTH` bytes.
+	The output position for input position `x` when the rotors have offsets `o_0, o_1, ..., o_{n-1}`
+	is found at index `state * ALPHABET_LENGTH + x`, where `state = o_0 + o_1 * 26 + o_2 * 26**2 + ...`
+	and rotor 0 is the first rotor traversed by the signal (the fast one).
+
+	The table does not depend on the starting positions nor on the turnover notches of the rotors:
+	these only determine the order in which the states are visited.
+
+	:param list[list[int]] rotor_mappings: the wiring of each rotor in use, in the order they are traversed.
+	:param dict[int, int] reflector_mapping: the wiring of the reflector.
+	:param Optional[list[int]] plug_board_mapping: the plug board as a list of positions.
+	If None, the plug board is the identity.
+	"""
+	positions = range(ALPHABET_LENGTH)
+	if plug_board_mapping is None:
+		plug_board_mapping = list(positions)
+
+	# Going from the reflector back to the first rotor, compose the permutation of the core of the machine
+	# seen from the entry of each rotor, for every state of the rotors that follow it.
+	cores = [[reflector_mapping[x] for x in positions]]
+	for i, mapping in reversed(list(enumerate(rotor_mappings))):
+		inverse = [0] * ALPHABET_LENGTH
+		for x, y in enumerate(mapping):
+			inverse[y] = x
+
+		forward_paths = [[mapping[(x + offset) % ALPHABET_LENGTH] for x in positions] for offset in positions]
+		return_paths = [[(inverse[y] - offset) % ALPHABET_LENGTH for y in positions] for offset in positions]
+		if i == 0:
+			# Fold the plug board into the paths of the first rotor
+			forward_paths = [[path[plug_board_mapping[x]] for x in positions] for path in forward_paths]
+			return_paths = [[plug_board_mapping[path[y]] for y in positions] for path in return_paths]
+
+		cores = [
+			[return_path[core[y]] for y in forward_path]
+			for core in cores
+			for forward_path, return_path in zip(forward_paths, return_paths)
+		]
+
+	return bytes(itertools.chain.from_iterable(cores))
+
+
+def state_index(offsets: Iterable[int]) -> int:
+	"""Get the index of the rotor state with the given offsets, as laid out by `compile_table`."""
+	state = 0
+	for offset in reversed(list(offsets)):
+		state = state * ALPHABET_LENGTH + offset % ALPHABET_LENGTH
+	return state
+
+
+def state_offsets(state: int, n_rotors: int) -> list[int]:
+	"""Get the rotor offsets of the state with index `state`. Inverse of `state_index`."""
+	offsets = []
+	for _ in range(n_rotors):
+		state, offset = divmod(state, ALPHABET_LENGTH)
+		offsets.append(offset)
+	return offsets
+
+
+def orbit(offsets: list[int], turnovers: list[int]) -> list[int]:
+	"""
+	Get the sequence of rotor states visited by the machine, starting from `offsets`.
+
+	The stepping is the same as `ConfiguredRotor.step`. Since stepping is a bijection on the rotor states,
+	the sequence is periodic: the returned list contains one full period, starting with the initial state.
+	"""
+	offsets = [offset % ALPHABET_LENGTH for offset in offsets]
+	initial = state_index(offsets)
+	states = [initial]
+	while True:
+		for i, turnover in enumerate(turnovers):
+			offsets[i] = (offsets[i] + 1) % ALPHABET_LENGTH
+			if offsets[i] != turnover:
+				break
+		state = state_index(offsets)
+		if state == initial:
+			return states
+		states.append(state)
+
+
+class CompiledEnigma:
+	"""
+	An Enigma machine whose substitutions for the whole machine period are precomputed.
+
+	Encrypting a letter only requires looking up the table computed by `compile_table`,
+	at the current rotor state and the letter's position.
+	The machine is stateful exactly like `Enigma`: consecutive messages continue where the previous one ended.
+	"""
+	def __init__(self, table: bytes, offsets: list[int], turnovers: list[int]):
+		"""
+		:param bytes table: the table computed by `compile_table` for the rotors in use.
+		:param list[int] offsets: the current offset of each rotor in use.
+		:param list[int] turnovers: the turnover notch of each rotor in use.
+		"""
+		if len(table) != ALPHABET_LENGTH ** (len(offsets) + 1):
+			raise ValueError(f"table of length {len(table)} does not match {len(offsets)} rotors")
+		if len(turnovers) != len(offsets):
+			raise ValueError(f"got {len(turnovers)} turnover notches for {len(offsets)} rotors")
+
+		self.table = table
+		self.turnovers = list(turnovers)
+		self._states = orbit(offsets, self.turnovers)
+		# The i-th letter is encrypted after stepping, i.e., in the state following the i-th one.
+		# Bases are shifted so that they can be added to ASCII codes directly.
+		self._bases = [state * ALPHABET_LENGTH - _ASCII_OFFSET for state in self._states[1:] + self._states[:1]]
+		self.position = 0
+
+	@classmethod
+	def from_enigma(cls, machine: Enigma) -> "CompiledEnigma":
+		"""Compile a machine with the same wiring and current state as `machine`. `machine` is left untouched."""
+		alphabet = string.ascii_lowercase
+		table = compile_table(
+			[rotor.rotor.mapping for rotor in machine.rotors],
+			machine.reflector.mapping,
+			[alphabet.index(machine.plug_board.mapping[c]) for c in alphabet],
+		)
+		return cls(table, [rotor.offset for rotor in machine.rotors], [rotor.turnover for rotor in machine.rotors])
+
+	@property
+	def period(self) -> int:
+		"""The number of letters after which the machine goes back to its initial state."""
+		return len(self._states)
+
+	@property
+	def offsets(self) -> list[int]:
+		"""The current offset of each rotor in use."""
+		return state_offsets(self._states[self.position], len(self.turnovers))
+
+	def encrypt(self, msg: str) -> str:
+		"""
+		Encrypt a message and update the internal state of the machine.
+
+		The output is identical to `Enigma.encrypt` for a machine with the same wiring and state.
+		"""
+		try:
+			data = msg.encode("ascii")
+			invalid_characters = ", ".join(set(data.translate(None, _ALPHABET_BYTES).decode("ascii")))
+		except UnicodeEncodeError:
+			invalid_characters = ", ".join(set(msg) - set(string.ascii_lowercase))
+		if invalid_characters:
+			raise ValueError(f"plaintext should be lowercase ASCII characters only, invalid characters found: {invalid_characters}")
+
+		return self._encrypt_bytes(data).decode("ascii")
+
+	def decrypt(self, ctx: str) -> str:
+		"""
+		Decrypt a message and update the internal state of the machine.
+
+		Decryption is identical to encryption. See `self.encrypt` for more details.
+		"""
+		return self.encrypt(ctx)
+
+	def encrypt_into(self, data: bytes, out: memoryview) -> int:
+		"""
+		Encrypt lowercase ASCII bytes into the preallocated buffer `out` and update the internal state of the machine.
+
+		`data` is not validated: see `self.encrypt` for a checked version.
+		Return the number of bytes written, i.e., `len(data)`.
+		"""
+		out[:len(data)] = self._encrypt_bytes(data)
+		return len(data)
+
+	def jump(self, n_letters: int):
+		"""Bring the machine to the state it would be in after encrypting `n_letters` more letters, in constant time."""
+		if n_letters < 0:
+			raise ValueError(f"can't jump {n_letters} letters: the machine can only move forward")
+		self.position = (self.position + n_letters) % self.period
+
+	def _encrypt_bytes(self, data: bytes) -> bytes:
+		bases = self._bases_from(self.position, len(data))
+		ctx = bytes(map(self.table.__getitem__, map(operator.add, bases, data)))
+		self.position = (self.position + len(data)) % self.period
+		return ctx.translate(_INDEX_TO_ASCII)
+
+	def _bases_from(self, position: int, n: int) -> Iterable[int]:
+		head = self._bases[position:position + n]
+		if len(head) == n:
+			return head
+		return itertools.islice(itertools.chain(head, itertools.cycle(self._bases)), n)
@@ -1,3 +1,6 @@
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import numpy as np
 import pydantic
 
 from . import utils
@@ -47,11 +50,11 @@ class RotorInUseConfiguration(pydantic.BaseModel):
     starting_position: int = pydantic.Field(
         description="The rotor setting, i.e., from which starting position the rotor is inserted into the slot. "
         "Uses 0-indexing. Historically marked as 1 - 26.",
-        min=0,
+        ge=0,
     )
     turnover_notch: int = pydantic.Field(
         description="Position that - when reached - causes the next rotor in use to turn over. Uses 0-indexing.",
-        min=0,
+        ge=0,
     )
 
 
@@ -61,7 +64,7 @@ class Configuration(pydantic.BaseModel):
     plug_board: Pairings
     reflector: Pairings
 
-    @pydantic.model_validator
+    @pydantic.model_validator(mode="after")
     def unique_rotor_size(self) -> "Configuration":
         rotor_sizes = set([len(rotor.permutation) for rotor in self.available_rotors])
         if len(rotor_sizes) > 1:
@@ -70,7 +73,7 @@ class Configuration(pydantic.BaseModel):
             )
         return self
 
-    @pydantic.model_validator
+    @pydantic.model_validator(mode="after")
     def use_available_rotors(self) -> "Configuration":
         for rotor_in_use in self.rotors_in_use:
             if rotor_in_use.type < 0 or rotor_in_use.type >= len(self.available_rotors):
@@ -80,14 +83,14 @@ class Configuration(pydantic.BaseModel):
                 )
         return self
     
-    @pydantic.model_validator
+    @pydantic.model_validator(mode="after")
     def use_each_available_rotor_at_most_once(self) -> "Configuration":
         rotor_types = [rotor.type for rotor in self.rotors_in_use]
         if len(rotor_types) > len(set(rotor_types)):
             raise ValueError("can't use an available rotor more than once")
         return self
 
-    @pydantic.model_validator
+    @pydantic.model_validator(mode="after")
     def check_starting_position(self) -> "Configuration":
         for rotor in self.rotors_in_use:
             alphabet_length = len(self.available_rotors[rotor.type].permutation)
@@ -95,7 +98,7 @@ class Configuration(pydantic.BaseModel):
                 raise utils.InvalidPosition(rotor.starting_position, alphabet_length)
         return self
             
-    @pydantic.model_validator
+    @pydantic.model_validator(mode="after")
     def check_turnover_notch(self) -> "Configuration":
         for rotor in self.rotors_in_use:
             alphabet_length = len(self.available_rotors[rotor.type].permutation)
@@ -103,7 +106,7 @@ class Configuration(pydantic.BaseModel):
                 raise utils.InvalidPosition(rotor.turnover_notch, alphabet_length)
         return self
 
-    @pydantic.model_validator
+    @pydantic.model_validator(mode="after")
     def check_plug_board_compatible_with_rotors(self) -> "Configuration":
         rotor_size = len(self.available_rotors[0].permutation)
         if not all(c < rotor_size for c in self.plug_board.pairings):
@@ -115,4 +118,158 @@ class Configuration(pydantic.BaseModel):
     def reflector_maps_all_and_only_rotor_positions(self):
         if sorted(self.reflector.pairings) != sorted(self.available_rotors[0].permutation):
             raise ValueError("pairings of the reflector must correspond exactly to rotor positions")
-        return self
\ No newline at end of file
+        return self
+
+    @classmethod
+    def trusted(
+        cls,
+        available_rotors: list[list[int]],
+        rotors_in_use: list[tuple[int, int, int]],
+        plug_board: list[int],
+        reflector: list[int],
+    ) -> "Configuration":
+        """
+        Build a configuration without running any validator, for keys known to be valid:
+        checked by `validate_many`, or produced by an enumerator of valid keys.
+
+        :param list[tuple[int, int, int]] rotors_in_use: the type, starting position and turnover notch of each rotor.
+        """
+        return cls.model_construct(
+            available_rotors=[RotorConfiguration.model_construct(permutation=list(p)) for p in available_rotors],
+            rotors_in_use=[
+                RotorInUseConfiguration.model_construct(type=t, starting_position=p, turnover_notch=n)
+                for t, p, n in rotors_in_use
+            ],
+            plug_board=Pairings.model_construct(pairings=list(plug_board)),
+            reflector=Pairings.model_construct(pairings=list(reflector)),
+        )
+
+
+PAIRINGS_REASONS = ("odd_length", "repeated", "negative", "out_of_range")
+# Each reason sets one bit of the errors returned by `validate_many`
+INVALID_REASONS = (
+    "rotor_not_a_permutation",
+    "rotor_type_unavailable",
+    "rotor_used_twice",
+    "invalid_starting_position",
+    "invalid_turnover_notch",
+    *(f"plug_board_{reason}" for reason in PAIRINGS_REASONS),
+    *(f"reflector_{reason}" for reason in PAIRINGS_REASONS),
+    "reflector_incomplete",
+)
+PADDING = -1
+
+
+class ConfigurationArrays(NamedTuple):
+    """
+    Many configurations, one per row, as arrays:
+    - `available_rotors`: the permutations of the available rotors, of shape (n_available, size),
+      or (K, n_available, size) if rows have different wirings;
+    - `rotor_types`, `starting_positions`, `turnover_notches`: the rotors in use, of shape (K, n_rotors);
+    - `plug_boards`: the pairings of the plug boards, of shape (K, 2 * max_wires), padded with `PADDING`;
+    - `reflectors`: the pairings of the reflector, of shape (2 * max_pairs,) or (K, 2 * max_pairs),
+      padded with `PADDING`.
+    """
+    available_rotors: np.ndarray
+    rotor_types: np.ndarray
+    starting_positions: np.ndarray
+    turnover_notches: np.ndarray
+    plug_boards: np.ndarray
+    reflectors: np.ndarray
+
+    def configuration(self, i: int) -> Configuration:
+        """Build the configuration of a row, without validating it: see `validate_many`."""
+        return next(self.configurations([i]))
+
+    def configurations(self, rows: Optional[Iterable[int]] = None) -> Iterator[Configuration]:
+        """
+        Build the configurations of some rows, by default all of them, without validating them:
+        see `validate_many`. Each configuration has its own models and lists, even when rows share the wiring.
+        """
+        def pairings(pairings: list[int]) -> Pairings:
+            return Pairings.model_construct(pairings=list(pairings))
+
+        def without_padding(array: np.ndarray) -> list[int]:
+            return array[array != PADDING].tolist()
+
+        # The wiring shared by all rows is converted once, then copied for each row
+        shared_rotors = self.available_rotors.tolist() if self.available_rotors.ndim == 2 else None
+        shared_reflector = without_padding(self.reflectors) if self.reflectors.ndim == 1 else None
+
+        for i in range(len(self.rotor_types)) if rows is None else rows:
+            settings = zip(self.rotor_types[i].tolist(), self.starting_positions[i].tolist(), self.turnover_notches[i].tolist())
+            rotors = shared_rotors if shared_rotors is not None else self.available_rotors[i].tolist()
+            yield Configuration.model_construct(
+                available_rotors=[RotorConfiguration.model_construct(permutation=list(p)) for p in rotors],
+                rotors_in_use=[
+                    RotorInUseConfiguration.model_construct(type=t, starting_position=p, turnover_notch=n)
+                    for t, p, n in settings
+                ],
+                plug_board=pairings(without_padding(self.plug_boards[i])),
+                reflector=pairings(shared_reflector if shared_reflector is not None else without_padding(self.reflectors[i])),
+            )
+
+
+class Validation(NamedTuple):
+    """The result of `validate_many`: for each row, a bit set for each reason in `INVALID_REASONS` it fails."""
+    errors: np.ndarray
+
+    @property
+    def valid(self) -> np.ndarray:
+        return self.errors == 0
+
+    def reasons(self, i: int) -> list[str]:
+        return [reason for bit, reason in enumerate(INVALID_REASONS) if self.errors[i] >> bit & 1]
+
+    def invalid_rows(self) -> dict[int, list[str]]:
+        return {int(i): self.reasons(i) for i in np.flatnonzero(self.errors)}
+
+
+def _pairings_errors(pairings: np.ndarray, size: int) -> tuple[np.ndarray, ...]:
+    """Check pairings of shape (K, 2 * n_pairs) like the validators of `Pairings`, padding excluded."""
+    if pairings.shape[1] % 2 != 0:
+        raise ValueError(f"pairings have {pairings.shape[1]} columns: pairings must have an even number of columns")
+    padding = pairings == PADDING
+    # A pair is either two positions or two paddings
+    odd_length = (padding[:, 0::2] != padding[:, 1::2]).any(axis=1)
+    # Paddings sort first, and are the only equal entries allowed
+    ordered = np.sort(pairings, axis=1)
+    repeated = ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] != PADDING)).any(axis=1)
+    negative = ((pairings < 0) & ~padding).any(axis=1)
+    out_of_range = (pairings >= size).any(axis=1)
+    return odd_length, repeated, negative, out_of_range
+
+
+def validate_many(configurations: ConfigurationArrays) -> Validation:
+    """
+    Check many configurations at once, like the validators of `Configuration`
+    and `reflector_maps_all_and_only_rotor_positions`, without building them.
+
+    All the rotors of a row have the same size by construction.
+    """
+    rotors = np.asarray(configurations.available_rotors)
+    types, positions, notches = (np.asarray(array) for array in configurations[1:4])
+    n_rows, n_available, size = len(types), rotors.shape[-2], rotors.shape[-1]
+
+    not_a_permutation = (np.sort(rotors, axis=-1) != np.arange(size)).any(axis=-1).any(axis=-1)
+    unavailable = ((types < 0) | (types >= n_available)).any(axis=1)
+    ordered = np.sort(types, axis=1)
+    used_twice = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+    invalid_position = ((positions < 0) | (positions >= size)).any(axis=1)
+    invalid_notch = ((notches < 0) | (notches >= size)).any(axis=1)
+
+    plug_board_errors = _pairings_errors(np.asarray(configurations.plug_boards).reshape(n_rows, -1), size)
+    reflectors = np.asarray(configurations.reflectors)
+    reflectors = np.broadcast_to(reflectors, (n_rows, reflectors.shape[-1]))
+    reflector_errors = _pairings_errors(reflectors, size)
+    # Distinct positions, all in range: the reflector uses all of them if it has as many
+    incomplete = (reflectors != PADDING).sum(axis=1) != size
+
+    checks = [
+        np.broadcast_to(not_a_permutation, (n_rows,)), unavailable, used_twice, invalid_position, invalid_notch,
+        *plug_board_errors, *reflector_errors, incomplete,
+    ]
+    errors = np.zeros(n_rows, dtype=np.uint32)
+    for bit, failed in enumerate(checks):
+        errors |= failed.astype(np.uint32) << bit
+    return Validation(errors)
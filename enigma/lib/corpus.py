@@ -0,0 +1,194 @@
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import string
+import time
+import unicodedata
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+
+from .scoring import log_probs_from_counts, table_path, write_table
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+DEFAULT_BLOCK_SIZE = 1 << 24
+
+# Letters that should not just lose their diacritics, as they were spelled out in telegraphic German
+FOLDS = {"ä": "ae", "ö": "oe", "ü": "ue", "Ä": "ae", "Ö": "oe", "Ü": "ue", "ß": "ss"}
+_BYTE_FOLDS = [(letter.encode("utf-8"), spelled.encode("ascii")) for letter, spelled in FOLDS.items()]
+_NON_ASCII_RUNS = re.compile(rb"[\x80-\xff]+")
+
+_LETTERS = string.ascii_lowercase.encode("ascii")
+_NON_LETTERS = bytes(b for b in range(256) if b not in _LETTERS)
+
+
+def normalize(data: bytes) -> bytes:
+	"""
+	Reduce UTF-8 text to the lowercase ASCII letters accepted by the machine.
+
+	Umlauts and ß are spelled out (ä becomes ae), other accented letters lose their accents,
+	and everything else that is not a letter is dropped.
+	"""
+	if not data.isascii():
+		for letter, spelled in _BYTE_FOLDS:
+			data = data.replace(letter, spelled)
+		# Decomposing only the remaining non-ASCII characters is much faster than decomposing the whole text
+		data = _NON_ASCII_RUNS.sub(_strip_accents, data)
+	return data.lower().translate(None, _NON_LETTERS)
+
+
+def _strip_accents(match: re.Match) -> bytes:
+	text = unicodedata.normalize("NFKD", match.group().decode("utf-8", errors="ignore"))
+	return text.encode("ascii", errors="ignore")
+
+
+def count_ngrams(letters: bytes, n: int) -> np.ndarray:
+	"""
+	Count the n-grams of a normalized text.
+
+	:return: array of 26 ** n counts, indexed as `NgramTable.flat`.
+	"""
+	positions = np.frombuffer(letters, dtype=np.uint8) - ord("a")
+	n_grams = len(positions) - n + 1
+	if n_grams <= 0:
+		return np.zeros(ALPHABET_LENGTH ** n, dtype=np.int64)
+	indices = positions[:n_grams].astype(np.int64)
+	for i in range(1, n):
+		indices = indices * ALPHABET_LENGTH + positions[i:i + n_grams]
+	return np.bincount(indices, minlength=ALPHABET_LENGTH ** n)
+
+
+def blocks(size: int, data: bytes, block_size: int) -> list[tuple[int, int]]:
+	"""
+	Split a UTF-8 file of `size` bytes, whose first bytes are `data`, into blocks of about `block_size` bytes.
+
+	Blocks never split a multi-byte character.
+	"""
+	bounds = [0]
+	while bounds[-1] + block_size < size:
+		bound = bounds[-1] + block_size
+		# Continuation bytes look like 0b10xxxxxx
+		while bound < size and data[bound] & 0xC0 == 0x80:
+			bound += 1
+		bounds.append(bound)
+	if bounds[-1] < size:
+		bounds.append(size)
+	return list(zip(bounds, bounds[1:]))
+
+
+class BlockCounts:
+	"""The n-gram counts of a block, with the letters at its edges, which form n-grams with the neighbouring blocks."""
+	def __init__(self, letters: bytes, ns: tuple[int, ...], n_bytes: int):
+		self.counts = {n: count_ngrams(letters, n) for n in ns}
+		edge = max(ns) - 1
+		self.head = letters[:edge]
+		self.tail = letters[-edge:] if edge > 0 else b""
+		self.n_letters = len(letters)
+		self.n_bytes = n_bytes
+
+
+def _count_block(args: tuple[str, int, int, tuple[int, ...]]) -> BlockCounts:
+	path, start, stop, ns = args
+	with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+		return BlockCounts(normalize(mapped[start:stop]), ns, stop - start)
+
+
+class NgramCounter:
+	"""
+	Count the n-grams of large corpora, splitting files in blocks that are processed in parallel.
+
+	Files are memory-mapped, and each worker only reads and normalizes one block at a time,
+	so memory use depends on the block size and the number of workers, not on the size of the corpus.
+	The n-grams that span two blocks are counted when merging, from the letters at the edges of the blocks.
+	The counts are the same as counting the concatenation of the normalized files in one go.
+	"""
+	def __init__(self, ns: tuple[int, ...] = (1, 2, 3, 4)):
+		if not ns or min(ns) < 1:
+			raise ValueError(f"n-gram lengths cannot be {ns}: they must be at least 1")
+		self.ns = tuple(sorted(set(ns)))
+		self.counts = {n: np.zeros(ALPHABET_LENGTH ** n, dtype=np.int64) for n in self.ns}
+		self.n_letters = 0
+		self.n_bytes = 0
+		# The last letters counted, which form n-grams with the next block
+		self._carry = b""
+
+	def _merge(self, block: BlockCounts):
+		for n in self.ns:
+			self.counts[n] += block.counts[n]
+			# Count the n-grams starting in the carry and ending in this block
+			joined = self._carry + block.head
+			for start in range(max(0, len(self._carry) - n + 1), len(self._carry)):
+				if start + n <= len(joined):
+					index = 0
+					for letter in joined[start:start + n]:
+						index = index * ALPHABET_LENGTH + letter - ord("a")
+					self.counts[n][index] += 1
+
+		edge = max(self.ns) - 1
+		if edge > 0:
+			self._carry = (self._carry + block.tail)[-edge:] if block.n_letters < edge else block.tail
+		self.n_letters += block.n_letters
+		self.n_bytes += block.n_bytes
+
+	def add_text(self, text: str):
+		"""Count the n-grams of a text, as if it followed the text counted so far."""
+		data = text.encode("utf-8")
+		self._merge(BlockCounts(normalize(data), self.ns, len(data)))
+
+	def add_files(
+		self,
+		paths: Iterable[str],
+		n_workers: Optional[int] = None,
+		block_size: int = DEFAULT_BLOCK_SIZE,
+		progress: Optional[Callable[[int, int, float], None]] = None,
+	):
+		"""
+		Count the n-grams of UTF-8 text files, as if they were concatenated.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		:param int block_size: the number of bytes of a file processed at once by a worker.
+		:param progress: called after every block with the number of bytes processed, the total number of bytes,
+		and the elapsed time in seconds.
+		"""
+		paths = list(paths)
+		tasks = list(self._tasks(paths, block_size))
+		total = sum(os.path.getsize(path) for path in paths)
+		done, start = 0, time.perf_counter()
+
+		if n_workers is None:
+			n_workers = os.cpu_count() or 1
+		pool = multiprocessing.Pool(n_workers) if n_workers > 1 and len(tasks) > 1 else None
+		try:
+			# Blocks are merged in order, to stitch each one with the previous one
+			results = pool.imap(_count_block, tasks) if pool is not None else map(_count_block, tasks)
+			for block in results:
+				self._merge(block)
+				done += block.n_bytes
+				if progress is not None:
+					progress(done, total, time.perf_counter() - start)
+		finally:
+			if pool is not None:
+				pool.terminate()
+
+	def _tasks(self, paths: list[str], block_size: int) -> Iterator[tuple[str, int, int, tuple[int, ...]]]:
+		for path in paths:
+			size = os.path.getsize(path)
+			if size == 0:
+				continue
+			with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+				for start, stop in blocks(size, mapped, block_size):
+					yield path, start, stop, self.ns
+
+	def write_tables(self, directory: str, floor: float = 0.01, metadata: Optional[dict] = None):
+		"""
+		Write the log-probabilities of each n-gram length in `directory`, where `NgramTable.open` can read them,
+		along with a `metadata.json` describing the corpus.
+		"""
+		os.makedirs(directory, exist_ok=True)
+		for n, counts in self.counts.items():
+			write_table(table_path(directory, n), log_probs_from_counts(counts.reshape((ALPHABET_LENGTH,) * n), floor))
+		with open(os.path.join(directory, "metadata.json"), "w") as f:
+			json.dump({**(metadata or {}), "ns": list(self.ns), "letters": self.n_letters, "bytes": self.n_bytes}, f, indent=2)
@@ -0,0 +1,111 @@
+import string
+from typing import Iterable, Iterator, NamedTuple
+
+import numpy as np
+
+from .batched import to_indices
+from .bombe import Menu
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+
+class CribPlacements(NamedTuple):
+	"""
+	The positions where a crib may be, since no crib letter falls on the same ciphertext letter:
+	at `offsets[i]` in message `messages[i]`.
+	"""
+	crib: str
+	messages: np.ndarray
+	offsets: np.ndarray
+
+	def __len__(self) -> int:
+		return len(self.offsets)
+
+
+def to_bitset(mask: np.ndarray) -> int:
+	"""Get the integer whose bit i is set if and only if `mask[i]` is true."""
+	return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+def from_bitset(bitset: int, length: int) -> np.ndarray:
+	"""Get the indices of the set bits of an integer smaller than `2 ** length`, in increasing order."""
+	data = np.frombuffer(bitset.to_bytes((length + 7) // 8, "little"), dtype=np.uint8)
+	return np.flatnonzero(np.unpackbits(data, bitorder="little")[:length])
+
+
+class CribDragger:
+	"""
+	Find every position where cribs may be in a corpus of ciphertexts.
+
+	Since the reflector has no fixed points, no letter is ever encrypted into itself: a crib cannot be
+	at an offset where one of its letters matches the ciphertext letter under it.
+
+	The corpus is kept as one bitset per letter, i.e., a Python integer whose bit i is set if the i-th letter
+	of the concatenated messages is that letter. The offsets ruled out for a crib of length m are then
+	the union of the bitsets of its letters, each shifted by the position of the letter in the crib:
+	m shifts and ors of integers of a bit per letter of the corpus, which Python does a word at a time.
+	Messages are separated by a position set in every bitset, so that no crib spans two messages.
+	"""
+	def __init__(self, messages: Iterable[str]):
+		"""
+		:param Iterable[str] messages: the ciphertexts, lowercase ASCII letters only.
+		"""
+		indices = []
+		lengths = []
+		for message in messages:
+			indices.append(to_indices(message))
+			# The separator, which matches every letter
+			indices.append(np.array([ALPHABET_LENGTH], dtype=np.uint8))
+			lengths.append(len(message))
+		corpus = np.concatenate(indices) if indices else np.zeros(0, dtype=np.uint8)
+
+		self.lengths = np.array(lengths, dtype=np.int64)
+		# Position of the first letter of each message in the corpus
+		self.starts = np.concatenate(([0], np.cumsum(self.lengths + 1)[:-1])).astype(np.int64)
+		self.size = len(corpus)
+		separators = corpus == ALPHABET_LENGTH
+		self.bitsets = [to_bitset((corpus == letter) | separators) for letter in range(ALPHABET_LENGTH)]
+
+	def __len__(self) -> int:
+		"""Get the number of messages."""
+		return len(self.lengths)
+
+	def possible_offsets(self, crib: str) -> int:
+		"""Get the bitset of the positions of the corpus where `crib` may start."""
+		if not crib:
+			raise ValueError("crib is empty")
+		if len(crib) > self.size:
+			return 0
+		ruled_out = 0
+		for i, letter in enumerate(to_indices(crib)):
+			ruled_out |= self.bitsets[letter] >> i
+		# Offsets past the end of the corpus are ruled out too
+		return ~ruled_out & ((1 << (self.size - len(crib) + 1)) - 1)
+
+	def placements(self, crib: str) -> CribPlacements:
+		"""Get every position where `crib` may be, in the order of the messages and of the offsets."""
+		positions = from_bitset(self.possible_offsets(crib), self.size)
+		# Positions are sorted, and there are far fewer messages than positions
+		counts = np.diff(np.searchsorted(positions, self.starts), append=len(positions))
+		messages = np.repeat(np.arange(len(self)), counts)
+		return CribPlacements(crib, messages, positions - np.repeat(self.starts, counts))
+
+	def drag(self, cribs: Iterable[str]) -> Iterator[CribPlacements]:
+		"""
+		Yield the placements of each crib, as they are found, so that the attacks can start on the first ones.
+
+		The placements of a crib come as arrays: with millions of letters, a crib may fit at millions of offsets.
+		"""
+		for crib in cribs:
+			yield self.placements(crib)
+
+	def count(self, crib: str) -> int:
+		"""Get the number of positions where `crib` may be."""
+		return self.possible_offsets(crib).bit_count()
+
+
+def menus(messages: list[str], placements: Iterable[CribPlacements]) -> Iterator[Menu]:
+	"""Build the menu of each crib placement, to be run through a `Bombe`."""
+	for crib_placements in placements:
+		for message, offset in zip(crib_placements.messages.tolist(), crib_placements.offsets.tolist()):
+			yield Menu(crib_placements.crib, messages[message], offset)
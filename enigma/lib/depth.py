@@ -0,0 +1,206 @@
+import itertools
+import multiprocessing
+import string
+import time
+from typing import Callable, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .batched import BatchedEnigma, to_indices
+from .compiled import orbit, state_offsets
+from .internals import N_ROTORS
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+# Maximum number of letters decrypted at once, to bound memory
+BLOCK_LETTERS = 1 << 22
+
+
+class DepthCandidate(NamedTuple):
+	"""
+	A rotor order scored over a batch of messages, with the best starting positions of each message.
+
+	`score` is the index of coincidence of all the messages decrypted at their starting positions together,
+	and `message_scores` the index of coincidence of each message alone.
+	"""
+	score: float
+	rotor_order: tuple[int, ...]
+	starting_positions: tuple[tuple[int, ...], ...]
+	message_scores: tuple[float, ...]
+
+
+def orbit_windows(n_rotors: int, turnover_notches: tuple[int, ...], length: int) -> tuple[np.ndarray, np.ndarray]:
+	"""
+	Lay out the rotor states visited from every combination of starting positions, so that they can be shared.
+
+	Messages enciphered with the same rotor order and turnover notches only differ by where they start
+	in the period of the rotors. Each cycle of the stepping, usually a single one of 26 ** n_rotors states,
+	is written once, followed by its first `length` states again, so that any run of `length` letters
+	is a contiguous slice.
+
+	:return: the sequence of states, and for each combination of starting positions, ordered as
+	`all_starting_positions(n_rotors)`, the index in the sequence of the state in which the first letter is encrypted.
+	"""
+	n_states = ALPHABET_LENGTH ** n_rotors
+	starts = np.full(n_states, -1, dtype=np.int64)
+	cycles = []
+	size = 0
+	for state in range(n_states):
+		if starts[state] >= 0:
+			continue
+		cycle = np.array(orbit(state_offsets(state, n_rotors), list(turnover_notches)), dtype=np.int32)
+		# Letters are encrypted after stepping, i.e., in the state following the starting one
+		starts[cycle] = size + 1 + np.arange(len(cycle))
+		cycles.append(np.resize(cycle, len(cycle) + length + 1))
+		size += len(cycles[-1])
+	return np.concatenate(cycles), starts
+
+
+def letter_counts(table: np.ndarray, ctx: np.ndarray, sequence: np.ndarray, starts: np.ndarray) -> np.ndarray:
+	"""
+	Count the letters of the decryption of `ctx` under a rotor order, without plug board,
+	for every combination of starting positions.
+
+	:param np.ndarray table: the core table of the rotor order, as computed by `BatchedEnigma.core_table`.
+	:param np.ndarray sequence: the states computed by `orbit_windows` for at least `len(ctx)` letters.
+	:return: array of shape (26 ** n_rotors, 26).
+	"""
+	flat = table.ravel()
+	windows = np.lib.stride_tricks.sliding_window_view(sequence, len(ctx))
+	counts = np.empty((len(starts), ALPHABET_LENGTH), dtype=np.int64)
+	block = max(1, BLOCK_LETTERS // max(len(ctx), 1))
+	for first in range(0, len(starts), block):
+		rows = starts[first:first + block]
+		decryptions = flat[windows[rows] * ALPHABET_LENGTH + ctx]
+		offsets = np.arange(len(rows))[:, None] * ALPHABET_LENGTH
+		block_counts = np.bincount((offsets + decryptions).ravel(), minlength=len(rows) * ALPHABET_LENGTH)
+		counts[first:first + len(rows)] = block_counts.reshape(len(rows), ALPHABET_LENGTH)
+	return counts
+
+
+def coincidence(counts: np.ndarray) -> np.ndarray:
+	"""Compute the index of coincidence of texts with the given letter counts, one text per row."""
+	counts = counts.astype(np.float64)
+	lengths = counts.sum(axis=-1)
+	pairs = np.maximum(lengths * (lengths - 1), 1)
+	return (counts * (counts - 1)).sum(axis=-1) / pairs
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(rotor_mappings: np.ndarray, reflector_mapping: np.ndarray, messages: list[np.ndarray], turnover_notches):
+	_worker_state["engine"] = BatchedEnigma(rotor_mappings, reflector_mapping)
+	_worker_state["messages"] = messages
+	length = max(len(message) for message in messages)
+	_worker_state["orbit"] = orbit_windows(len(turnover_notches), turnover_notches, length)
+
+
+def _score_rotor_order(rotor_order: tuple[int, ...]) -> DepthCandidate:
+	return score_rotor_order(_worker_state["engine"], _worker_state["messages"], rotor_order, *_worker_state["orbit"])
+
+
+def score_rotor_order(
+	engine: BatchedEnigma,
+	messages: list[np.ndarray],
+	rotor_order: tuple[int, ...],
+	sequence: np.ndarray,
+	starts: np.ndarray,
+) -> DepthCandidate:
+	"""
+	Find the best starting positions of each message under a rotor order, and score them together.
+
+	The core table of the rotor order and the states are computed once for all the messages:
+	each message only costs a lookup of its letters.
+	"""
+	table = engine.core_table(list(rotor_order))
+	n_rotors = len(rotor_order)
+	best_counts = []
+	starting_positions = []
+	message_scores = []
+	for ctx in messages:
+		counts = letter_counts(table, ctx, sequence, starts)
+		scores = coincidence(counts)
+		best = int(np.argmax(scores))
+		best_counts.append(counts[best])
+		starting_positions.append(tuple(state_offsets(best, n_rotors)))
+		message_scores.append(float(scores[best]))
+	score = float(coincidence(np.sum(best_counts, axis=0)))
+	return DepthCandidate(score, tuple(rotor_order), tuple(starting_positions), tuple(message_scores))
+
+
+class DepthAttack:
+	"""
+	Find the rotor order of a batch of messages enciphered with the same daily key, and the starting positions
+	of each message, knowing only their ciphertexts.
+
+	Like `CiphertextOnlyAttack`, decryptions without plug board are scored by index of coincidence.
+	Since the messages share the rotor order and turnover notches, they only differ by their offset into
+	the period of the rotors: the core table of each rotor order and the states of the rotors are computed
+	once, and each message adds a lookup per letter and starting position. The rotor order is chosen by the
+	index of coincidence of the best decryptions of all the messages together, which separates the right
+	rotor order from the wrong ones more clearly than any single message does.
+	"""
+	def __init__(
+		self,
+		messages: Sequence[Union[str, np.ndarray]],
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		turnover_notches: Optional[tuple[int, ...]] = None,
+		n_rotors: int = N_ROTORS,
+		top_k: int = 10,
+	):
+		"""
+		:param messages: the ciphertexts.
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param Optional[tuple[int, ...]] turnover_notches: the turnover notch of each rotor in use. Default is all 0.
+		:param int n_rotors: the number of rotors in use.
+		:param int top_k: how many rotor orders to keep.
+		"""
+		if not messages:
+			raise ValueError("no messages to attack")
+		self.messages = [to_indices(m) if isinstance(m, str) else np.asarray(m, dtype=np.uint8) for m in messages]
+		self.engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		self.turnover_notches = tuple(turnover_notches) if turnover_notches is not None else (0,) * n_rotors
+		self.n_rotors = n_rotors
+		self.top_k = top_k
+
+	def rotor_orders(self) -> list[tuple[int, ...]]:
+		"""Get every ordered choice of `n_rotors` among the available rotors."""
+		return list(itertools.permutations(range(len(self.engine.rotor_mappings)), self.n_rotors))
+
+	def run(
+		self,
+		n_workers: Optional[int] = None,
+		progress: Optional[Callable[[int, int, float], None]] = None,
+	) -> list[DepthCandidate]:
+		"""
+		Run the attack and return the best rotor orders, best first.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		:param progress: called after every rotor order with the number of keys tried, the total number of keys,
+		and the elapsed time in seconds. There is a key per message and combination of starting positions.
+		"""
+		rotor_orders = self.rotor_orders()
+		keys_per_order = len(self.messages) * ALPHABET_LENGTH ** self.n_rotors
+		initargs = (self.engine.rotor_mappings, self.engine.reflector_mapping, self.messages, self.turnover_notches)
+
+		candidates: list[DepthCandidate] = []
+		start = time.perf_counter()
+
+		def collect(results):
+			for done, candidate in enumerate(results, start=1):
+				candidates.append(candidate)
+				if progress is not None:
+					progress(done * keys_per_order, len(rotor_orders) * keys_per_order, time.perf_counter() - start)
+
+		if n_workers == 1:
+			_init_worker(*initargs)
+			collect(map(_score_rotor_order, rotor_orders))
+		else:
+			with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+				collect(pool.imap(_score_rotor_order, rotor_orders))
+
+		return sorted(candidates, key=lambda c: (-c.score, c.rotor_order))[:self.top_k]
@@ -0,0 +1,322 @@
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import string
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Callable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .batched import BatchedEnigma, to_indices
+from .ciphertext_only import Candidate, letter_states, merge_candidates, search_rotor_order
+from .internals import N_ROTORS
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+CHECKPOINT_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class Unit(NamedTuple):
+	"""A unit of work: every starting position of a rotor order, with given turnover notches."""
+	rotor_order: tuple[int, ...]
+	turnover_notches: tuple[int, ...]
+
+
+class WorkerStats(NamedTuple):
+	units: int
+	keys: int
+	seconds: float
+
+	@property
+	def keys_per_second(self) -> float:
+		return self.keys / self.seconds if self.seconds > 0 else 0.0
+
+
+def all_turnover_notches(n_rotors: int) -> list[tuple[int, ...]]:
+	"""
+	Get every combination of turnover notches that makes a difference.
+
+	The notch of the last rotor is never reached by a next rotor, so it is always 0.
+	"""
+	return [notches + (0,) for notches in itertools.product(range(ALPHABET_LENGTH), repeat=n_rotors - 1)]
+
+
+def _search_unit(engine: BatchedEnigma, ctx: np.ndarray, unit: Unit, states: np.ndarray, top_k: int) -> list[Candidate]:
+	candidates = search_rotor_order(engine, ctx, unit.rotor_order, states, top_k)
+	return [candidate._replace(turnover_notches=unit.turnover_notches) for candidate in candidates]
+
+
+def run_worker(address: tuple[str, int], authkey: bytes, name: Optional[str] = None):
+	"""
+	Connect to a `KeySearchCoordinator` and process units until there are none left.
+
+	Workers can run on any machine that can reach the coordinator: the job, including the wiring, is sent by it.
+	"""
+	name = name or f"{socket.gethostname()}-{os.getpid()}"
+	with Client(address, authkey=authkey) as connection:
+		connection.send(("hello", name))
+		_, job = connection.recv()
+		engine = BatchedEnigma(job["rotor_mappings"], job["reflector_mapping"])
+		ctx = np.asarray(job["ctx"], dtype=np.uint8)
+		# Units with the same notches share the rotor states, and the coordinator tries to send them in a row
+		notches, states = None, None
+
+		connection.send(("ready", None))
+		while True:
+			message, unit = connection.recv()
+			if message == "done":
+				return
+			start = time.perf_counter()
+			if unit.turnover_notches != notches:
+				notches = unit.turnover_notches
+				states = letter_states(len(notches), notches, len(ctx))
+			candidates = _search_unit(engine, ctx, unit, states, job["top_k"])
+			connection.send(("result", (unit, candidates, time.perf_counter() - start)))
+
+
+class KeySearchCoordinator:
+	"""
+	Search rotor orders, starting positions and turnover notches by index of coincidence, like
+	`CiphertextOnlyAttack`, with workers that may run on other machines.
+
+	The coordinator hands out `Unit`s to the workers connected to its socket, and collects their best candidates.
+	Progress is checkpointed atomically to a file: if the search is interrupted, running it again with the same
+	checkpoint only processes the units that were not finished. Units in progress on a worker that disconnects
+	are handed to another worker.
+	"""
+	def __init__(
+		self,
+		ctx: Union[str, np.ndarray],
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		n_rotors: int = N_ROTORS,
+		turnover_notches: Optional[list[tuple[int, ...]]] = None,
+		top_k: int = 10,
+		checkpoint: Optional[str] = None,
+		checkpoint_interval: float = 5.0,
+	):
+		"""
+		:param ctx: the ciphertext.
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param Optional[list[tuple[int, ...]]] turnover_notches: the combinations of turnover notches to try.
+		Default is `all_turnover_notches(n_rotors)`.
+		:param Optional[str] checkpoint: the file where progress is saved, and resumed from if it exists.
+		:param float checkpoint_interval: the minimum number of seconds between two checkpoints.
+		"""
+		self.ctx = to_indices(ctx) if isinstance(ctx, str) else np.asarray(ctx, dtype=np.uint8)
+		self.engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		self.n_rotors = n_rotors
+		self.turnover_notches = [tuple(n) for n in turnover_notches] if turnover_notches is not None \
+			else all_turnover_notches(n_rotors)
+		self.top_k = top_k
+		self.checkpoint = checkpoint
+		self.checkpoint_interval = checkpoint_interval
+
+		orders = list(itertools.permutations(range(len(self.engine.rotor_mappings)), n_rotors))
+		self.units = [Unit(order, notches) for notches in self.turnover_notches for order in orders]
+		self.keys_per_unit = ALPHABET_LENGTH ** n_rotors
+
+		self.candidates: list[Candidate] = []
+		self.done: set[Unit] = set()
+		self.worker_stats: dict[str, WorkerStats] = {}
+		self._lock = threading.Condition()
+		self._pending: collections.OrderedDict[tuple[int, ...], collections.deque] = collections.OrderedDict()
+		self._last_checkpoint = 0.0
+		self._closing = threading.Event()
+		self.fingerprint = self._fingerprint()
+		self._resume()
+
+	def job(self) -> dict:
+		"""The description of the search sent to the workers."""
+		return {
+			"ctx": self.ctx.tolist(),
+			"rotor_mappings": self.engine.rotor_mappings.tolist(),
+			"reflector_mapping": self.engine.reflector_mapping.tolist(),
+			"top_k": self.top_k,
+		}
+
+	def _fingerprint(self) -> str:
+		"""A hash of the job and of its units, so that a checkpoint is never resumed by a different search."""
+		description = {**self.job(), "units": [list(map(list, unit)) for unit in self.units]}
+		return hashlib.sha256(json.dumps(description, sort_keys=True).encode("ascii")).hexdigest()
+
+	@property
+	def stats(self) -> dict[str, WorkerStats]:
+		"""The units, keys and busy seconds of each worker so far."""
+		with self._lock:
+			return dict(self.worker_stats)
+
+	def _resume(self):
+		if self.checkpoint is None or not os.path.exists(self.checkpoint):
+			return
+		with open(self.checkpoint) as f:
+			state = json.load(f)
+		if state.get("version") != CHECKPOINT_VERSION or state.get("fingerprint") != self.fingerprint:
+			raise ValueError(f"checkpoint {self.checkpoint} belongs to a different search")
+		self.done = {Unit(tuple(order), tuple(notches)) for order, notches in state["done"]}
+		self.candidates = [
+			Candidate(score, tuple(order), tuple(positions), tuple(notches))
+			for score, order, positions, notches in state["candidates"]
+		]
+		logger.info(f"resuming from {self.checkpoint}: {len(self.done)} of {len(self.units)} units done")
+
+	def _save(self):
+		"""Write the checkpoint. Must be called with the lock held."""
+		state = {
+			"version": CHECKPOINT_VERSION,
+			"fingerprint": self.fingerprint,
+			"done": [list(map(list, unit)) for unit in self.units if unit in self.done],
+			"candidates": [[c.score, c.rotor_order, c.starting_positions, c.turnover_notches] for c in self.candidates],
+		}
+		directory = os.path.dirname(os.path.abspath(self.checkpoint))
+		fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+		try:
+			with os.fdopen(fd, "w") as f:
+				json.dump(state, f)
+			os.replace(tmp_path, self.checkpoint)
+		except BaseException:
+			os.unlink(tmp_path)
+			raise
+		self._last_checkpoint = time.monotonic()
+
+	def _next_unit(self, notches: Optional[tuple[int, ...]]) -> Optional[Unit]:
+		"""Take a pending unit, preferably with the given notches. Must be called with the lock held."""
+		if notches not in self._pending:
+			if not self._pending:
+				return None
+			notches = next(iter(self._pending))
+		orders = self._pending[notches]
+		unit = Unit(orders.popleft(), notches)
+		if not orders:
+			del self._pending[notches]
+		return unit
+
+	def _requeue(self, unit: Unit):
+		self._pending.setdefault(unit.turnover_notches, collections.deque()).appendleft(unit.rotor_order)
+
+	def _serve(self, connection: Connection):
+		unit = None
+		try:
+			_, name = connection.recv()
+			connection.send(("job", self.job()))
+			while True:
+				message, payload = connection.recv()
+				with self._lock:
+					if message == "result":
+						self._collect(name, *payload)
+					unit = self._next_unit(unit.turnover_notches if unit is not None else None)
+					# Units in progress elsewhere may come back if their worker disconnects
+					while unit is None and len(self.done) < len(self.units):
+						self._lock.wait()
+						unit = self._next_unit(None)
+				if unit is None:
+					connection.send(("done", None))
+					return
+				connection.send(("unit", unit))
+		except (EOFError, OSError):
+			if unit is not None:
+				logger.warning(f"worker {name} disconnected, unit {unit} is handed to another worker")
+				with self._lock:
+					self._requeue(unit)
+					self._lock.notify_all()
+		finally:
+			connection.close()
+
+	def _collect(self, name: str, unit: Unit, candidates: list[Candidate], seconds: float):
+		"""Record the result of a unit. Must be called with the lock held."""
+		# A unit handed again after its worker disconnected may be finished twice
+		if unit not in self.done:
+			self.done.add(unit)
+			self.candidates = merge_candidates(self.candidates + candidates, self.top_k)
+		units, keys, busy = self.worker_stats.get(name, WorkerStats(0, 0, 0.0))
+		self.worker_stats[name] = WorkerStats(units + 1, keys + self.keys_per_unit, busy + seconds)
+		if self.checkpoint is not None and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+			self._save()
+		self._lock.notify_all()
+
+	def _accept(self, listener: Listener):
+		while True:
+			try:
+				connection = listener.accept()
+			except (OSError, EOFError):
+				# The listener was closed, or a client failed to authenticate
+				if self._closing.is_set():
+					return
+				continue
+			threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+	def run(
+		self,
+		n_local_workers: Optional[int] = None,
+		address: tuple[str, int] = ("127.0.0.1", 0),
+		authkey: Optional[bytes] = None,
+		progress: Optional[Callable[[int, int, float], None]] = None,
+		on_listen: Optional[Callable[[tuple[str, int]], None]] = None,
+	) -> list[Candidate]:
+		"""
+		Run the search until every unit is done, and return the best candidates, best first.
+
+		:param Optional[int] n_local_workers: the number of worker processes started on this machine.
+		Default is the number of CPUs. Use 0 to rely on remote workers only.
+		:param tuple[str, int] address: where to listen for workers. Port 0 picks a free port.
+		:param Optional[bytes] authkey: the key that workers must know to connect. Default is a random key.
+		:param progress: called after every unit with the number of keys tried, the total number of keys,
+		and the elapsed time in seconds.
+		:param on_listen: called with the address workers should connect to, once the coordinator listens.
+		"""
+		if n_local_workers is None:
+			n_local_workers = os.cpu_count() or 1
+		authkey = authkey if authkey is not None else os.urandom(16)
+		with self._lock:
+			self._pending.clear()
+			for unit in self.units:
+				if unit not in self.done:
+					self._pending.setdefault(unit.turnover_notches, collections.deque()).append(unit.rotor_order)
+		total = len(self.units) * self.keys_per_unit
+
+		start = time.perf_counter()
+		self._closing.clear()
+		listener = Listener(address, authkey=authkey)
+		workers = [
+			multiprocessing.Process(target=run_worker, args=(listener.address, authkey, f"local-{i}"), daemon=True)
+			for i in range(n_local_workers if len(self.done) < len(self.units) else 0)
+		]
+		# Start the local workers before any thread, as forking a process with threads is unsafe.
+		# Their connections wait in the backlog of the listener.
+		for worker in workers:
+			worker.start()
+		threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+		if on_listen is not None:
+			on_listen(listener.address)
+
+		try:
+			with self._lock:
+				while len(self.done) < len(self.units):
+					reported = len(self.done)
+					self._lock.wait()
+					if progress is not None and len(self.done) > reported:
+						progress(len(self.done) * self.keys_per_unit, total, time.perf_counter() - start)
+				if self.checkpoint is not None:
+					self._save()
+		finally:
+			self._closing.set()
+			# Closing the listener does not interrupt a pending accept: a connection does
+			try:
+				socket.create_connection(listener.address, timeout=1).close()
+			except OSError:
+				pass
+			listener.close()
+			for worker in workers:
+				worker.join()
+		return list(self.candidates)
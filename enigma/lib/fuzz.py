@@ -0,0 +1,464 @@
+import itertools
+import json
+import multiprocessing
+import random
+import string
+import time
+import traceback
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from .batched import BatchedEnigma, rotor_offsets, to_indices, to_strings
+from .cache import compile_configuration
+from .compiled import CompiledEnigma
+from .config import Configuration, Pairings, RotorConfiguration, RotorInUseConfiguration
+from .internals import Enigma
+from .streaming import StreamEncryptor
+from .utils import pairings_to_permutation
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+REFERENCE = "reference"
+# Messages of this many letters go through every state of the two fastest rotors
+LONG_MESSAGE = ALPHABET_LENGTH ** 2
+
+# Engines by name: functions building a machine from a configuration. A machine only needs a method
+# `encrypt(msg: str) -> str`, stateful like `Enigma.encrypt`.
+ENGINES: dict[str, Callable[[Configuration], object]] = {}
+
+
+def register_engine(name: str) -> Callable:
+	"""Register a function building a machine from a configuration, so that it is checked against `Enigma`."""
+	def register(factory: Callable[[Configuration], object]) -> Callable[[Configuration], object]:
+		ENGINES[name] = factory
+		return factory
+	return register
+
+
+@register_engine(REFERENCE)
+def _reference(configuration: Configuration) -> Enigma:
+	return Enigma.from_configuration(configuration)
+
+
+def _settings(configuration: Configuration) -> tuple[list[int], list[int]]:
+	rotors = configuration.rotors_in_use
+	return [r.starting_position for r in rotors], [r.turnover_notch for r in rotors]
+
+
+@register_engine("compiled")
+def _compiled(configuration: Configuration) -> CompiledEnigma:
+	return CompiledEnigma(compile_configuration(configuration), *_settings(configuration))
+
+
+class _StreamingEngine:
+	"""A `StreamEncryptor` with small chunks, so that messages are split across many of them."""
+	def __init__(self, configuration: Configuration, chunk_size: int = 61):
+		self.encryptor = StreamEncryptor(Enigma.from_configuration(configuration), chunk_size=chunk_size)
+
+	def encrypt(self, msg: str) -> str:
+		return "".join(self.encryptor.stream([msg]))
+
+
+register_engine("streaming")(_StreamingEngine)
+
+
+class _SeekEngine:
+	"""Encrypt each message on a fresh machine, brought to the position of the message by `jump`."""
+	def __init__(self, configuration: Configuration, compiled: bool):
+		self.configuration = configuration
+		self.table = compile_configuration(configuration) if compiled else None
+		self.n_letters = 0
+
+	def encrypt(self, msg: str) -> str:
+		if self.table is not None:
+			machine = CompiledEnigma(self.table, *_settings(self.configuration))
+		else:
+			machine = Enigma.from_configuration(self.configuration)
+		machine.jump(self.n_letters)
+		self.n_letters += len(msg)
+		return machine.encrypt(msg)
+
+
+register_engine("seek")(lambda configuration: _SeekEngine(configuration, compiled=False))
+register_engine("compiled-seek")(lambda configuration: _SeekEngine(configuration, compiled=True))
+
+
+class _BatchedEngine:
+	"""A `BatchedEnigma` with a single key, whose starting positions are moved forward after each message."""
+	def __init__(self, configuration: Configuration):
+		size = len(configuration.available_rotors[0].permutation)
+		self.engine = BatchedEnigma(
+			[rotor.permutation for rotor in configuration.available_rotors],
+			pairings_to_permutation(configuration.reflector.pairings, size),
+		)
+		self.rotor_order = np.array([[r.type for r in configuration.rotors_in_use]])
+		positions, notches = _settings(configuration)
+		self.positions = np.array([positions])
+		self.notches = np.array([notches])
+		self.plug_board = np.array([pairings_to_permutation(configuration.plug_board.pairings, size)])
+
+	def encrypt(self, msg: str) -> str:
+		if not msg:
+			return ""
+		ctx = self.engine.encrypt(to_indices(msg), self.rotor_order, self.positions, self.notches, self.plug_board)
+		# The offsets at the last letter are the starting positions of the next message
+		self.positions = rotor_offsets(self.positions, self.notches, len(msg))[:, -1].astype(np.int64)
+		return to_strings(ctx)[0]
+
+
+register_engine("batched")(_BatchedEngine)
+
+
+class Case(NamedTuple):
+	"""A machine, and messages encrypted one after the other with it, without resetting it."""
+	configuration: Configuration
+	messages: tuple[str, ...]
+
+	@property
+	def n_letters(self) -> int:
+		return sum(len(message) for message in self.messages)
+
+	def to_json(self) -> str:
+		return json.dumps({"configuration": self.configuration.model_dump(), "messages": list(self.messages)})
+
+	@classmethod
+	def from_json(cls, data: str) -> "Case":
+		case = json.loads(data)
+		return cls(Configuration.model_validate(case["configuration"]), tuple(case["messages"]))
+
+
+def random_case(seed: int, max_length: int = 3 * LONG_MESSAGE, max_rotors: int = 3) -> Case:
+	"""
+	Draw a machine and messages from a seed.
+
+	Machines have between 1 and `max_rotors` rotors in use out of up to 6, and up to 13 plug board wires.
+	A fifth of the cases have a long message, of at least `LONG_MESSAGE` letters, so that the slower rotors turn over.
+	The letters are split into up to 6 consecutive messages, possibly empty.
+	"""
+	rng = random.Random(seed)
+	n_rotors = rng.randint(1, max_rotors)
+	n_available = rng.randint(n_rotors, max(n_rotors, 6))
+
+	positions = list(range(ALPHABET_LENGTH))
+	available = [RotorConfiguration(permutation=rng.sample(positions, ALPHABET_LENGTH)) for _ in range(n_available)]
+	rotors_in_use = [
+		RotorInUseConfiguration(
+			type=rotor, starting_position=rng.randrange(ALPHABET_LENGTH), turnover_notch=rng.randrange(ALPHABET_LENGTH)
+		)
+		for rotor in rng.sample(range(n_available), n_rotors)
+	]
+	plug_board = rng.sample(positions, 2 * rng.randint(0, ALPHABET_LENGTH // 2))
+	configuration = Configuration(
+		available_rotors=available,
+		rotors_in_use=rotors_in_use,
+		plug_board=Pairings(pairings=plug_board),
+		reflector=Pairings(pairings=rng.sample(positions, ALPHABET_LENGTH)),
+	)
+
+	if rng.random() < 0.2 and max_length >= LONG_MESSAGE:
+		length = rng.randint(LONG_MESSAGE, max_length)
+	else:
+		length = rng.randint(0, min(200, max_length))
+	text = "".join(rng.choices(string.ascii_lowercase, k=length))
+	cuts = sorted(rng.randint(0, length) for _ in range(rng.randint(0, 5)))
+	messages = tuple(text[start:end] for start, end in zip([0] + cuts, cuts + [length]))
+	return Case(configuration, messages)
+
+
+class EngineStats(NamedTuple):
+	"""The time an engine took to build its machines, and to encrypt `letters` letters with them."""
+	letters: int
+	seconds: float
+	setup_seconds: float
+
+	@property
+	def letters_per_second(self) -> float:
+		return self.letters / self.seconds if self.seconds > 0 else 0.0
+
+	def __add__(self, other: "EngineStats") -> "EngineStats":
+		return EngineStats(*(a + b for a, b in zip(self, other)))
+
+
+class Mismatch(NamedTuple):
+	"""
+	A case where an engine disagrees with the reference.
+
+	`expected` and `got` are the concatenated outputs of the messages, and `index` the first letter that differs.
+	If the engine raised an exception, `got` is the traceback, and `index` is -1.
+	"""
+	engine: str
+	case: Case
+	expected: str
+	got: str
+	index: int
+
+	def reproducer(self) -> str:
+		"""Get a JSON document with everything needed to replay the mismatch, see `replay`."""
+		return json.dumps({
+			"engine": self.engine,
+			"case": json.loads(self.case.to_json()),
+			"expected": self.expected,
+			"got": self.got,
+			"index": self.index,
+		}, indent=1)
+
+
+def _run(engine: str, case: Case) -> tuple[str, EngineStats]:
+	start = time.perf_counter()
+	machine = ENGINES[engine](case.configuration)
+	setup = time.perf_counter() - start
+	start = time.perf_counter()
+	output = "".join(machine.encrypt(message) for message in case.messages)
+	return output, EngineStats(case.n_letters, time.perf_counter() - start, setup)
+
+
+def compare(engine: str, case: Case, expected: Optional[str] = None) -> tuple[Optional[Mismatch], Optional[EngineStats]]:
+	"""
+	Run a case on an engine, and compare its output with the one of the reference.
+
+	:param Optional[str] expected: the output of the reference, if already known.
+	:return: the mismatch, if any, and the time taken by the engine, unless it failed.
+	"""
+	if expected is None:
+		expected, _ = _run(REFERENCE, case)
+	try:
+		got, stats = _run(engine, case)
+	except Exception:
+		return Mismatch(engine, case, expected, traceback.format_exc(), -1), None
+	if got == expected:
+		return None, stats
+	index = next((i for i, (a, b) in enumerate(zip(expected, got)) if a != b), min(len(expected), len(got)))
+	return Mismatch(engine, case, expected, got, index), stats
+
+
+def _with_configuration(case: Case, **changes) -> Case:
+	return case._replace(configuration=case.configuration.model_copy(update=changes))
+
+
+def _set_rotor(case: Case, i: int, **changes) -> Case:
+	rotors = list(case.configuration.rotors_in_use)
+	rotors[i] = rotors[i].model_copy(update=changes)
+	return _with_configuration(case, rotors_in_use=rotors)
+
+
+def _truncate(case: Case, n_letters: int) -> Case:
+	messages, left = [], n_letters
+	for message in case.messages:
+		messages.append(message[:left])
+		left -= len(messages[-1])
+	return case._replace(messages=tuple(messages))
+
+
+def _drop_prefix(case: Case, n_letters: int) -> Case:
+	"""Drop the first letters, starting the rotors where the reference would be after encrypting them."""
+	machine = Enigma.from_configuration(case.configuration)
+	machine.jump(n_letters)
+	case = _truncate(case._replace(messages=tuple(reversed([m[::-1] for m in case.messages]))), case.n_letters - n_letters)
+	case = case._replace(messages=tuple(reversed([m[::-1] for m in case.messages])))
+	for i, rotor in enumerate(machine.rotors):
+		case = _set_rotor(case, i, starting_position=rotor.offset % ALPHABET_LENGTH)
+	return case
+
+
+def _simplifications(case: Case, index: int) -> Iterator[Case]:
+	"""Yield simpler variants of a case, most promising first."""
+	if index >= 0 and index + 1 < case.n_letters:
+		yield _truncate(case, index + 1)
+	if index < 0 and case.n_letters:
+		yield case._replace(messages=("",))
+	for n_letters in [index // 2, index - 1, 1]:
+		if 0 < n_letters <= index:
+			yield _drop_prefix(case, n_letters)
+	if len(case.messages) > 1 and any(not m for m in case.messages):
+		yield case._replace(messages=tuple(m for m in case.messages if m) or ("",))
+	for i in range(len(case.messages) - 1):
+		merged = case.messages[:i] + (case.messages[i] + case.messages[i + 1],) + case.messages[i + 2:]
+		yield case._replace(messages=merged)
+	if any(set(m) - {"a"} for m in case.messages):
+		yield case._replace(messages=tuple("a" * len(m) for m in case.messages))
+
+	configuration = case.configuration
+	pairings = configuration.plug_board.pairings
+	if pairings:
+		yield _with_configuration(case, plug_board=Pairings(pairings=[]))
+		for i in range(0, len(pairings), 2):
+			yield _with_configuration(case, plug_board=Pairings(pairings=pairings[:i] + pairings[i + 2:]))
+	for i, rotor in enumerate(configuration.rotors_in_use):
+		if rotor.starting_position:
+			yield _set_rotor(case, i, starting_position=0)
+		if rotor.turnover_notch:
+			yield _set_rotor(case, i, turnover_notch=0)
+	if len(configuration.rotors_in_use) > 1:
+		for i in reversed(range(len(configuration.rotors_in_use))):
+			yield _with_configuration(case, rotors_in_use=configuration.rotors_in_use[:i] + configuration.rotors_in_use[i + 1:])
+	# Keep only the available rotors in use
+	used = [rotor.type for rotor in configuration.rotors_in_use]
+	if len(used) < len(configuration.available_rotors):
+		yield _with_configuration(
+			case,
+			available_rotors=[configuration.available_rotors[t] for t in used],
+			rotors_in_use=[rotor.model_copy(update={"type": i}) for i, rotor in enumerate(configuration.rotors_in_use)],
+		)
+
+
+def shrink(mismatch: Mismatch, max_attempts: int = 1000) -> Mismatch:
+	"""
+	Simplify the case of a mismatch while the engine still disagrees with the reference: fewer and shorter messages,
+	fewer plug board wires and rotors, and settings at 0.
+	"""
+	attempts = 0
+	improved = True
+	while improved and attempts < max_attempts:
+		improved = False
+		for candidate in _simplifications(mismatch.case, mismatch.index):
+			attempts += 1
+			found, _ = compare(mismatch.engine, candidate)
+			if found is not None and (found.index >= 0) == (mismatch.index >= 0):
+				mismatch = found
+				improved = True
+				break
+			if attempts >= max_attempts:
+				break
+	return mismatch
+
+
+def replay(reproducer: str) -> Optional[Mismatch]:
+	"""Run the case of a reproducer again, and return the mismatch if the engine still disagrees with the reference."""
+	data = json.loads(reproducer)
+	mismatch, _ = compare(data["engine"], Case.from_json(json.dumps(data["case"])))
+	return mismatch
+
+
+class SeedReport(NamedTuple):
+	seed: int
+	n_letters: int
+	mismatches: list[Mismatch]
+	stats: dict[str, EngineStats]
+
+
+def check_seed(seed: int, engines: Iterable[str], max_length: int = 3 * LONG_MESSAGE, shrink_mismatches: bool = True) -> SeedReport:
+	"""Run the case of a seed on every engine, and compare them with the reference."""
+	case = random_case(seed, max_length)
+	expected, reference_stats = _run(REFERENCE, case)
+	mismatches, stats = [], {REFERENCE: reference_stats}
+	for engine in engines:
+		if engine == REFERENCE:
+			continue
+		mismatch, engine_stats = compare(engine, case, expected)
+		if engine_stats is not None:
+			stats[engine] = engine_stats
+		if mismatch is not None:
+			mismatches.append(shrink(mismatch) if shrink_mismatches else mismatch)
+	return SeedReport(seed, case.n_letters, mismatches, stats)
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(engines: list[str], max_length: int, shrink_mismatches: bool):
+	_worker_state.update(engines=engines, max_length=max_length, shrink_mismatches=shrink_mismatches)
+
+
+def _check_seed(seed: int) -> SeedReport:
+	return check_seed(seed, **_worker_state)
+
+
+class DifferentialFuzzer:
+	"""
+	Check that the engines encrypt exactly like the reference `Enigma`, on random machines and messages.
+
+	Each seed gives a case: a configuration, and messages encrypted one after the other without resetting the machine,
+	so that the state carried across calls is checked too. Some messages are long enough for the slower rotors to turn
+	over many times. Every engine runs each case, and any mismatch is shrunk to a small reproducer.
+	The time taken by each engine is recorded, to compare their speed.
+
+	Seeds are spread across a process pool, so that the fuzzer can run as a long soak job.
+	Engines must be registered with `register_engine` at import time, to exist in the workers too.
+	"""
+	def __init__(self, engines: Optional[list[str]] = None, max_length: int = 3 * LONG_MESSAGE, shrink_mismatches: bool = True):
+		"""
+		:param Optional[list[str]] engines: the names of the engines to check. Default is all the registered ones.
+		:param int max_length: the maximum number of letters of a case.
+		:param bool shrink_mismatches: whether to shrink the cases of the mismatches.
+		"""
+		engines = list(ENGINES) if engines is None else list(engines)
+		unknown = set(engines) - set(ENGINES)
+		if unknown:
+			raise ValueError(f"engines {', '.join(sorted(unknown))} do not exist: engines are {', '.join(ENGINES)}")
+		self.engines = engines
+		self.max_length = max_length
+		self.shrink_mismatches = shrink_mismatches
+		self.stats: dict[str, EngineStats] = {}
+		self.mismatches: list[Mismatch] = []
+		self.n_cases = 0
+		self.n_letters = 0
+
+	def reports(self, seeds: Iterable[int], n_workers: Optional[int] = None) -> Iterator[SeedReport]:
+		"""
+		Yield the report of each seed, in the order they are done. `seeds` may be endless, e.g. `itertools.count()`.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		"""
+		initargs = (self.engines, self.max_length, self.shrink_mismatches)
+		if n_workers == 1:
+			_init_worker(*initargs)
+			results = map(_check_seed, seeds)
+		else:
+			pool = multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs)
+			# The pool takes all its tasks at once: give it a bounded number of seeds at a time
+			block = 4 * (n_workers or multiprocessing.cpu_count())
+			blocks = iter(lambda seeds=iter(seeds): list(itertools.islice(seeds, block)), [])
+			results = itertools.chain.from_iterable(pool.imap_unordered(_check_seed, seeds) for seeds in blocks)
+		try:
+			for report in results:
+				self.n_cases += 1
+				self.n_letters += report.n_letters
+				self.mismatches.extend(report.mismatches)
+				for engine, stats in report.stats.items():
+					self.stats[engine] = self.stats.get(engine, EngineStats(0, 0.0, 0.0)) + stats
+				yield report
+		finally:
+			if n_workers != 1:
+				pool.terminate()
+
+	def run(
+		self,
+		seeds: Iterable[int],
+		n_workers: Optional[int] = None,
+		duration: Optional[float] = None,
+		progress: Optional[Callable[[int, int, float], None]] = None,
+	) -> list[Mismatch]:
+		"""
+		Check the cases of the seeds, and return the mismatches found.
+		If interrupted, the mismatches found so far are in `self.mismatches`.
+
+		:param Optional[float] duration: stop after this many seconds, even if there are seeds left.
+		:param progress: called after every case with the number of cases and of mismatches so far,
+		and the elapsed time in seconds.
+		"""
+		n_mismatches = len(self.mismatches)
+		start = time.perf_counter()
+		reports = self.reports(seeds, n_workers)
+		try:
+			for _ in reports:
+				elapsed = time.perf_counter() - start
+				if progress is not None:
+					progress(self.n_cases, len(self.mismatches) - n_mismatches, elapsed)
+				if duration is not None and elapsed >= duration:
+					break
+		finally:
+			reports.close()
+		return self.mismatches[n_mismatches:]
+
+	def speed_report(self) -> str:
+		"""Summarize the speed of each engine, relative to the reference."""
+		reference = self.stats.get(REFERENCE)
+		lines = []
+		for engine, stats in sorted(self.stats.items(), key=lambda item: -item[1].letters_per_second):
+			relative = stats.letters_per_second / reference.letters_per_second if reference and reference.letters_per_second else 0.0
+			lines.append(
+				f"{engine}: {stats.letters_per_second:,.0f} letters/s ({relative:.1f}x the reference), "
+				f"{stats.setup_seconds:.2f}s building machines"
+			)
+		return "\n".join(lines)
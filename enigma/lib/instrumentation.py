@@ -0,0 +1,214 @@
+import collections
+import functools
+import logging
+import string
+import struct
+import time
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional
+
+from .internals import ConfiguredRotor, Enigma, PlugBoard, Reflector, Rotor
+
+MODES = ("off", "counters", "trace")
+
+# A log level between DEBUG and INFO, which enables counters
+STATS = 15
+logging.addLevelName(STATS, "STATS")
+
+TRACE_MAGIC = b"ENIGMATR"
+TRACE_VERSION = 1
+
+
+def mode_for_log_level(level) -> str:
+	"""
+	Pick the instrumentation mode for a log level, given as a number or a name:
+	DEBUG traces the signal path, STATS collects counters, and anything higher disables instrumentation.
+	"""
+	if isinstance(level, str):
+		level = int(level) if level.isdigit() else logging.getLevelName(level.upper())
+	if not isinstance(level, int):
+		return "off"
+	if level <= logging.DEBUG:
+		return "trace"
+	if level <= STATS:
+		return "counters"
+	return "off"
+
+
+class Counters:
+	"""
+	Count the calls to each component and keep a histogram of their durations.
+
+	Durations are bucketed by powers of two nanoseconds: bucket `b` holds durations between 2**(b-1) and 2**b ns.
+	"""
+	targets = {
+		"plug_board.map": (PlugBoard, "map"),
+		"rotor.map": (Rotor, "map"),
+		"rotor.inverse_map": (Rotor, "inverse_map"),
+		"reflector.map": (Reflector, "map"),
+	}
+
+	def __init__(self):
+		self.calls: collections.Counter[str] = collections.Counter()
+		self.histograms: dict[str, collections.Counter[int]] = collections.defaultdict(collections.Counter)
+
+	def wrap(self, name: str, method: Callable) -> Callable:
+		calls, histogram = self.calls, self.histograms[name]
+
+		@functools.wraps(method)
+		def wrapper(*args):
+			start = time.perf_counter_ns()
+			result = method(*args)
+			histogram[(time.perf_counter_ns() - start).bit_length()] += 1
+			calls[name] += 1
+			return result
+
+		return wrapper
+
+	def report(self) -> str:
+		"""Summarize the calls and the median duration of each component."""
+		lines = []
+		for name, count in sorted(self.calls.items()):
+			histogram = self.histograms[name]
+			seen, median_bucket = 0, 0
+			for bucket in sorted(histogram):
+				seen += histogram[bucket]
+				if 2 * seen >= count:
+					median_bucket = bucket
+					break
+			lines.append(f"{name}: {count} calls, median below {2 ** median_bucket} ns")
+		return "\n".join(lines)
+
+	def close(self):
+		pass
+
+
+class TraceRecord(NamedTuple):
+	"""
+	The path of a letter through the machine.
+
+	`offsets` are the rotor offsets when the letter was encrypted. `path` holds the input letter, then the output of
+	each component traversed: plug board, each rotor, reflector, each rotor backwards, and plug board again.
+	All values are positions between 0 and 25.
+	"""
+	offsets: tuple[int, ...]
+	path: tuple[int, ...]
+
+
+class Trace:
+	"""
+	Record the full signal path of every letter in a compact binary log.
+
+	The log starts with `TRACE_MAGIC`, a version byte and the number of rotors `n`. Each letter then takes
+	`3 * n + 4` bytes: the `n` rotor offsets followed by the `2 * n + 4` positions of its path.
+	"""
+	targets = {
+		"plug_board.map": (PlugBoard, "map"),
+		"configured_rotor.map": (ConfiguredRotor, "map"),
+		"configured_rotor.inverse_map": (ConfiguredRotor, "inverse_map"),
+		"reflector.map": (Reflector, "map"),
+		"enigma.encrypt_letter": (Enigma, "_encrypt_letter"),
+	}
+
+	def __init__(self, file: BinaryIO):
+		self.file = file
+		self.n_rotors: Optional[int] = None
+		self._path: list[int] = []
+		self._record: Optional[struct.Struct] = None
+
+	def wrap(self, name: str, method: Callable) -> Callable:
+		path = self._path
+		alphabet = string.ascii_lowercase
+
+		if name == "enigma.encrypt_letter":
+			@functools.wraps(method)
+			def wrapper(machine, letter):
+				path.clear()
+				path.append(alphabet.index(letter))
+				result = method(machine, letter)
+				self._write([rotor.offset for rotor in machine.rotors], path)
+				return result
+		elif name == "plug_board.map":
+			@functools.wraps(method)
+			def wrapper(plug_board, c):
+				result = method(plug_board, c)
+				path.append(alphabet.index(result))
+				return result
+		else:
+			@functools.wraps(method)
+			def wrapper(component, x):
+				result = method(component, x)
+				path.append(result)
+				return result
+
+		return wrapper
+
+	def _write(self, offsets: list[int], path: list[int]):
+		if self._record is None:
+			self.n_rotors = len(offsets)
+			self._record = struct.Struct(f"{3 * self.n_rotors + 4}B")
+			self.file.write(TRACE_MAGIC + bytes([TRACE_VERSION, self.n_rotors]))
+		self.file.write(self._record.pack(*offsets, *path))
+
+	def close(self):
+		self.file.close()
+
+
+def read_trace(file: BinaryIO) -> Iterator[TraceRecord]:
+	"""Read the records of a log written by `Trace`."""
+	header = file.read(len(TRACE_MAGIC) + 2)
+	if not header:
+		return
+	if header[:len(TRACE_MAGIC)] != TRACE_MAGIC or header[len(TRACE_MAGIC)] != TRACE_VERSION:
+		raise ValueError("not an Enigma trace, or unsupported version")
+
+	n_rotors = header[-1]
+	record = struct.Struct(f"{3 * n_rotors + 4}B")
+	while data := file.read(record.size):
+		values = record.unpack(data)
+		yield TraceRecord(values[:n_rotors], values[n_rotors:])
+
+
+_installed: Optional[object] = None
+_originals: dict[tuple[type, str], Callable] = {}
+
+
+def install(mode: str, trace_file: Optional[BinaryIO] = None):
+	"""
+	Instrument the components of the machine.
+
+	Instrumentation replaces the methods of the components with wrappers, so that it costs nothing when it is off.
+
+	:param str mode: one of `MODES`.
+	:param Optional[BinaryIO] trace_file: where to write the trace, required in "trace" mode.
+	:return: the installed `Counters` or `Trace`, or None if the mode is "off".
+	"""
+	global _installed
+	if mode not in MODES:
+		raise ValueError(f"instrumentation mode {mode} does not exist: modes are {', '.join(MODES)}")
+	uninstall()
+	if mode == "off":
+		return None
+	if mode == "trace":
+		if trace_file is None:
+			raise ValueError("a trace file is required in trace mode")
+		instrumentation = Trace(trace_file)
+	else:
+		instrumentation = Counters()
+
+	for name, (cls, attribute) in instrumentation.targets.items():
+		method = cls.__dict__[attribute]
+		_originals[(cls, attribute)] = method
+		setattr(cls, attribute, instrumentation.wrap(name, method))
+	_installed = instrumentation
+	return instrumentation
+
+
+def uninstall():
+	"""Restore the original methods of the components, and close the installed instrumentation."""
+	global _installed
+	for (cls, attribute), method in _originals.items():
+		setattr(cls, attribute, method)
+	_originals.clear()
+	if _installed is not None:
+		_installed.close()
+		_installed = None
@@ -1,16 +1,16 @@
-import logging
 import random
 import string
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
-from .utils import choose_k, is_a_valid_position, InvalidPosition
+from .utils import choose_k, is_a_valid_position, pairings_to_permutation, InvalidPosition
+
+if TYPE_CHECKING:
+	from .config import Configuration
 
 N_AVAILABLE_ROTORS = 5
 N_ROTORS = 3
 N_WIRES = 10
 
-logger = logging.getLogger(__name__)
-
 
 class PlugBoard:
 	"""
@@ -53,7 +53,6 @@ class PlugBoard:
 				f"valid characters are between {alphabet[0]} and {alphabet[-1]}"
 			)
 		
-		logger.debug(f"Plug board mapped {c} to {self.mapping[c]}")
 		return self.mapping[c]
 
 
@@ -62,18 +61,26 @@ class Rotor:
 	The rotor implements a permutation over the alphabet.
 	The permutation depends on the internal wiring of the rotor.
 	"""
-	def __init__(self):
-		"""Create a rotor with a random internal wiring."""
+	def __init__(self, mapping: Optional[list[int]] = None):
+		"""
+		Create a rotor with the given internal wiring.
+
+		:param Optional[list[int]] mapping: the output position of each input position.
+		If None, the wiring is random. Default is None.
+		"""
 		n_pins = len(string.ascii_lowercase)
-		self.mapping = list(range(n_pins))
-		random.shuffle(self.mapping)
+		if mapping is None:
+			mapping = list(range(n_pins))
+			random.shuffle(mapping)
+		elif sorted(mapping) != list(range(n_pins)):
+			raise ValueError(f"rotor mapping is not a permutation of the {n_pins} positions")
+		self.mapping = list(mapping)
 
 	def map(self, x: int) -> int:
 		"""Get the output position, given the input position `x`, according to the rotor's wiring."""
 		if not is_a_valid_position(x):
 			raise InvalidPosition(x)
 		
-		logger.debug(f"Rotor {self} mapped {x} to {self.mapping[x]}")
 		return self.mapping[x]
 	
 	def inverse_map(self, y: int) -> int:
@@ -81,7 +88,6 @@ class Rotor:
 		if not is_a_valid_position(y):
 			raise InvalidPosition(y)
 		
-		logger.debug(f"Rotor {self} inverse mapped {y} to {self.mapping.index(y)}")
 		return self.mapping.index(y)
 
 
@@ -128,6 +134,24 @@ class ConfiguredRotor:
 		self.offset = self.offset % len(string.ascii_lowercase)
 		return self.offset == self.turnover
 
+	def advance(self, n_steps: int) -> int:
+		"""
+		Step the rotor `n_steps` times at once, in constant time.
+		Return the number of times the next rotor should be stepped, i.e., how many times the turnover notch was reached.
+		"""
+		if n_steps == 0:
+			return 0
+		alphabet_length = len(string.ascii_lowercase)
+		start = self.offset % alphabet_length
+		self.offset = (start + n_steps) % alphabet_length
+		if not is_a_valid_position(self.turnover):
+			return 0
+
+		first_turnover = (self.turnover - start - 1) % alphabet_length + 1
+		if n_steps < first_turnover:
+			return 0
+		return (n_steps - first_turnover) // alphabet_length + 1
+
 
 class Reflector:
 	"""
@@ -142,12 +166,20 @@ class Reflector:
 	"""
 	mapping: dict[int, int] = {}
 	
-	def __init__(self):
+	def __init__(self, pairings: Optional[list[int]] = None):
 		"""
 		Create a reflector with random internal wiring.
 		The wiring is class-wide, hence all instances have the same wiring.
+
+		:param Optional[list[int]] pairings: a list of positions where two adjacent positions are wired together.
+		If given, this instance uses this wiring instead of the class-wide one. Default is None.
 		"""
-		if not Reflector.mapping:
+		if pairings is not None:
+			mapping = pairings_to_permutation(pairings, len(string.ascii_lowercase))
+			if any(mapping[x] == x for x in range(len(mapping))):
+				raise ValueError("the reflector must wire every position to a different one")
+			self.mapping = dict(enumerate(mapping))
+		elif not Reflector.mapping:
 			pairings = list(range(len(string.ascii_lowercase)))
 			random.shuffle(pairings)
 			for x, y in zip(pairings[::2], pairings[1::2]):
@@ -159,8 +191,7 @@ class Reflector:
 		if not is_a_valid_position(x):
 			raise InvalidPosition(x)
 		
-		logger.debug(f"Reflector mapped {x} to {Reflector.mapping[x]}")
-		return Reflector.mapping[x]
+		return self.mapping[x]
 
 
 class Enigma:
@@ -172,6 +203,31 @@ class Enigma:
 		self.rotors = [ConfiguredRotor(rotor) for rotor in choose_k(self.available_rotors, k=N_ROTORS)]
 		self.reflector = Reflector()
 
+	@classmethod
+	def from_configuration(cls, configuration: "Configuration") -> "Enigma":
+		"""
+		Create a machine with the wiring and settings of `configuration`, instead of random ones.
+
+		The available rotors and the reflector of the configuration are only used by this machine:
+		the class-wide ones are left untouched.
+		"""
+		alphabet = string.ascii_lowercase
+		machine = cls.__new__(cls)
+		machine.available_rotors = [Rotor(rotor.permutation) for rotor in configuration.available_rotors]
+
+		machine.plug_board = PlugBoard()
+		machine.plug_board.configure([alphabet[x] for x in configuration.plug_board.pairings])
+
+		machine.rotors = []
+		for rotor_in_use in configuration.rotors_in_use:
+			rotor = ConfiguredRotor(machine.available_rotors[rotor_in_use.type])
+			rotor.set_starting_position(rotor_in_use.starting_position)
+			rotor.set_turnover_notch(rotor_in_use.turnover_notch)
+			machine.rotors.append(rotor)
+
+		machine.reflector = Reflector(configuration.reflector.pairings)
+		return machine
+
 	@classmethod
 	def get_available_rotors(cls) -> list[Rotor]:
 		"""
@@ -198,13 +254,7 @@ class Enigma:
 		
 		ctx = ""
 		for letter in msg:
-			ptx_letter = self.plug_board.map(letter)
-			x = string.ascii_lowercase.index(ptx_letter)
-			x = self._rotor_forward_path(x)
-			x = self.reflector.map(x)
-			x = self._rotor_return_path(x)
-			ctx_letter = self.plug_board.map(string.ascii_lowercase[x])
-			ctx += ctx_letter
+			ctx += self._encrypt_letter(letter)
 
 		return ctx
 
@@ -215,7 +265,25 @@ class Enigma:
 		Decryption is identical to encryption. See `self.encrypt` for more details.
 		"""
 		return self.encrypt(ctx)
+
+	def jump(self, n_letters: int):
+		"""
+		Bring the machine to the state it would be in after encrypting `n_letters` more letters, in constant time.
+		"""
+		if n_letters < 0:
+			raise ValueError(f"can't jump {n_letters} letters: the machine can only move forward")
+		steps = n_letters
+		for rotor in self.rotors:
+			steps = rotor.advance(steps)
 	
+	def _encrypt_letter(self, letter: str) -> str:
+		ptx_letter = self.plug_board.map(letter)
+		x = string.ascii_lowercase.index(ptx_letter)
+		x = self._rotor_forward_path(x)
+		x = self.reflector.map(x)
+		x = self._rotor_return_path(x)
+		return self.plug_board.map(string.ascii_lowercase[x])
+
 	def _rotor_forward_path(self, x: int) -> int:
 		step = True
 		for rotor in self.rotors:
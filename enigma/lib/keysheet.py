@@ -0,0 +1,219 @@
+import json
+import multiprocessing
+import os
+import time
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, TextIO
+
+from .cache import TableCache
+from .config import Configuration
+from .streaming import StreamEncryptor
+
+# Output files are written in blocks of this many bytes
+OUTPUT_BUFFER_SIZE = 1 << 20
+# Longer messages are decrypted in chunks of this many bytes
+CHUNK_SIZE = 1 << 16
+
+
+class Message(NamedTuple):
+	"""
+	An entry of a manifest: a message, and the key of the key sheet it was encrypted with.
+
+	The text is either given inline, or read from `path` by the worker decrypting it.
+	Whitespace around the text of a file is ignored.
+	"""
+	id: str
+	key: str
+	text: Optional[str] = None
+	path: Optional[str] = None
+
+
+class KeyStats(NamedTuple):
+	"""What a job did with the messages of one key. `seconds` includes `compile_seconds`."""
+	key: str
+	messages: int
+	letters: int
+	errors: int
+	compile_seconds: float
+	seconds: float
+
+
+def load_key_sheet(path: str) -> dict[str, Configuration]:
+	"""
+	Read a key sheet: a JSON object mapping the name of each key to a configuration,
+	in the schema of `Configuration`.
+	"""
+	with open(path) as f:
+		sheet = json.load(f)
+	if not isinstance(sheet, dict):
+		raise ValueError(f"key sheet {path} is not a JSON object mapping keys to configurations")
+	return {key: Configuration.model_validate(configuration) for key, configuration in sheet.items()}
+
+
+def load_manifest(path: str) -> Iterator[Message]:
+	"""
+	Read a manifest: one JSON object per line, with the fields of `Message`.
+
+	Relative paths of messages are relative to the directory of the manifest.
+	"""
+	directory = os.path.dirname(os.path.abspath(path))
+	with open(path) as f:
+		for n, line in enumerate(f, start=1):
+			if not line.strip():
+				continue
+			entry = json.loads(line)
+			try:
+				message = Message(id=str(entry["id"]), key=str(entry["key"]), text=entry.get("text"), path=entry.get("path"))
+			except KeyError as e:
+				raise ValueError(f"line {n} of manifest {path} has no field {e}") from None
+			if (message.text is None) == (message.path is None):
+				raise ValueError(f"line {n} of manifest {path} must have exactly one of the fields text and path")
+			if message.path is not None:
+				message = message._replace(path=os.path.join(directory, message.path))
+			yield message
+
+
+def group_by_key(messages: Iterable[Message], key_sheet: dict[str, Configuration]) -> dict[str, list[Message]]:
+	"""
+	Group messages by key, keeping the order of the messages within each key.
+
+	:raises KeyError: if a message uses a key that is not in the key sheet.
+	"""
+	groups: dict[str, list[Message]] = {}
+	for message in messages:
+		if message.key not in key_sheet:
+			raise KeyError(f"message {message.id} uses key {message.key}, which is not in the key sheet")
+		groups.setdefault(message.key, []).append(message)
+	return groups
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(invalid: str, cache_dir: Optional[str]):
+	_worker_state["invalid"] = invalid
+	_worker_state["cache"] = TableCache(maxsize=4, directory=cache_dir)
+
+
+def _decrypt_group(args: tuple[str, Configuration, list[Message]]) -> tuple[list[dict], KeyStats]:
+	key, configuration, messages = args
+	start = time.perf_counter()
+	# Keys with the same wiring share their table, and with a cache directory, so do processes and runs
+	machine = _worker_state["cache"].machine(configuration)
+	compile_seconds = time.perf_counter() - start
+	# Each message starts at the settings of the key: the machine goes back to its initial state for each one
+	encryptor = StreamEncryptor(machine, invalid=_worker_state["invalid"], chunk_size=CHUNK_SIZE)
+
+	results, errors = [], 0
+	for message in messages:
+		try:
+			if message.path is not None:
+				with open(message.path) as f:
+					# Text files usually end with a newline, which is not part of the message
+					text = f.read().strip()
+			else:
+				text = message.text
+			machine.position = 0
+			results.append({"id": message.id, "key": key, "text": "".join(encryptor.stream([text]))})
+		except (OSError, ValueError) as e:
+			results.append({"id": message.id, "key": key, "error": str(e)})
+			errors += 1
+	return results, KeyStats(key, len(messages), encryptor.n_letters, errors, compile_seconds, time.perf_counter() - start)
+
+
+class BatchDecryption:
+	"""
+	Decrypt a day of traffic: many messages, each one encrypted with a key of a key sheet.
+
+	Messages are grouped by key, and each group is decrypted by one worker, which compiles the machine of the key
+	once, through a `TableCache`, and brings it back to the settings of the key before each message.
+	Results are written as they come, one JSON object per line, in blocks of `OUTPUT_BUFFER_SIZE` bytes:
+	`{"id", "key", "text"}` for decrypted messages, and `{"id", "key", "error"}` for messages that could not be read
+	or contain characters outside the alphabet. Messages of the same key are written together, in manifest order,
+	but keys come in the order in which they are done.
+	"""
+	def __init__(self, key_sheet: dict[str, Configuration], invalid: str = "error", cache_dir: Optional[str] = None):
+		"""
+		:param dict[str, Configuration] key_sheet: the configuration of each key.
+		:param str invalid: how to handle characters outside the alphabet, see `StreamEncryptor`.
+		:param Optional[str] cache_dir: a directory where compiled tables are stored, to be reused by later jobs.
+		"""
+		self.key_sheet = key_sheet
+		self.invalid = invalid
+		self.cache_dir = cache_dir
+		self.stats: list[KeyStats] = []
+		self.seconds = 0.0
+
+	def results(self, messages: Iterable[Message], n_workers: Optional[int] = None) -> Iterator[tuple[list[dict], KeyStats]]:
+		"""
+		Decrypt messages, yielding the results of each key as soon as all its messages are decrypted.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		"""
+		groups = group_by_key(messages, self.key_sheet)
+		# Largest groups first, so that no worker is left with a large one at the end
+		tasks = [(key, self.key_sheet[key], group) for key, group in sorted(groups.items(), key=lambda item: -len(item[1]))]
+		initargs = (self.invalid, self.cache_dir)
+
+		start = time.perf_counter()
+		if n_workers == 1:
+			_init_worker(*initargs)
+			results = map(_decrypt_group, tasks)
+		else:
+			pool = multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs)
+			results = pool.imap_unordered(_decrypt_group, tasks)
+		try:
+			for group_results, stats in results:
+				self.stats.append(stats)
+				self.seconds = time.perf_counter() - start
+				yield group_results, stats
+		finally:
+			if n_workers != 1:
+				pool.terminate()
+
+	def run(
+		self,
+		messages: Iterable[Message],
+		output: TextIO,
+		n_workers: Optional[int] = None,
+		progress: Optional[Callable[[KeyStats], None]] = None,
+	) -> list[KeyStats]:
+		"""
+		Decrypt messages, and write the results to `output`. See `self.results` for the parameters.
+
+		:param progress: called with the statistics of each key when it is done.
+		:return: the statistics of each key, in the order in which they were done.
+		"""
+		for group_results, stats in self.results(messages, n_workers):
+			output.writelines(json.dumps(result) + "\n" for result in group_results)
+			if progress is not None:
+				progress(stats)
+		return self.stats
+
+	def decrypt_to_file(self, messages: Iterable[Message], path: str, n_workers: Optional[int] = None, **kwargs) -> list[KeyStats]:
+		"""Decrypt messages into the file at `path`, written in blocks of `OUTPUT_BUFFER_SIZE` bytes."""
+		with open(path, "w", buffering=OUTPUT_BUFFER_SIZE) as output:
+			return self.run(messages, output, n_workers, **kwargs)
+
+	@property
+	def n_messages(self) -> int:
+		return sum(stats.messages for stats in self.stats)
+
+	@property
+	def n_letters(self) -> int:
+		return sum(stats.letters for stats in self.stats)
+
+	def report(self) -> str:
+		"""Summarize the throughput of the job, then the statistics of each key."""
+		seconds = self.seconds or float("inf")
+		lines = [
+			f"{self.n_messages} messages, {self.n_letters:,} letters, {len(self.stats)} keys in {self.seconds:.2f}s: "
+			f"{self.n_messages / seconds:,.0f} messages/s, {self.n_letters / seconds:,.0f} letters/s"
+		]
+		for stats in sorted(self.stats, key=lambda stats: stats.key):
+			errors = f", {stats.errors} errors" if stats.errors else ""
+			lines.append(
+				f"{stats.key}: {stats.messages} messages, {stats.letters:,} letters{errors}, "
+				f"{stats.seconds:.3f}s ({stats.compile_seconds:.3f}s compiling)"
+			)
+		return "\n".join(lines)
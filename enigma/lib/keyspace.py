@@ -0,0 +1,298 @@
+import math
+import string
+import struct
+from typing import BinaryIO, Iterator, NamedTuple
+
+import numpy as np
+
+from .internals import N_AVAILABLE_ROTORS, N_ROTORS, N_WIRES, Enigma
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+KEYS_MAGIC = b"ENIGMAKS"
+KEYS_VERSION = 1
+# Magic, version, number of available rotors, rotors in use and wires, then padding
+KEYS_HEADER = struct.Struct("<8sBBBB4x")
+
+
+class Key(NamedTuple):
+	"""
+	A complete key of the machine.
+
+	`plug_board` is the permutation of the 26 positions made by the plug board.
+	"""
+	rotor_order: tuple[int, ...]
+	starting_positions: tuple[int, ...]
+	turnover_notches: tuple[int, ...]
+	plug_board: tuple[int, ...]
+
+	@classmethod
+	def from_enigma(cls, machine: Enigma) -> "Key":
+		"""Get the key of a machine, with rotors numbered by their index in `Enigma.get_available_rotors()`."""
+		available = [id(rotor) for rotor in Enigma.get_available_rotors()]
+		alphabet = string.ascii_lowercase
+		return cls(
+			tuple(available.index(id(rotor.rotor)) for rotor in machine.rotors),
+			tuple(rotor.offset % ALPHABET_LENGTH for rotor in machine.rotors),
+			tuple(rotor.turnover for rotor in machine.rotors),
+			tuple(alphabet.index(machine.plug_board.mapping[c]) for c in alphabet),
+		)
+
+
+class KeyArrays(NamedTuple):
+	"""Many keys, one per row: the arrays have shapes (K, n_rotors), except `plug_boards`, of shape (K, 26)."""
+	rotor_orders: np.ndarray
+	starting_positions: np.ndarray
+	turnover_notches: np.ndarray
+	plug_boards: np.ndarray
+
+	def key(self, i: int) -> Key:
+		return Key(*(tuple(int(x) for x in array[i]) for array in self))
+
+
+def _drop_pair(free: np.ndarray, partner_columns: np.ndarray) -> np.ndarray:
+	"""Remove the first column and one more column of each row of a 2-D array."""
+	keep = np.ones(free.shape, dtype=bool)
+	keep[:, 0] = False
+	keep[np.arange(len(free)), partner_columns] = False
+	return free[keep].reshape(len(free), -1)
+
+
+class KeySpace:
+	"""
+	A bijection between the keys of the machine and the integers from 0 to `self.size - 1`.
+
+	A rank is made of two parts, each of which fits a 64-bit integer:
+	- the rank of the rotor settings, i.e., rotor order, then turnover notches, then starting positions;
+	- the rank of the plug board, i.e., the set of plugged positions, then how they are paired.
+	The rank of a key is `rotor_rank * self.n_plug_boards + plug_board_rank`, so consecutive ranks share
+	the rotor settings, and a range of ranks is a natural unit of work.
+
+	Keys are packed on disk as the two parts, in the fewest bytes that fit them (11 bytes for the default machine).
+	"""
+	def __init__(self, n_available_rotors: int = N_AVAILABLE_ROTORS, n_rotors: int = N_ROTORS, n_wires: int = N_WIRES):
+		if not 0 < n_rotors <= n_available_rotors:
+			raise ValueError(f"cannot use {n_rotors} rotors out of {n_available_rotors}")
+		if not 0 <= 2 * n_wires <= ALPHABET_LENGTH:
+			raise ValueError(f"plug board cannot have {n_wires} wires")
+		self.n_available_rotors = n_available_rotors
+		self.n_rotors = n_rotors
+		self.n_wires = n_wires
+
+		self.n_orders = math.perm(n_available_rotors, n_rotors)
+		self.n_rotor_settings = self.n_orders * ALPHABET_LENGTH ** (2 * n_rotors)
+		self.n_plugged_sets = math.comb(ALPHABET_LENGTH, 2 * n_wires)
+		# The first free plugged position can be wired to 2 * n_wires - 1 positions, the next one to 2 * n_wires - 3...
+		self.pairing_radices = [2 * (n_wires - i) - 1 for i in range(n_wires)]
+		self.n_pairings = math.prod(self.pairing_radices)
+		self.n_plug_boards = self.n_plugged_sets * self.n_pairings
+		self.size = self.n_rotor_settings * self.n_plug_boards
+
+		self.rotor_bytes = max(1, ((self.n_rotor_settings - 1).bit_length() + 7) // 8)
+		self.plug_board_bytes = max(1, ((self.n_plug_boards - 1).bit_length() + 7) // 8)
+		self.record_size = self.rotor_bytes + self.plug_board_bytes
+
+		self._binomials = np.array(
+			[[math.comb(n, k) for k in range(2 * n_wires + 1)] for n in range(ALPHABET_LENGTH + 1)], dtype=np.int64
+		)
+
+	# Scalar interface
+
+	def rank(self, key: Key) -> int:
+		"""Get the rank of a key."""
+		rotor_ranks, plug_board_ranks = self.rank_many(KeyArrays(*(np.asarray([part]) for part in key)))
+		return int(rotor_ranks[0]) * self.n_plug_boards + int(plug_board_ranks[0])
+
+	def unrank(self, rank: int) -> Key:
+		"""Get the key of a rank."""
+		if not 0 <= rank < self.size:
+			raise ValueError(f"rank {rank} is out of the key space: ranks are between 0 and {self.size - 1}")
+		rotor_rank, plug_board_rank = divmod(rank, self.n_plug_boards)
+		return self.unrank_many(np.array([rotor_rank], dtype=np.uint64), np.array([plug_board_rank], dtype=np.uint64)).key(0)
+
+	# Vectorized interface
+
+	def rank_many(self, keys: KeyArrays) -> tuple[np.ndarray, np.ndarray]:
+		"""
+		Get the ranks of many keys.
+
+		:return: the arrays of rotor ranks and plug board ranks, of type uint64.
+		"""
+		return self.rank_rotor_settings(keys.rotor_orders, keys.starting_positions, keys.turnover_notches), \
+			self.rank_plug_boards(keys.plug_boards)
+
+	def unrank_many(self, rotor_ranks: np.ndarray, plug_board_ranks: np.ndarray) -> KeyArrays:
+		"""Get the keys of many ranks, given as rotor ranks and plug board ranks."""
+		return KeyArrays(*self.unrank_rotor_settings(rotor_ranks), self.unrank_plug_boards(plug_board_ranks))
+
+	def unrank_range(self, start: int, count: int) -> KeyArrays:
+		"""Get the keys of the ranks from `start` to `start + count` (excluded), e.g. a shard of a search."""
+		if not 0 <= start <= start + count <= self.size:
+			raise ValueError(f"ranks from {start} to {start + count} are out of the key space of size {self.size}")
+		rotor_rank, plug_board_rank = divmod(start, self.n_plug_boards)
+		plug_board_ranks = plug_board_rank + np.arange(count, dtype=np.uint64)
+		rotor_ranks = rotor_rank + plug_board_ranks // np.uint64(self.n_plug_boards)
+		return self.unrank_many(rotor_ranks, plug_board_ranks % np.uint64(self.n_plug_boards))
+
+	def rank_rotor_settings(self, rotor_orders: np.ndarray, starting_positions: np.ndarray, turnover_notches: np.ndarray) -> np.ndarray:
+		rotor_orders = np.asarray(rotor_orders, dtype=np.int64)
+		starting_positions = np.asarray(starting_positions, dtype=np.int64)
+		turnover_notches = np.asarray(turnover_notches, dtype=np.int64)
+		for name, array, bound in [
+			("rotor", rotor_orders, self.n_available_rotors),
+			("starting position", starting_positions, ALPHABET_LENGTH),
+			("turnover notch", turnover_notches, ALPHABET_LENGTH),
+		]:
+			if array.shape[-1] != self.n_rotors or array.size and (array.min() < 0 or array.max() >= bound):
+				raise ValueError(f"every key needs {self.n_rotors} values of {name} between 0 and {bound - 1}")
+
+		# Lehmer code: each rotor is numbered among the rotors not used yet
+		ranks = np.zeros(len(rotor_orders), dtype=np.int64)
+		for i in range(self.n_rotors):
+			used_before = (rotor_orders[:, :i] < rotor_orders[:, i, None]).sum(axis=1)
+			if i > 0 and (rotor_orders[:, :i] == rotor_orders[:, i, None]).any():
+				raise ValueError("a rotor cannot be used twice in the same key")
+			ranks = ranks * (self.n_available_rotors - i) + rotor_orders[:, i] - used_before
+		for settings in (turnover_notches, starting_positions):
+			for i in reversed(range(self.n_rotors)):
+				ranks = ranks * ALPHABET_LENGTH + settings[:, i]
+		return ranks.astype(np.uint64)
+
+	def unrank_rotor_settings(self, ranks: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+		ranks = np.asarray(ranks, dtype=np.uint64).astype(np.int64)
+		if ranks.size and (ranks.min() < 0 or ranks.max() >= self.n_rotor_settings):
+			raise ValueError(f"rotor ranks must be between 0 and {self.n_rotor_settings - 1}")
+
+		settings = []
+		for _ in range(2):
+			values = np.empty((len(ranks), self.n_rotors), dtype=np.uint8)
+			for i in range(self.n_rotors):
+				ranks, values[:, i] = np.divmod(ranks, ALPHABET_LENGTH)
+			settings.append(values)
+		starting_positions, turnover_notches = settings
+
+		digits = np.empty((len(ranks), self.n_rotors), dtype=np.int64)
+		for i in reversed(range(self.n_rotors)):
+			ranks, digits[:, i] = np.divmod(ranks, self.n_available_rotors - i)
+		rotor_orders = np.empty((len(ranks), self.n_rotors), dtype=np.uint8)
+		unused = np.ones((len(ranks), self.n_available_rotors), dtype=bool)
+		rows = np.arange(len(ranks))
+		for i in range(self.n_rotors):
+			# The rotor is the digit-th unused one
+			rotor = np.argmax(np.cumsum(unused, axis=1) > digits[:, i, None], axis=1)
+			rotor_orders[:, i] = rotor
+			unused[rows, rotor] = False
+		return rotor_orders, starting_positions, turnover_notches
+
+	def rank_plug_boards(self, plug_boards: np.ndarray) -> np.ndarray:
+		plug_boards = np.asarray(plug_boards, dtype=np.int64)
+		n_keys = len(plug_boards)
+		rows = np.arange(n_keys)
+		positions = np.arange(ALPHABET_LENGTH)
+		if plug_boards.shape[1:] != (ALPHABET_LENGTH,) or \
+			n_keys and (plug_boards.min() < 0 or plug_boards.max() >= ALPHABET_LENGTH):
+			raise ValueError(f"plug boards must be arrays of {ALPHABET_LENGTH} positions")
+		# Small integers are much faster to index with
+		plug_boards = plug_boards.astype(np.uint8)
+		if (np.take_along_axis(plug_boards, plug_boards, axis=1) != positions).any():
+			raise ValueError("plug boards must swap positions in pairs")
+		plugged = plug_boards != positions
+		if (plugged.sum(axis=1) != 2 * self.n_wires).any():
+			raise ValueError(f"plug boards must have exactly {self.n_wires} wires")
+
+		# Every row has the same number of plugged positions, so they can be listed in increasing order as a 2-D array
+		free = np.nonzero(plugged)[1].astype(np.uint8).reshape(n_keys, 2 * self.n_wires)
+		# Combinatorial number system: the i-th smallest plugged position p contributes C(p, i + 1)
+		plugged_sets = self._binomials[free, np.arange(1, 2 * self.n_wires + 1)].sum(axis=1)
+
+		# Wire the first free position, numbering its partner among the free positions after it
+		pairings = np.zeros(n_keys, dtype=np.int64)
+		for radix in self.pairing_radices:
+			partner = plug_boards[rows, free[:, 0]]
+			digit = np.argmax(free == partner[:, None], axis=1) - 1
+			pairings = pairings * radix + digit
+			free = _drop_pair(free, digit + 1)
+		return (plugged_sets * self.n_pairings + pairings).astype(np.uint64)
+
+	def unrank_plug_boards(self, ranks: np.ndarray) -> np.ndarray:
+		ranks = np.asarray(ranks, dtype=np.uint64).astype(np.int64)
+		if ranks.size and (ranks.min() < 0 or ranks.max() >= self.n_plug_boards):
+			raise ValueError(f"plug board ranks must be between 0 and {self.n_plug_boards - 1}")
+		n_keys = len(ranks)
+		rows = np.arange(n_keys)
+		plugged_sets, pairings = np.divmod(ranks, self.n_pairings)
+
+		free = np.empty((n_keys, 2 * self.n_wires), dtype=np.uint8)
+		for i in reversed(range(2 * self.n_wires)):
+			# The largest position p with C(p, i + 1) <= rank
+			free[:, i] = np.searchsorted(self._binomials[:, i + 1], plugged_sets, side="right") - 1
+			plugged_sets -= self._binomials[free[:, i], i + 1]
+
+		digits = np.empty((n_keys, self.n_wires), dtype=np.int64)
+		for i in reversed(range(self.n_wires)):
+			pairings, digits[:, i] = np.divmod(pairings, self.pairing_radices[i])
+
+		plug_boards = np.tile(np.arange(ALPHABET_LENGTH, dtype=np.uint8), (n_keys, 1))
+		for i in range(self.n_wires):
+			first, partner = free[:, 0], free[rows, digits[:, i] + 1]
+			plug_boards[rows, first] = partner
+			plug_boards[rows, partner] = first
+			free = _drop_pair(free, digits[:, i] + 1)
+		return plug_boards
+
+	# Packed format
+
+	def pack(self, rotor_ranks: np.ndarray, plug_board_ranks: np.ndarray) -> np.ndarray:
+		"""Pack ranks into an array of shape (K, self.record_size) of big-endian bytes."""
+		parts = []
+		for ranks, n_bytes in [(rotor_ranks, self.rotor_bytes), (plug_board_ranks, self.plug_board_bytes)]:
+			big_endian = np.asarray(ranks, dtype=np.uint64).astype(">u8")
+			parts.append(big_endian.view(np.uint8).reshape(-1, 8)[:, 8 - n_bytes:])
+		return np.concatenate(parts, axis=1)
+
+	def unpack(self, records: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+		"""Unpack the ranks of an array of records made by `self.pack`."""
+		records = np.asarray(records, dtype=np.uint8).reshape(-1, self.record_size)
+		ranks = []
+		for start, n_bytes in [(0, self.rotor_bytes), (self.rotor_bytes, self.plug_board_bytes)]:
+			padded = np.zeros((len(records), 8), dtype=np.uint8)
+			padded[:, 8 - n_bytes:] = records[:, start:start + n_bytes]
+			ranks.append(padded.view(">u8").ravel().astype(np.uint64))
+		return ranks[0], ranks[1]
+
+	def save(self, path: str, keys: KeyArrays):
+		"""Write keys to a file, packed."""
+		with open(path, "wb") as f:
+			f.write(KEYS_HEADER.pack(KEYS_MAGIC, KEYS_VERSION, self.n_available_rotors, self.n_rotors, self.n_wires))
+			f.write(self.pack(*self.rank_many(keys)).tobytes())
+
+	@classmethod
+	def _read_header(cls, f: BinaryIO, path: str) -> "KeySpace":
+		header = f.read(KEYS_HEADER.size)
+		if len(header) < KEYS_HEADER.size:
+			raise ValueError(f"{path} is not a file of keys")
+		magic, version, n_available_rotors, n_rotors, n_wires = KEYS_HEADER.unpack(header)
+		if magic != KEYS_MAGIC or version != KEYS_VERSION:
+			raise ValueError(f"{path} is not a file of keys, or has an unsupported version")
+		return cls(n_available_rotors, n_rotors, n_wires)
+
+	@classmethod
+	def load(cls, path: str) -> tuple["KeySpace", KeyArrays]:
+		"""Read a file written by `KeySpace.save`, returning the key space of the keys and the keys."""
+		with open(path, "rb") as f:
+			key_space = cls._read_header(f, path)
+			records = np.frombuffer(f.read(), dtype=np.uint8)
+		if len(records) % key_space.record_size:
+			raise ValueError(f"{path} is truncated")
+		return key_space, key_space.unrank_many(*key_space.unpack(records))
+
+	@classmethod
+	def load_batches(cls, path: str, batch_size: int) -> Iterator[KeyArrays]:
+		"""Read a file written by `KeySpace.save` `batch_size` keys at a time, so that it never has to fit in memory."""
+		with open(path, "rb") as f:
+			key_space = cls._read_header(f, path)
+			while data := f.read(batch_size * key_space.record_size):
+				if len(data) % key_space.record_size:
+					raise ValueError(f"{path} is truncated")
+				records = np.frombuffer(data, dtype=np.uint8)
+				yield key_space.unrank_many(*key_space.unpack(records))
@@ -0,0 +1,73 @@
+import copy
+import math
+import multiprocessing
+import os
+import string
+from typing import Optional
+
+from .compiled import CompiledEnigma
+from .internals import Enigma, Reflector
+
+MIN_CHUNK_SIZE = 1 << 16
+
+
+def _init_worker(reflector_mapping: dict[int, int]):
+	# The reflector's wiring is class-wide: make sure workers use the same one as the parent process
+	Reflector.mapping.clear()
+	Reflector.mapping.update(reflector_mapping)
+
+
+def _encrypt_chunk(args: tuple[Enigma, int, str]) -> str:
+	machine, start, chunk = args
+	machine.jump(start)
+	return CompiledEnigma.from_enigma(machine).encrypt(chunk)
+
+
+def decrypt_window(machine: Enigma, ctx: str, start: int, stop: Optional[int] = None) -> str:
+	"""
+	Decrypt the letters of `ctx` from position `start` to position `stop` (excluded), where `machine`
+	is in the state in which `ctx` began. Only the window is decrypted. `machine` is left untouched.
+	"""
+	window_machine = copy.deepcopy(machine)
+	window_machine.jump(start)
+	return window_machine.decrypt(ctx[start:stop])
+
+
+def encrypt_parallel(machine: Enigma, msg: str, n_workers: Optional[int] = None, chunk_size: Optional[int] = None) -> str:
+	"""
+	Encrypt a message by splitting it in chunks, encrypted on different cores, and update the internal state of the machine.
+
+	Each chunk is encrypted by a copy of `machine` that jumps directly to the state at which the chunk begins.
+	The output is identical to `machine.encrypt(msg)`.
+
+	:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+	If 1, everything runs in the current process.
+	:param Optional[int] chunk_size: the number of letters per chunk. Default is enough to give a few chunks to each worker.
+	"""
+	invalid_characters = ", ".join(set(msg) - set(string.ascii_lowercase))
+	if invalid_characters:
+		raise ValueError(f"plaintext should be lowercase ASCII characters only, invalid characters found: {invalid_characters}")
+
+	if n_workers is None:
+		n_workers = os.cpu_count() or 1
+	if chunk_size is None:
+		chunk_size = max(MIN_CHUNK_SIZE, math.ceil(len(msg) / (4 * n_workers)))
+	tasks = [(machine, start, msg[start:start + chunk_size]) for start in range(0, len(msg), chunk_size)]
+
+	if n_workers == 1 or len(tasks) <= 1:
+		chunks = [_encrypt_chunk((copy.deepcopy(m), start, chunk)) for m, start, chunk in tasks]
+	else:
+		with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=(dict(Reflector.mapping),)) as pool:
+			chunks = pool.map(_encrypt_chunk, tasks)
+
+	machine.jump(len(msg))
+	return "".join(chunks)
+
+
+def decrypt_parallel(machine: Enigma, ctx: str, n_workers: Optional[int] = None, chunk_size: Optional[int] = None) -> str:
+	"""
+	Decrypt a message by splitting it in chunks, decrypted on different cores, and update the internal state of the machine.
+
+	Decryption is identical to encryption. See `encrypt_parallel` for more details.
+	"""
+	return encrypt_parallel(machine, ctx, n_workers, chunk_size)
@@ -0,0 +1,407 @@
+import collections
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import string
+import time
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .batched import BatchedEnigma, to_indices
+from .ciphertext_only import Candidate
+from .keyspace import Key, KeyArrays, KeySpace
+from .scoring import NgramTable
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+DEFAULT_BATCH_SIZE = 4096
+EXECUTORS = ("thread", "process")
+
+
+class Batch(NamedTuple):
+	"""
+	Keys flowing through a pipeline, with the decryption and the score under each key once they are computed.
+
+	`texts` has shape (K, L) and `scores` shape (K,), row i being for key i.
+	"""
+	keys: KeyArrays
+	texts: Optional[np.ndarray] = None
+	scores: Optional[np.ndarray] = None
+
+	@property
+	def size(self) -> int:
+		return len(self.keys.rotor_orders)
+
+	def select(self, rows: np.ndarray) -> "Batch":
+		"""Keep only some of the keys, given by index or by a boolean mask."""
+		return Batch(
+			KeyArrays(*(array[rows] for array in self.keys)),
+			None if self.texts is None else self.texts[rows],
+			None if self.scores is None else self.scores[rows],
+		)
+
+
+class Result(NamedTuple):
+	score: float
+	key: Key
+
+
+class StageStats(NamedTuple):
+	"""
+	The work done by a stage. `seconds` is the time spent processing, summed over the workers:
+	the stage alone would process `keys_per_second` keys per second on a single worker.
+	"""
+	name: str
+	batches: int
+	keys_in: int
+	keys_out: int
+	seconds: float
+
+	@property
+	def keys_per_second(self) -> float:
+		return self.keys_in / self.seconds if self.seconds > 0 else 0.0
+
+
+# Sources
+
+def key_range(key_space: KeySpace, start: int = 0, count: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Batch]:
+	"""Yield the keys of the ranks from `start` to `start + count` (excluded) of a key space, by default all of them."""
+	if count is None:
+		count = key_space.size - start
+	for first in range(start, start + count, batch_size):
+		yield Batch(key_space.unrank_range(first, min(batch_size, start + count - first)))
+
+
+def key_file(path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Batch]:
+	"""Yield the keys of a file written by `KeySpace.save`."""
+	for keys in KeySpace.load_batches(path, batch_size):
+		yield Batch(keys)
+
+
+def candidate_keys(
+	candidates: Iterable[Union[Result, Key, Candidate]],
+	turnover_notches: Optional[tuple[int, ...]] = None,
+	batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[Batch]:
+	"""
+	Yield the keys of the results of an upstream search, e.g. of another pipeline or of `CiphertextOnlyAttack`.
+
+	The candidates of the attacks have no plug board: they get the one that swaps nothing.
+
+	:param Optional[tuple[int, ...]] turnover_notches: the notches of the candidates that have none, i.e., that were
+	given rather than searched. Default is all 0.
+	"""
+	identity = tuple(range(ALPHABET_LENGTH))
+	keys = []
+	for candidate in candidates:
+		if isinstance(candidate, Result):
+			candidate = candidate.key
+		if isinstance(candidate, Candidate):
+			notches = candidate.turnover_notches or turnover_notches or (0,) * len(candidate.rotor_order)
+			candidate = Key(candidate.rotor_order, candidate.starting_positions, notches, identity)
+		keys.append(candidate)
+	for first in range(0, len(keys), batch_size):
+		rows = keys[first:first + batch_size]
+		yield Batch(KeyArrays(*(np.array(part, dtype=np.uint8) for part in zip(*rows))))
+
+
+# Stages
+
+class Stage:
+	"""
+	A step of a pipeline, which turns each batch into a batch of the same or fewer keys.
+
+	Stages only see one batch at a time, so that they can run in any worker of a pool, and must be picklable
+	to run in a process pool.
+	"""
+	name = "stage"
+
+	def process(self, batch: Batch) -> Batch:
+		raise NotImplementedError
+
+
+class Decrypt(Stage):
+	"""Decrypt a ciphertext under every key."""
+	def __init__(
+		self,
+		ctx: Union[str, np.ndarray],
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		plug_boards: bool = True,
+		name: str = "decrypt",
+	):
+		"""
+		:param ctx: the ciphertext.
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param bool plug_boards: whether to use the plug boards of the keys. A coarse pass can ignore them, like
+		`CiphertextOnlyAttack`.
+		"""
+		self.ctx = to_indices(ctx) if isinstance(ctx, str) else np.asarray(ctx)
+		self.engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		self.plug_boards = plug_boards
+		self.name = name
+
+	def process(self, batch: Batch) -> Batch:
+		keys = batch.keys
+		texts = self.engine.decrypt(
+			self.ctx,
+			keys.rotor_orders,
+			keys.starting_positions,
+			keys.turnover_notches,
+			keys.plug_boards if self.plug_boards else None,
+		)
+		return batch._replace(texts=texts)
+
+
+class Score(Stage):
+	"""
+	Score the decryptions, and drop the keys scoring below a threshold, so that later stages never spend time on them.
+
+	Scorers are functions of an array of decryptions of shape (K, L) returning the K scores, higher being
+	better, e.g. `ciphertext_only.index_of_coincidence` or `NgramScorer`.
+	"""
+	def __init__(self, scorer: Callable[[np.ndarray], np.ndarray], threshold: Optional[float] = None, name: Optional[str] = None):
+		self.scorer = scorer
+		self.threshold = threshold
+		self.name = name or getattr(scorer, "__name__", type(scorer).__name__)
+
+	def process(self, batch: Batch) -> Batch:
+		if batch.texts is None:
+			raise ValueError(f"stage {self.name} scores decryptions: a decrypt stage must come first")
+		batch = batch._replace(scores=np.asarray(self.scorer(batch.texts), dtype=np.float64))
+		if self.threshold is not None:
+			batch = batch.select(batch.scores >= self.threshold)
+		return batch
+
+
+class NgramScorer:
+	"""
+	Score decryptions with an n-gram table, opened in each process that uses it.
+
+	Only the path is pickled: processes of a pool map the same file, and share its pages.
+	"""
+	def __init__(self, path: str):
+		self.path = path
+		self._table: Optional[NgramTable] = None
+
+	def __call__(self, texts: np.ndarray) -> np.ndarray:
+		if self._table is None:
+			self._table = NgramTable.open(self.path)
+		return self._table.score_batch(texts)
+
+	def __getstate__(self) -> dict:
+		return {"path": self.path, "_table": None}
+
+
+# Sinks
+
+class TopK:
+	"""
+	Keep the best `k` keys seen, in a bounded heap.
+
+	Keys enter the heap as they are found, so that a search can show or act on its best results before it ends.
+	"""
+	def __init__(self, k: int):
+		if k < 1:
+			raise ValueError(f"cannot keep the best {k} keys")
+		self.k = k
+		# Entries are (score, -arrival, key): keys are never compared, and of equal scores, the latest is dropped first
+		self._heap: list[tuple[float, int, Key]] = []
+		self._arrivals = itertools.count()
+
+	@property
+	def threshold(self) -> float:
+		"""Get the score a key must beat to enter the heap."""
+		return self._heap[0][0] if len(self._heap) == self.k else -np.inf
+
+	def push(self, batch: Batch) -> list[Result]:
+		"""Offer the keys of a scored batch, and return those that entered the heap."""
+		if batch.scores is None:
+			raise ValueError("keys must be scored before entering a top-K")
+		rows = np.flatnonzero(batch.scores > self.threshold)
+		if len(rows) > self.k:
+			rows = rows[np.argpartition(-batch.scores[rows], self.k - 1)[:self.k]]
+
+		entered = []
+		for row in rows[np.argsort(-batch.scores[rows], kind="stable")]:
+			score = float(batch.scores[row])
+			if score <= self.threshold:
+				break
+			entry = (score, -next(self._arrivals), batch.keys.key(int(row)))
+			if len(self._heap) < self.k:
+				heapq.heappush(self._heap, entry)
+			else:
+				heapq.heapreplace(self._heap, entry)
+			entered.append(Result(score, entry[2]))
+		return entered
+
+	def stream(self, batches: Iterable[Batch]) -> Iterator[Result]:
+		"""Consume batches, yielding each key as it enters the heap. It may be pushed out by a better one later."""
+		for batch in batches:
+			yield from self.push(batch)
+
+	def results(self) -> list[Result]:
+		"""Get the best keys so far, best first."""
+		return [Result(score, key) for score, _, key in sorted(self._heap, key=lambda entry: (-entry[0], -entry[1]))]
+
+
+# Execution
+
+_worker_state: dict = {}
+
+
+def _init_worker(stages: Sequence[Stage]):
+	_worker_state["stages"] = stages
+
+
+def _run_stage(stage: Stage, batch: Batch) -> tuple[Batch, float]:
+	start = time.perf_counter()
+	result = stage.process(batch)
+	return result, time.perf_counter() - start
+
+
+def _run_worker_stage(index: int, batch: Batch) -> tuple[Batch, float]:
+	return _run_stage(_worker_state["stages"][index], batch)
+
+
+class Pipeline:
+	"""
+	Enumerate keys, decrypt, score, filter, and keep the best keys, as a chain of stages.
+
+	Batches of keys flow from a source through the stages, each stage running on its own batches in parallel on a
+	thread or process pool. Each stage has at most `queue_size` batches in flight, and only pulls the next batch from
+	the previous stage when one of them is done: a slow stage slows down the ones before it instead of piling up
+	batches in memory. Batches keep their order.
+
+	Stages are chained with `then`, so that e.g. a coarse pass by index of coincidence, without plug board, only
+	passes on its best keys to a finer pass by n-grams::
+
+		pipeline = Pipeline(key_range(key_space), executor="process").then(
+			Decrypt(ctx, plug_boards=False), Score(index_of_coincidence, threshold=0.05),
+			Decrypt(ctx), Score(NgramScorer("quadgrams.bin")),
+		)
+		for result in TopK(10).stream(pipeline):
+			...
+
+	The best keys of a pipeline can also feed another one, through `candidate_keys`.
+	"""
+	def __init__(
+		self,
+		source: Iterable[Batch],
+		stages: Sequence[Stage] = (),
+		executor: Optional[str] = "thread",
+		n_workers: Optional[int] = None,
+		queue_size: int = 4,
+	):
+		"""
+		:param Iterable[Batch] source: the batches of keys, e.g. `key_range`, `key_file` or `candidate_keys`.
+		:param Sequence[Stage] stages: the first stages.
+		:param Optional[str] executor: where stages run, one of `EXECUTORS`. If None, everything runs
+		in the current thread, one batch at a time.
+		:param Optional[int] n_workers: the number of workers of the pool, shared by all the stages.
+		Default is the number of CPUs.
+		:param int queue_size: the maximum number of batches in flight per stage.
+		"""
+		if executor is not None and executor not in EXECUTORS:
+			raise ValueError(f"executor {executor} does not exist: executors are {', '.join(EXECUTORS)}")
+		if queue_size < 1:
+			raise ValueError("at least one batch per stage must be in flight")
+		self.source = source
+		self.stages: list[Stage] = list(stages)
+		self.executor = executor
+		self.n_workers = n_workers
+		self.queue_size = queue_size
+		self._stats: dict[str, dict] = {}
+
+	def then(self, *stages: Stage) -> "Pipeline":
+		"""Append stages to the pipeline, and return it."""
+		self.stages.extend(stages)
+		return self
+
+	def __iter__(self) -> Iterator[Batch]:
+		"""Run the pipeline, yielding the batches that come out of the last stage. Empty batches are not passed on."""
+		names = ["source"] + [stage.name for stage in self.stages]
+		# Stages may share a name, e.g. two decrypt stages
+		names = [name if names.count(name) == 1 else f"{name}-{i}" for i, name in enumerate(names)]
+		self._stats = {name: dict(batches=0, keys_in=0, keys_out=0, seconds=0.0) for name in names}
+
+		executor: Optional[concurrent.futures.Executor] = None
+		if self.executor == "thread":
+			executor = concurrent.futures.ThreadPoolExecutor(self.n_workers)
+		elif self.executor == "process":
+			# Stages are sent once to each worker, rather than with every batch
+			executor = concurrent.futures.ProcessPoolExecutor(self.n_workers, initializer=_init_worker, initargs=(self.stages,))
+
+		def submit(index: int, batch: Batch) -> concurrent.futures.Future:
+			if self.executor == "thread":
+				return executor.submit(_run_stage, self.stages[index], batch)
+			return executor.submit(_run_worker_stage, index, batch)
+
+		try:
+			batches = self._timed_source(names[0])
+			for i, name in enumerate(names[1:]):
+				batches = self._run(i, name, batches, submit if executor is not None else None)
+			yield from batches
+		finally:
+			if executor is not None:
+				executor.shutdown(wait=True, cancel_futures=True)
+
+	def _timed_source(self, name: str) -> Iterator[Batch]:
+		stats = self._stats[name]
+		iterator = iter(self.source)
+		while True:
+			start = time.perf_counter()
+			batch = next(iterator, None)
+			stats["seconds"] += time.perf_counter() - start
+			if batch is None:
+				return
+			stats["batches"] += 1
+			stats["keys_in"] += batch.size
+			stats["keys_out"] += batch.size
+			yield batch
+
+	def _run(self, index: int, name: str, batches: Iterator[Batch], submit) -> Iterator[Batch]:
+		stats = self._stats[name]
+		if submit is None:
+			results = ((batch.size, _run_stage(self.stages[index], batch)) for batch in batches)
+		else:
+			results = _bounded_map(functools.partial(submit, index), batches, self.queue_size)
+		for size, (batch, seconds) in results:
+			stats["batches"] += 1
+			stats["keys_in"] += size
+			stats["keys_out"] += batch.size
+			stats["seconds"] += seconds
+			if batch.size:
+				yield batch
+
+	def stats(self) -> list[StageStats]:
+		"""Get the work done by the source and by each stage, so far or in the last run."""
+		return [StageStats(name, **values) for name, values in self._stats.items()]
+
+	def report(self) -> str:
+		"""Summarize the throughput of each stage."""
+		return "\n".join(
+			f"{s.name}: {s.batches:,} batches, {s.keys_in:,} keys in, {s.keys_out:,} keys out, "
+			f"{s.seconds:.2f}s, {s.keys_per_second:,.0f} keys/s"
+			for s in self.stats()
+		)
+
+
+def _bounded_map(submit, batches: Iterable[Batch], queue_size: int) -> Iterator[tuple[int, tuple[Batch, float]]]:
+	"""Submit batches, with at most `queue_size` in flight, and yield their sizes and their results in order."""
+	pending: collections.deque = collections.deque()
+	try:
+		for batch in batches:
+			pending.append((batch.size, submit(batch)))
+			if len(pending) >= queue_size:
+				size, future = pending.popleft()
+				yield size, future.result()
+		while pending:
+			size, future = pending.popleft()
+			yield size, future.result()
+	finally:
+		for _, future in pending:
+			future.cancel()
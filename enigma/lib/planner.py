@@ -0,0 +1,319 @@
+import heapq
+import itertools
+import multiprocessing
+import string
+import time
+from typing import Callable, Iterator, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .batched import BatchedEnigma, to_indices
+from .ciphertext_only import (
+	Candidate,
+	all_starting_positions,
+	decrypt_all_positions,
+	index_of_coincidence,
+	merge_candidates,
+)
+from .internals import N_ROTORS
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+
+class Chain(NamedTuple):
+	"""
+	A way for keys to step the rotors: the letter before which each rotor first steps, 0 if before the first letter
+	and None if not within the message, and for each rotor, the differences between its turnover notch
+	and its starting position that lead to the first step of the next rotor.
+	"""
+	first_steps: tuple[Optional[int], ...]
+	notch_offsets: tuple[tuple[int, ...], ...]
+
+
+class StepPattern(NamedTuple):
+	"""
+	How the rotors step during a message, whatever their offsets when the first letter is encrypted.
+
+	`next_steps[i]` is the letter before which rotor i steps for the first time after the first letter,
+	or None if it does not step again within the message. Rotor i then steps every 26 ** i letters.
+	`chains` are the ways keys produce the pattern.
+	"""
+	next_steps: tuple[Optional[int], ...]
+	chains: tuple[Chain, ...]
+
+	@property
+	def keys_per_class(self) -> int:
+		"""Get the number of keys, i.e., starting positions and turnover notches, for each offset of the rotors."""
+		return sum(int(np.prod([len(offsets) for offsets in chain.notch_offsets])) for chain in self.chains)
+
+
+def _next_first_steps(first_step: Optional[int], rotor: int, length: int) -> dict[Optional[int], list[int]]:
+	"""
+	Group the turnover notches of a rotor by the letter before which the next rotor first steps.
+
+	The notches are given as differences with the starting position of the rotor, mod 26.
+	"""
+	choices: dict[Optional[int], list[int]] = {}
+	for step in range(1, ALPHABET_LENGTH + 1):
+		# The step-th step of the rotor reaches its notch. Its steps are 26 ** rotor letters apart.
+		next_step = None
+		if first_step is not None and first_step + (step - 1) * ALPHABET_LENGTH ** rotor < length:
+			next_step = first_step + (step - 1) * ALPHABET_LENGTH ** rotor
+		choices.setdefault(next_step, []).append(step % ALPHABET_LENGTH)
+	return choices
+
+
+def _next_step(first_step: Optional[int], rotor: int, length: int) -> Optional[int]:
+	"""Get the letter before which a rotor steps after the first letter, given the one before which it first steps."""
+	if first_step == 0:
+		first_step = ALPHABET_LENGTH ** rotor
+	return first_step if first_step is not None and first_step < length else None
+
+
+class SearchPlan:
+	"""
+	The keys worth trying for a message of a given length: one per class of starting positions and turnover notches
+	that step the rotors through the same states, and thus encrypt the same way.
+
+	The stepping is the same as `ConfiguredRotor.step`, before every letter as in `Enigma._rotor_forward_path`.
+	The fast rotor steps before every letter, and each rotor steps the next one every 26 of its own steps, once it
+	reaches its notch: rotor i steps every 26 ** i letters, from the letter before which it first steps.
+	The states of a message are thus set by the offsets of the rotors at the first letter, and by the letter before
+	which each rotor first steps after the first one. The notch of a rotor only matters through the latter for the
+	next rotor: all the notches reached after the end of the message are equivalent, and the notch of the last rotor
+	never matters. A rotor that steps before the first letter is equivalent to one starting a position further.
+
+	The classes are grouped by `StepPattern`, i.e., the letters before which the rotors step, and every pattern
+	has a class per combination of offsets at the first letter. For short messages there are few patterns:
+	for 3 rotors and 20 letters, 39 patterns stand for the 26 ** 3 combinations of notches.
+	"""
+	def __init__(self, length: int, n_rotors: int = N_ROTORS):
+		"""
+		:param int length: the length of the message.
+		:param int n_rotors: the number of rotors in use.
+		"""
+		if length < 1:
+			raise ValueError(f"cannot plan a search for a message of {length} letters")
+		self.length = length
+		self.n_rotors = n_rotors
+
+		chains = [((0,), ())]
+		for rotor in range(n_rotors - 1):
+			chains = [
+				(first_steps + (next_step,), notch_offsets + (tuple(offsets),))
+				for first_steps, notch_offsets in chains
+				for next_step, offsets in _next_first_steps(first_steps[-1], rotor, length).items()
+			]
+		patterns: dict[tuple[Optional[int], ...], list[Chain]] = {}
+		for first_steps, notch_offsets in chains:
+			# The notch of the last rotor is never reached by a next rotor
+			chain = Chain(first_steps, notch_offsets + (tuple(range(ALPHABET_LENGTH)),))
+			next_steps = tuple(_next_step(step, rotor, length) for rotor, step in enumerate(first_steps))
+			patterns.setdefault(next_steps, []).append(chain)
+		self.patterns = [StepPattern(next_steps, tuple(chains)) for next_steps, chains in patterns.items()]
+		self._pattern_index = {pattern.next_steps: i for i, pattern in enumerate(self.patterns)}
+
+	@property
+	def n_keys(self) -> int:
+		"""Get the number of combinations of starting positions and turnover notches."""
+		return ALPHABET_LENGTH ** (2 * self.n_rotors)
+
+	@property
+	def n_classes(self) -> int:
+		return len(self.patterns) * ALPHABET_LENGTH ** self.n_rotors
+
+	@property
+	def reduction(self) -> float:
+		"""Get how many times fewer keys are tried by trying one per class."""
+		return self.n_keys / self.n_classes
+
+	def classify(self, starting_positions: tuple[int, ...], turnover_notches: tuple[int, ...]) -> tuple[int, tuple[int, ...]]:
+		"""
+		Get the class of a key.
+
+		:return: the index of its pattern in `self.patterns`, and the offsets of the rotors at the first letter.
+		"""
+		first_steps = [0]
+		for rotor in range(self.n_rotors - 1):
+			# The rotor reaches its notch at its step-th step
+			step = (turnover_notches[rotor] - starting_positions[rotor] - 1) % ALPHABET_LENGTH + 1
+			next_step = None
+			if first_steps[-1] is not None and first_steps[-1] + (step - 1) * ALPHABET_LENGTH ** rotor < self.length:
+				next_step = first_steps[-1] + (step - 1) * ALPHABET_LENGTH ** rotor
+			first_steps.append(next_step)
+		next_steps = tuple(_next_step(step, rotor, self.length) for rotor, step in enumerate(first_steps))
+		offsets = tuple(
+			(position + (step == 0)) % ALPHABET_LENGTH for position, step in zip(starting_positions, first_steps)
+		)
+		return self._pattern_index[next_steps], offsets
+
+	def expand(self, pattern: int, offsets: tuple[int, ...]) -> Iterator[tuple[tuple[int, ...], tuple[int, ...]]]:
+		"""Yield the starting positions and turnover notches of every key of a class."""
+		for chain in self.patterns[pattern].chains:
+			positions = tuple(
+				(offset - (step == 0)) % ALPHABET_LENGTH for offset, step in zip(offsets, chain.first_steps)
+			)
+			notches = [
+				[(position + d) % ALPHABET_LENGTH for d in notch_offsets]
+				for position, notch_offsets in zip(positions, chain.notch_offsets)
+			]
+			for combination in itertools.product(*notches):
+				yield positions, combination
+
+	def representatives(self, pattern: int) -> tuple[np.ndarray, np.ndarray]:
+		"""
+		Get a key of each class of a pattern.
+
+		:return: the starting positions and the turnover notches, arrays of shape (26 ** n_rotors, n_rotors),
+		whose row `i` stands for the class whose offsets at the first letter are `all_starting_positions(n_rotors)[i]`.
+		"""
+		chain = self.patterns[pattern].chains[0]
+		shifts = np.array([step == 0 for step in chain.first_steps], dtype=np.int64)
+		positions = (all_starting_positions(self.n_rotors) - shifts) % ALPHABET_LENGTH
+		notches = (positions + np.array([min(offsets) for offsets in chain.notch_offsets])) % ALPHABET_LENGTH
+		return positions.astype(np.uint8), notches.astype(np.uint8)
+
+	def letter_states(self, pattern: int) -> np.ndarray:
+		"""
+		Get the rotor state in which each letter of a message is encrypted, for each class of a pattern.
+
+		:return: array of shape (26 ** n_rotors, length), rows as in `self.representatives`, and states numbered
+		as in `compile_table`, like `ciphertext_only.letter_states`.
+		"""
+		letters = np.arange(self.length)
+		offsets = all_starting_positions(self.n_rotors)
+		states = np.zeros((len(offsets), self.length), dtype=np.int32)
+		for rotor in reversed(range(self.n_rotors)):
+			next_step = self.patterns[pattern].next_steps[rotor]
+			steps = np.zeros(self.length, dtype=np.int32)
+			if next_step is not None:
+				period = ALPHABET_LENGTH ** rotor
+				steps = np.where(letters >= next_step, (letters - next_step) // period + 1, 0).astype(np.int32)
+			states = states * ALPHABET_LENGTH + (offsets[:, rotor, None] + steps) % ALPHABET_LENGTH
+		return states
+
+
+def search_rotor_order(
+	engine: BatchedEnigma,
+	ctx: np.ndarray,
+	rotor_order: tuple[int, ...],
+	plan: SearchPlan,
+	top_k: int,
+) -> list[Candidate]:
+	"""
+	Score a key of each class of a plan under a rotor order by index of coincidence, and return the best `top_k`.
+
+	Unlike `ciphertext_only.search_rotor_order`, the turnover notches are searched too. The candidates hold
+	the representatives of their classes: `plan.expand(*plan.classify(...))` gives all the equivalent keys.
+	"""
+	best: list[Candidate] = []
+	for pattern in range(len(plan.patterns)):
+		scores = index_of_coincidence(decrypt_all_positions(engine, ctx, rotor_order, plan.letter_states(pattern)))
+		rows = np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]
+		positions, notches = plan.representatives(pattern)
+		best = heapq.nlargest(top_k, best + [
+			Candidate(float(scores[i]), tuple(rotor_order), tuple(int(p) for p in positions[i]), tuple(int(t) for t in notches[i]))
+			for i in rows
+		])
+	return best
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(rotor_mappings: np.ndarray, reflector_mapping: np.ndarray, ctx: np.ndarray, n_rotors: int, top_k: int):
+	_worker_state["engine"] = BatchedEnigma(rotor_mappings, reflector_mapping)
+	_worker_state["ctx"] = ctx
+	_worker_state["plan"] = SearchPlan(len(ctx), n_rotors)
+	_worker_state["top_k"] = top_k
+
+
+def _search_rotor_order(rotor_order: tuple[int, ...]) -> list[Candidate]:
+	return search_rotor_order(
+		_worker_state["engine"],
+		_worker_state["ctx"],
+		rotor_order,
+		_worker_state["plan"],
+		_worker_state["top_k"],
+	)
+
+
+class PlannedAttack:
+	"""
+	Find the rotor order, starting positions and turnover notches of a message knowing only its ciphertext.
+
+	Like `CiphertextOnlyAttack`, decryptions without plug board are scored by index of coincidence, but the turnover
+	notches are searched too, trying a single key per class of a `SearchPlan`. The shorter the message, the fewer
+	the classes: the cost of searching the notches of a short message is close to that of a single combination.
+
+	The work is split in units, one per rotor order, which are spread across a process pool.
+	"""
+	def __init__(
+		self,
+		ctx: Union[str, np.ndarray],
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		n_rotors: int = N_ROTORS,
+		top_k: int = 10,
+	):
+		"""
+		:param ctx: the ciphertext.
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param int n_rotors: the number of rotors in use.
+		:param int top_k: how many candidates to keep.
+		"""
+		self.ctx = to_indices(ctx) if isinstance(ctx, str) else np.asarray(ctx)
+		self.engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		self.plan = SearchPlan(len(self.ctx), n_rotors)
+		self.n_rotors = n_rotors
+		self.top_k = top_k
+
+	def units(self, shard: int = 0, n_shards: int = 1) -> list[tuple[int, ...]]:
+		"""Get the rotor orders to try, split in shards like `CiphertextOnlyAttack.units`."""
+		if not 0 <= shard < n_shards:
+			raise ValueError(f"shard {shard} does not exist: shards are between 0 and {n_shards-1}")
+		orders = itertools.permutations(range(len(self.engine.rotor_mappings)), self.n_rotors)
+		return list(orders)[shard::n_shards]
+
+	def run(
+		self,
+		n_workers: Optional[int] = None,
+		shard: int = 0,
+		n_shards: int = 1,
+		progress: Optional[Callable[[int, int, float], None]] = None,
+	) -> list[Candidate]:
+		"""
+		Run the attack and return the best candidates, best first. Each one stands for its class of keys,
+		see `search_rotor_order`.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		:param int shard: which shard of the units to process. See `self.units`.
+		:param int n_shards: the number of shards.
+		:param progress: called after every unit with the number of keys covered, the total number of keys,
+		and the elapsed time in seconds. Keys are combinations of starting positions and turnover notches,
+		all the keys of a class being covered at once.
+		"""
+		units = self.units(shard, n_shards)
+		total = len(units) * self.plan.n_keys
+		initargs = (self.engine.rotor_mappings, self.engine.reflector_mapping, self.ctx, self.n_rotors, self.top_k)
+
+		candidates: list[Candidate] = []
+		start = time.perf_counter()
+
+		def collect(results):
+			for done, unit_candidates in enumerate(results, start=1):
+				candidates.extend(unit_candidates)
+				if progress is not None:
+					progress(done * self.plan.n_keys, total, time.perf_counter() - start)
+
+		if n_workers == 1:
+			_init_worker(*initargs)
+			collect(map(_search_rotor_order, units))
+		else:
+			with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+				collect(pool.imap(_search_rotor_order, units))
+
+		return merge_candidates(candidates, self.top_k)
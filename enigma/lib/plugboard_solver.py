@@ -0,0 +1,326 @@
+import itertools
+import multiprocessing
+import random
+import string
+from typing import NamedTuple, Optional, Union
+
+import numpy as np
+
+from .batched import BatchedEnigma, rotor_offsets, to_indices
+from .internals import N_WIRES
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+# A swap changes the plug board on at most this many letters
+MAX_CHANGED_LETTERS = 4
+_PAIRS = np.array(list(itertools.combinations(range(ALPHABET_LENGTH), 2)))
+
+
+class Solution(NamedTuple):
+	"""A plug board found by the solver, as a permutation of the positions, with the score of its decryption."""
+	score: float
+	plug_board: tuple[int, ...]
+
+
+def rotor_core_permutations(
+	engine: BatchedEnigma,
+	rotor_order: tuple[int, ...],
+	starting_positions: tuple[int, ...],
+	turnover_notches: tuple[int, ...],
+	length: int,
+) -> np.ndarray:
+	"""
+	Get the permutation performed by the rotors and the reflector, without the plug board,
+	at each position of a message.
+
+	:return: array of shape (length, 26).
+	"""
+	offsets = rotor_offsets(np.array([starting_positions]), np.array([turnover_notches]), length)[0].astype(np.int64)
+	states = np.zeros(length, dtype=np.int64)
+	for i in reversed(range(len(rotor_order))):
+		states = states * ALPHABET_LENGTH + offsets[:, i]
+	return engine.core_table(list(rotor_order))[states]
+
+
+class _PositionsByLetter:
+	"""The positions of each letter in a text, grouped by letter."""
+	def __init__(self, letters: np.ndarray):
+		self.positions = np.argsort(letters, kind="stable")
+		self.counts = np.bincount(letters, minlength=ALPHABET_LENGTH)
+		self.first = np.cumsum(self.counts) - self.counts
+
+	def entries(self, letters: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+		"""
+		Get the positions of each letter of `letters` where `mask` is set.
+
+		:return: the flat index of the letter in `letters` and the position, for each position.
+		"""
+		counts = np.where(mask, self.counts[letters], 0).ravel()
+		slot = np.repeat(np.arange(counts.size), counts)
+		ends = np.cumsum(counts)
+		index = np.arange(len(slot)) + np.repeat(self.first[letters.ravel()] - ends + counts, counts)
+		return slot, self.positions[index]
+
+
+class PlugBoardSolver:
+	"""
+	Recover the plug board of a message whose rotor settings are known, by hill climbing or simulated annealing.
+
+	With the plug board S and the core permutation E_i at position i, the decryption of letter c_i is
+	S(E_i(S(c_i))), where E_i(S(c_i)) is the middle letter. A swap changes S on at most 4 letters, and
+	tables built for the current plug board turn its change in score into a few lookups, so that
+	`evaluate_many` scores all the swaps of a step at once:
+	- the index of coincidence only depends on the counts of the middle letters, as S permutes them,
+	and a table gives how these counts change when S(x) changes, for every letter x;
+	- the bigram score changes with the relabeling of the middle bigrams, which tables give by first
+	and by second letter, and with the bigrams around a changed ciphertext letter, which are indexed by letter.
+
+	Decryptions are scored by index of coincidence or, given a table of bigram log-probabilities, by the
+	log-probability of their bigrams.
+	"""
+	def __init__(
+		self,
+		ctx: Union[str, np.ndarray],
+		permutations: np.ndarray,
+		bigram_log_probs: Optional[np.ndarray] = None,
+		max_wires: int = N_WIRES,
+	):
+		"""
+		:param ctx: the ciphertext.
+		:param np.ndarray permutations: array of shape (len(ctx), 26), see `rotor_core_permutations`.
+		:param Optional[np.ndarray] bigram_log_probs: array of shape (26, 26), where entry (x, y) is the
+		log-probability of letter y following letter x. If None, the index of coincidence is used.
+		:param int max_wires: the maximum number of wires on the plug board.
+		"""
+		self.ctx = np.asarray(to_indices(ctx) if isinstance(ctx, str) else ctx, dtype=np.int64)
+		if len(permutations) != len(self.ctx):
+			raise ValueError(f"got {len(permutations)} permutations for a ciphertext of length {len(self.ctx)}")
+		self.permutations = np.asarray(permutations, dtype=np.int64)
+		self.bigrams = None if bigram_log_probs is None else np.asarray(bigram_log_probs, dtype=np.float64)
+		self.max_wires = max_wires
+
+		if self.bigrams is None:
+			# Entry (x, u, y): positions of ciphertext letter x whose middle letter is y when S(x) = u
+			self._middle_counts_by_input = np.zeros((ALPHABET_LENGTH,) * 3, dtype=np.int64)
+			np.add.at(
+				self._middle_counts_by_input, (self.ctx[:, None], np.arange(ALPHABET_LENGTH), self.permutations), 1
+			)
+		else:
+			self._bigram_table = self.bigrams.ravel()
+			# The starts j of the bigrams by c_j, and by c_{j + 1}
+			self._bigrams_by_first_letter = _PositionsByLetter(self.ctx[:-1])
+			self._bigrams_by_second_letter = _PositionsByLetter(self.ctx[1:])
+		self.reset(list(range(ALPHABET_LENGTH)))
+
+	def reset(self, plug_board: list[int]):
+		"""Set the current plug board, as a permutation of the positions, and decrypt under it."""
+		self.plug_board = list(plug_board)
+		board = self._board = np.array(self.plug_board)
+		self.middle = self.permutations[np.arange(len(self.ctx)), board[self.ctx]]
+		self.ptx = board[self.middle]
+		self.middle_counts = np.bincount(self.middle, minlength=ALPHABET_LENGTH)
+		if self.bigrams is None:
+			counts_by_input = self._middle_counts_by_input
+			# Entry (x, u): how the middle counts change if S(x) becomes u, zero for u = S(x)
+			self._middle_count_changes = counts_by_input - counts_by_input[np.arange(ALPHABET_LENGTH), board][:, None]
+		else:
+			self.middle_bigram_counts = np.bincount(
+				self.middle[:-1] * ALPHABET_LENGTH + self.middle[1:], minlength=ALPHABET_LENGTH ** 2
+			).reshape(ALPHABET_LENGTH, ALPHABET_LENGTH)
+			# Entry (y, u): how the score of the middle bigrams starting, or ending, with y changes if S(y) becomes u
+			counts, relabeled = self.middle_bigram_counts, self.bigrams[board][:, board]
+			self._row_changes = counts @ self.bigrams[:, board].T - (counts * relabeled).sum(axis=1)[:, None]
+			self._column_changes = counts.T @ self.bigrams[board] - (counts * relabeled).sum(axis=0)[:, None]
+		self.score = self.full_score()
+
+	@property
+	def n_wires(self) -> int:
+		return sum(1 for x, y in enumerate(self.plug_board) if x < y)
+
+	def full_score(self) -> float:
+		"""Score the current decryption from scratch."""
+		if self.bigrams is None:
+			counts = np.bincount(self.ptx, minlength=ALPHABET_LENGTH)
+			return float((counts * (counts - 1)).sum())
+		return float(self.bigrams[self.ptx[:-1], self.ptx[1:]].sum())
+
+	def swap(self, a: int, b: int) -> Optional[dict[int, int]]:
+		"""
+		Get the changes to the plug board that wire `a` to `b`, unplugging their current partners,
+		or that unplug them if they are already wired together.
+
+		Return None if the move would need more than `self.max_wires` wires.
+		"""
+		plug_board = self.plug_board
+		if plug_board[a] == b:
+			return {a: a, b: b}
+
+		changes = {plug_board[a]: plug_board[a], plug_board[b]: plug_board[b], a: b, b: a}
+		n_wires = self.n_wires - (plug_board[a] != a) - (plug_board[b] != b) + 1
+		return changes if n_wires <= self.max_wires else None
+
+	def evaluate(self, changes: dict[int, int]) -> float:
+		"""Compute how the score would change if the plug board was changed, without changing it."""
+		# Pad with an unchanged entry
+		x, padding = next(iter(changes)), MAX_CHANGED_LETTERS - len(changes)
+		letters = list(changes) + [x] * padding
+		inputs = list(changes.values()) + [self.plug_board[x]] * padding
+		return float(self.evaluate_many(np.array([letters]), np.array([inputs]))[0])
+
+	def apply(self, changes: dict[int, int]):
+		"""Apply changes to the plug board, and rebuild the tables for the new one."""
+		plug_board = list(self.plug_board)
+		for x, y in changes.items():
+			plug_board[x] = y
+		self.reset(plug_board)
+
+	def swaps(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+		"""
+		Get every swap of `self.swap` allowed by `self.max_wires`, with the letters it changes.
+
+		:return: the pairs of letters (a, b), of shape (N, 2), and the letters whose plug board entry changes,
+		with their new entries, both of shape (N, 4), as taken by `self.evaluate_many`.
+		"""
+		board = self._board
+		a, b = _PAIRS[:, 0], _PAIRS[:, 1]
+		plugged = board != np.arange(ALPHABET_LENGTH)
+		wired = board[a] == b
+		n_wires = np.where(wired, self.n_wires - 1, self.n_wires - plugged[a] - plugged[b] + 1)
+		allowed = n_wires <= self.max_wires
+		a, b, wired = a[allowed], b[allowed], wired[allowed]
+
+		# Wire a to b and unplug their current partners, or unplug a and b if they are wired together.
+		# Unchanged letters are written as (x, S(x)).
+		letters = np.stack([a, b, np.where(wired, a, board[a]), np.where(wired, b, board[b])], axis=1)
+		inputs = np.stack([np.where(wired, a, b), np.where(wired, b, a), board[a], board[b]], axis=1)
+		return np.stack([a, b], axis=1), letters, inputs
+
+	def evaluate_many(self, letters: np.ndarray, inputs: np.ndarray) -> np.ndarray:
+		"""
+		Compute how the score would change under each of N changes of the plug board, without changing it.
+
+		:param np.ndarray letters: array of shape (N, 4), the letters whose plug board entry changes.
+		:param np.ndarray inputs: array of shape (N, 4), their new entries. Entries of unchanged letters
+		are allowed, as padding.
+		:return: the differences in score, of shape (N,).
+		"""
+		if self.bigrams is None:
+			counts = self._middle_count_changes[letters, inputs].sum(axis=1)
+			return 2 * counts @ self.middle_counts + (counts * counts).sum(axis=1)
+		return self._bigram_deltas(letters, inputs)
+
+	def _bigram_deltas(self, letters: np.ndarray, inputs: np.ndarray) -> np.ndarray:
+		board, table, counts = self._board, self._bigram_table, self.middle_bigram_counts
+		n_boards = len(letters)
+		valid = inputs != board[letters]
+		boards = np.tile(board, (n_boards, 1))
+		rows = np.arange(n_boards)
+		for k in range(MAX_CHANGED_LETTERS):
+			boards[rows[valid[:, k]], letters[valid[:, k], k]] = inputs[valid[:, k], k]
+		changed = boards != board
+
+		# Middle bigrams that keep their middle letters, relabeled by the new plug board: the rows and the columns
+		# of each changed letter, then the bigrams of two changed letters, counted in both
+		delta = (self._row_changes[letters, inputs] + self._column_changes[letters, inputs]).sum(axis=1)
+		y, z = letters[:, :, None], letters[:, None, :]
+		new_y, new_z = inputs[:, :, None], inputs[:, None, :]
+		old_y, old_z = board[y], board[z]
+		delta += (counts[y, z] * (
+			table[new_y * ALPHABET_LENGTH + new_z] - table[new_y * ALPHABET_LENGTH + old_z]
+			- table[old_y * ALPHABET_LENGTH + new_z] + table[old_y * ALPHABET_LENGTH + old_z]
+		)).sum(axis=(1, 2))
+
+		# Bigrams around a changed ciphertext letter get new middle letters: those starting with one, then those
+		# ending with one and starting with an unchanged one, whose first middle letter is unchanged
+		flat = boards.ravel()
+		slot, starts = self._bigrams_by_first_letter.entries(letters, valid)
+		row = slot // MAX_CHANGED_LETTERS * ALPHABET_LENGTH
+		new_first = self.permutations[starts, inputs.ravel()[slot]]
+		new_second = self.permutations[starts + 1, flat[row + self.ctx[starts + 1]]]
+		new = table[flat[row + new_first] * ALPHABET_LENGTH + flat[row + new_second]]
+		old = table[flat[row + self.middle[starts]] * ALPHABET_LENGTH + flat[row + self.middle[starts + 1]]]
+		delta += np.bincount(slot // MAX_CHANGED_LETTERS, new - old, minlength=n_boards)
+
+		slot, starts = self._bigrams_by_second_letter.entries(letters, valid)
+		row = slot // MAX_CHANGED_LETTERS * ALPHABET_LENGTH
+		keep = ~changed.ravel()[row + self.ctx[starts]]
+		first = flat[row + self.middle[starts]] * ALPHABET_LENGTH
+		new = table[first + flat[row + self.permutations[starts + 1, inputs.ravel()[slot]]]]
+		old = table[first + flat[row + self.middle[starts + 1]]]
+		return delta + np.bincount(slot // MAX_CHANGED_LETTERS, (new - old) * keep, minlength=n_boards)
+
+	def climb(
+		self,
+		rng: random.Random,
+		temperature: float = 0.0,
+		cooling: float = 0.95,
+		max_steps: int = 1000,
+	) -> Solution:
+		"""
+		Improve the current plug board until no swap improves the score. Each step scores every swap at once,
+		then applies one of those that improve the score, at random.
+
+		:param random.Random rng: the source of randomness.
+		:param float temperature: if positive, run simulated annealing: a swap that worsens the score by `d`
+		is accepted with probability `exp(-d / temperature)`, and the temperature is multiplied by `cooling`
+		after every step. The best plug board seen is returned.
+		:param int max_steps: the maximum number of steps.
+		"""
+		generator = np.random.default_rng(rng.getrandbits(64))
+		best = Solution(self.score, tuple(self.plug_board))
+		for _ in range(max_steps):
+			pairs, letters, inputs = self.swaps()
+			deltas = self.evaluate_many(letters, inputs)
+			accepted = deltas > 1e-9
+			if temperature > 0:
+				with np.errstate(over="ignore"):
+					accepted |= generator.random(len(deltas)) < np.exp(deltas / temperature)
+			temperature *= cooling
+			if not accepted.any():
+				if temperature < 1e-3:
+					break
+				continue
+			i = generator.choice(np.flatnonzero(accepted))
+			self.apply(self.swap(*pairs[i]))
+			if self.score > best.score:
+				best = Solution(self.score, tuple(self.plug_board))
+		self.reset(list(best.plug_board))
+		return best
+
+	def random_restart(self, seed: int, temperature: float = 0.0) -> Solution:
+		"""Start from a random plug board with `self.max_wires` wires, then climb."""
+		rng = random.Random(seed)
+		letters = rng.sample(range(ALPHABET_LENGTH), 2 * self.max_wires)
+		plug_board = list(range(ALPHABET_LENGTH))
+		for x, y in zip(letters[::2], letters[1::2]):
+			plug_board[x], plug_board[y] = y, x
+		self.reset(plug_board)
+		return self.climb(rng, temperature=temperature)
+
+	def solve(self, n_restarts: int = 8, n_workers: Optional[int] = None, seed: int = 0, temperature: float = 0.0) -> Solution:
+		"""
+		Run `n_restarts` independent climbs from random plug boards, spread across processes,
+		and return the best solution found. The result only depends on `seed`.
+
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		"""
+		seeds = [seed * n_restarts + i for i in range(n_restarts)]
+		if n_workers == 1:
+			solutions = [self.random_restart(s, temperature) for s in seeds]
+		else:
+			initargs = (self.ctx, self.permutations, self.bigrams, self.max_wires, temperature)
+			with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+				solutions = pool.map(_random_restart, seeds)
+		return max(solutions, key=lambda s: (s.score, [-x for x in s.plug_board]))
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(ctx, permutations, bigrams, max_wires, temperature):
+	_worker_state["solver"] = PlugBoardSolver(np.array(ctx), np.array(permutations), bigrams, max_wires)
+	_worker_state["temperature"] = temperature
+
+
+def _random_restart(seed: int) -> Solution:
+	return _worker_state["solver"].random_restart(seed, _worker_state["temperature"])
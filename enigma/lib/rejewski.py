@@ -0,0 +1,297 @@
+import hashlib
+import itertools
+import multiprocessing
+import string
+import struct
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .batched import BatchedEnigma, to_indices
+from .ciphertext_only import all_starting_positions, letter_states
+from .internals import N_ROTORS
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+HALF_ALPHABET = ALPHABET_LENGTH // 2
+INDICATOR_LENGTH = 6
+
+CATALOG_MAGIC = b"ENIGMARJ"
+CATALOG_VERSION = 1
+# Magic, version, number of rotors, number of available rotors, padding, hash of the machine, number of entries
+CATALOG_HEADER = struct.Struct("<8sBBB5x32sQ")
+
+
+def _partitions(n: int, largest: Optional[int] = None) -> list[tuple[int, ...]]:
+	"""Get the partitions of `n`, as non-increasing tuples."""
+	largest = n if largest is None else largest
+	if n == 0:
+		return [()]
+	return [(part,) + rest for part in range(min(n, largest), 0, -1) for rest in _partitions(n - part, part)]
+
+
+def _structure_code(pair_counts) -> int:
+	"""Encode the number of pairs of cycles of each length 1..13 as one integer."""
+	code = 0
+	for length in reversed(range(1, HALF_ALPHABET + 1)):
+		code = code * (HALF_ALPHABET + 1) + pair_counts[length - 1]
+	return code
+
+
+# The product of two involutions without fixed points has its cycles in pairs of equal length:
+# its cycle structure is a partition of 13, and there are 101 of them
+STRUCTURES = _partitions(HALF_ALPHABET)
+_STRUCTURE_CODES = np.array(sorted(
+	_structure_code([partition.count(length) for length in range(1, HALF_ALPHABET + 1)]) for partition in STRUCTURES
+), dtype=np.int64)
+N_STRUCTURES = len(STRUCTURES)
+
+
+class Setting(NamedTuple):
+	rotor_order: tuple[int, ...]
+	starting_positions: tuple[int, ...]
+
+
+def cycle_lengths(permutations: np.ndarray) -> np.ndarray:
+	"""Get the length of the cycle of every element of each row of a 2-D array of permutations."""
+	permutations = np.asarray(permutations, dtype=np.intp)
+	n_rows, size = permutations.shape
+	# Follow all the cycles at once through a flat array, which is faster than take_along_axis
+	start = np.arange(n_rows * size)
+	flat = (permutations + start[::size, None]).ravel()
+	lengths = np.zeros(n_rows * size, dtype=np.int64)
+	current = flat
+	for length in range(1, size + 1):
+		lengths[(current == start) & (lengths == 0)] = length
+		if lengths.all():
+			break
+		current = flat[current]
+	return lengths.reshape(n_rows, size)
+
+
+def cycle_structure(permutation: Sequence[int]) -> tuple[int, ...]:
+	"""Get the lengths of the cycles of a permutation, longest first, e.g. (10, 10, 3, 3) for a product like AD."""
+	lengths = cycle_lengths(np.asarray([permutation]))[0].tolist()
+	# An element of a cycle of length l is one of l elements of that cycle
+	return tuple(sorted(
+		(length for length in set(lengths) for _ in range(lengths.count(length) // length)), reverse=True
+	))
+
+
+def structure_indices(permutations: np.ndarray) -> np.ndarray:
+	"""
+	Get the index of the cycle structure of each row of a 2-D array of products of two involutions
+	without fixed points, between 0 and `N_STRUCTURES - 1`.
+	"""
+	lengths = cycle_lengths(permutations)
+	codes = np.zeros(len(permutations), dtype=np.int64)
+	for length in reversed(range(1, HALF_ALPHABET + 1)):
+		# Each pair of cycles of this length has 2 * length elements
+		pairs = (lengths == length).sum(axis=1) // (2 * length)
+		codes = codes * (HALF_ALPHABET + 1) + pairs
+	indices = np.searchsorted(_STRUCTURE_CODES, codes)
+	if (indices >= N_STRUCTURES).any() or (_STRUCTURE_CODES[np.minimum(indices, N_STRUCTURES - 1)] != codes).any():
+		raise ValueError("permutations are not products of two involutions without fixed points")
+	return indices
+
+
+def signatures(products: tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+	"""Combine the cycle structures of AD, BE and CF, each an array of shape (K, 26), in one uint32 per row."""
+	ad, be, cf = (structure_indices(product) for product in products)
+	return ((ad * N_STRUCTURES + be) * N_STRUCTURES + cf).astype(np.uint32)
+
+
+def order_signatures(engine: BatchedEnigma, rotor_order: tuple[int, ...], states: np.ndarray) -> np.ndarray:
+	"""
+	Get the signature of every starting position of a rotor order, without plug board.
+
+	:param np.ndarray states: the rotor states of the 6 letters of the indicator, as computed by `letter_states`.
+	"""
+	table = engine.core_table(list(rotor_order))
+	permutations = [table[states[:, i]] for i in range(INDICATOR_LENGTH)]
+	# The i-th letter of the key is enciphered by A_i, so A_{i+3} A_i maps the i-th letter of an indicator
+	# to its (i+3)-th letter. A_i is an involution.
+	products = tuple(
+		np.take_along_axis(permutations[i + 3], permutations[i].astype(np.intp), axis=1) for i in range(3)
+	)
+	return signatures(products)
+
+
+def indicator_products(indicators: Sequence[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+	"""
+	Reconstruct the products AD, BE and CF from indicators, i.e., message keys of 3 letters enciphered twice.
+
+	:raises ValueError: if the indicators are inconsistent, or too few to determine the products completely.
+	"""
+	products = [np.full(ALPHABET_LENGTH, -1, dtype=np.int64) for _ in range(3)]
+	for indicator in indicators:
+		positions = to_indices(indicator)
+		if len(positions) != INDICATOR_LENGTH:
+			raise ValueError(f"indicator {indicator} does not have {INDICATOR_LENGTH} letters")
+		for i, product in enumerate(products):
+			x, y = positions[i], positions[i + 3]
+			if product[x] not in (-1, y):
+				raise ValueError(f"indicators are inconsistent: letter {i + 1} of {indicator}")
+			product[x] = y
+
+	for name, product in zip(("AD", "BE", "CF"), products):
+		known = int((product >= 0).sum())
+		if known < ALPHABET_LENGTH:
+			raise ValueError(f"{name} is only known for {known} letters out of {ALPHABET_LENGTH}: more indicators are needed")
+		if len(set(product.tolist())) < ALPHABET_LENGTH:
+			raise ValueError(f"indicators are inconsistent: {name} is not a permutation")
+	return tuple(product[None] for product in products)
+
+
+def machine_hash(rotor_mappings: np.ndarray, reflector_mapping: np.ndarray, turnover_notches: tuple[int, ...]) -> bytes:
+	"""Identify the machine a catalog was built for, so that it is not queried with indicators of another one."""
+	data = b"".join(np.asarray(array, dtype=np.uint8).tobytes() for array in (rotor_mappings, reflector_mapping, turnover_notches))
+	return hashlib.sha256(data).digest()
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(rotor_mappings: np.ndarray, reflector_mapping: np.ndarray, states: np.ndarray):
+	_worker_state["engine"] = BatchedEnigma(rotor_mappings, reflector_mapping)
+	_worker_state["states"] = states
+
+
+def _order_signatures(rotor_order: tuple[int, ...]) -> np.ndarray:
+	return order_signatures(_worker_state["engine"], rotor_order, _worker_state["states"])
+
+
+class CycleCatalog:
+	"""
+	The catalog of cycle structures of Rejewski, Różycki and Zygalski.
+
+	Before 1938, each message key of 3 letters was enciphered twice at the daily setting, giving a 6-letter indicator.
+	With enough messages of a day, the products AD, BE and CF of the permutations enciphering letters 1 and 4,
+	2 and 5, and 3 and 6 are known. Their cycle structures do not depend on the plug board, which only relabels
+	the letters in the cycles. The catalog maps these cycle structures to the rotor orders and starting positions
+	that produce them, so finding the daily rotor settings is a lookup.
+
+	Entries are sorted by signature, so that a query is a binary search.
+	"""
+	def __init__(
+		self,
+		signatures: np.ndarray,
+		orders: np.ndarray,
+		states: np.ndarray,
+		n_available_rotors: int,
+		n_rotors: int,
+		machine: bytes,
+	):
+		self.signatures = signatures
+		self.orders = orders
+		self.states = states
+		self.rotor_orders = list(itertools.permutations(range(n_available_rotors), n_rotors))
+		self.n_available_rotors = n_available_rotors
+		self.n_rotors = n_rotors
+		self.machine = machine
+
+	@classmethod
+	def build(
+		cls,
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		turnover_notches: Optional[tuple[int, ...]] = None,
+		n_rotors: int = N_ROTORS,
+		n_workers: Optional[int] = None,
+	) -> "CycleCatalog":
+		"""
+		Compute the signature of every rotor order and starting position.
+
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors`.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param Optional[tuple[int, ...]] turnover_notches: the turnover notch of each rotor in use. Default is all 0.
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		If 1, everything runs in the current process.
+		"""
+		engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		turnover_notches = tuple(turnover_notches) if turnover_notches is not None else (0,) * n_rotors
+		n_available_rotors = len(engine.rotor_mappings)
+		rotor_orders = list(itertools.permutations(range(n_available_rotors), n_rotors))
+		states = letter_states(n_rotors, turnover_notches, INDICATOR_LENGTH)
+		initargs = (engine.rotor_mappings, engine.reflector_mapping, states)
+
+		if n_workers == 1:
+			_init_worker(*initargs)
+			results = list(map(_order_signatures, rotor_orders))
+		else:
+			with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+				results = pool.map(_order_signatures, rotor_orders)
+
+		all_signatures = np.concatenate(results)
+		n_states = ALPHABET_LENGTH ** n_rotors
+		orders = np.repeat(np.arange(len(rotor_orders), dtype=np.uint8), n_states)
+		positions = np.tile(np.arange(n_states, dtype=np.uint16), len(rotor_orders))
+		by_signature = np.argsort(all_signatures, kind="stable")
+		return cls(
+			all_signatures[by_signature],
+			orders[by_signature],
+			positions[by_signature],
+			n_available_rotors,
+			n_rotors,
+			machine_hash(engine.rotor_mappings, engine.reflector_mapping, turnover_notches),
+		)
+
+	def is_for(
+		self,
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		turnover_notches: Optional[tuple[int, ...]] = None,
+	) -> bool:
+		"""Check whether the catalog was built for a machine. The arguments are those of `build`."""
+		engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		turnover_notches = tuple(turnover_notches) if turnover_notches is not None else (0,) * self.n_rotors
+		return machine_hash(engine.rotor_mappings, engine.reflector_mapping, turnover_notches) == self.machine
+
+	def __len__(self) -> int:
+		return len(self.signatures)
+
+	def lookup(self, signature: int) -> list[Setting]:
+		"""Get the rotor settings with a given signature."""
+		start, stop = np.searchsorted(self.signatures, [signature, signature + 1])
+		positions = all_starting_positions(self.n_rotors)
+		return [
+			Setting(self.rotor_orders[order], tuple(int(p) for p in positions[state]))
+			for order, state in zip(self.orders[start:stop].tolist(), self.states[start:stop].tolist())
+		]
+
+	def query(self, indicators: Sequence[str]) -> list[Setting]:
+		"""
+		Get the rotor settings that produce the cycle structures of the products AD, BE and CF of the indicators.
+
+		:raises ValueError: if the indicators do not determine the products. See `indicator_products`.
+		"""
+		return self.lookup(int(signatures(indicator_products(indicators))[0]))
+
+	def save(self, path: str):
+		"""Write the catalog to a file: 7 bytes per entry, plus a header."""
+		with open(path, "wb") as f:
+			f.write(CATALOG_HEADER.pack(
+				CATALOG_MAGIC, CATALOG_VERSION, self.n_rotors, self.n_available_rotors, self.machine, len(self),
+			))
+			f.write(self.signatures.astype("<u4").tobytes())
+			f.write(self.states.astype("<u2").tobytes())
+			f.write(self.orders.astype(np.uint8).tobytes())
+
+	@classmethod
+	def load(cls, path: str) -> "CycleCatalog":
+		"""Map a catalog written by `save` in memory."""
+		with open(path, "rb") as f:
+			header = f.read(CATALOG_HEADER.size)
+		if len(header) < CATALOG_HEADER.size:
+			raise ValueError(f"{path} is not a catalog of cycle structures")
+		magic, version, n_rotors, n_available_rotors, machine, n_entries = CATALOG_HEADER.unpack(header)
+		if magic != CATALOG_MAGIC or version != CATALOG_VERSION:
+			raise ValueError(f"{path} is not a catalog of cycle structures, or has an unsupported version")
+
+		offset = CATALOG_HEADER.size
+		arrays = []
+		for dtype in ("<u4", "<u2", "u1"):
+			arrays.append(np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n_entries,)))
+			offset += n_entries * np.dtype(dtype).itemsize
+		signatures, states, orders = arrays
+		return cls(signatures, orders, states, n_available_rotors, n_rotors, machine)
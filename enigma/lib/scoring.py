@@ -0,0 +1,180 @@
+import os
+import string
+import struct
+import tempfile
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+NGRAM_MAGIC = b"ENIGMANG"
+NGRAM_VERSION = 1
+# Magic, version, n, then padding so that the table is aligned for float32 access
+NGRAM_HEADER = struct.Struct("<8sBB6x")
+
+TABLE_NAMES = {1: "unigrams", 2: "bigrams", 3: "trigrams", 4: "quadgrams"}
+
+Text = Union[Sequence[int], np.ndarray]
+
+
+def log_probs_from_counts(counts: np.ndarray, floor: float = 0.01) -> np.ndarray:
+	"""
+	Turn an array of n-gram counts, of shape (26,) * n, into log10-probabilities.
+
+	N-grams that were never seen get the probability of `floor` occurrences, so that they are unlikely but possible.
+	"""
+	counts = np.asarray(counts, dtype=np.float64)
+	total = counts.sum()
+	if total == 0:
+		raise ValueError("cannot compute probabilities from empty counts")
+	return np.log10(np.maximum(counts, floor) / total).astype(np.float32)
+
+
+def write_table(path: str, log_probs: np.ndarray):
+	"""Write a table of n-gram log-probabilities, of shape (26,) * n, in the format read by `NgramTable.open`."""
+	log_probs = np.ascontiguousarray(log_probs, dtype="<f4")
+	if log_probs.shape != (ALPHABET_LENGTH,) * log_probs.ndim:
+		raise ValueError(f"n-gram table cannot have shape {log_probs.shape}: every axis must have length {ALPHABET_LENGTH}")
+
+	# Write to a temporary file first, so that other processes never map a partial table
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+	try:
+		with os.fdopen(fd, "wb") as f:
+			f.write(NGRAM_HEADER.pack(NGRAM_MAGIC, NGRAM_VERSION, log_probs.ndim))
+			f.write(log_probs.tobytes())
+		# Tables are meant to be shared, unlike the private files made by `mkstemp`
+		os.chmod(tmp_path, 0o644)
+		os.replace(tmp_path, path)
+	except BaseException:
+		os.unlink(tmp_path)
+		raise
+
+
+def table_path(directory: str, n: int) -> str:
+	"""Get the conventional path of the table of n-grams of length `n` in a directory."""
+	return os.path.join(directory, f"{TABLE_NAMES.get(n, f'{n}-grams')}.bin")
+
+
+class NgramTable:
+	"""
+	A table of n-gram log-probabilities, used to score candidate plaintexts.
+
+	Texts are sequences of positions between 0 and 25, as used by the rotors: higher scores are more
+	language-like. Tables opened from a file are memory-mapped, so that processes using the same file
+	share its pages instead of each holding a copy.
+	"""
+	def __init__(self, log_probs: np.ndarray):
+		"""
+		:param np.ndarray log_probs: array of shape (26,) * n, where entry (x_1, ..., x_n) is the
+		log-probability of the n-gram x_1 ... x_n.
+		"""
+		if log_probs.ndim < 1 or log_probs.shape != (ALPHABET_LENGTH,) * log_probs.ndim:
+			raise ValueError(f"n-gram table cannot have shape {log_probs.shape}: every axis must have length {ALPHABET_LENGTH}")
+		self.n = log_probs.ndim
+		self.log_probs = log_probs
+		self.flat = log_probs.reshape(-1)
+		# Indexing a memoryview gives Python floats, which is much faster than numpy for a few n-grams at a time
+		self._values = memoryview(self.flat).cast("B").cast("f") if self.flat.dtype == np.float32 else None
+		self._weights = ALPHABET_LENGTH ** np.arange(self.n - 1, -1, -1)
+
+	@classmethod
+	def open(cls, path: str) -> "NgramTable":
+		"""Memory-map a table written by `write_table`."""
+		with open(path, "rb") as f:
+			header = f.read(NGRAM_HEADER.size)
+		if len(header) < NGRAM_HEADER.size:
+			raise ValueError(f"{path} is not an n-gram table")
+		magic, version, n = NGRAM_HEADER.unpack(header)
+		if magic != NGRAM_MAGIC or version != NGRAM_VERSION:
+			raise ValueError(f"{path} is not an n-gram table, or has an unsupported version")
+
+		log_probs = np.memmap(path, dtype="<f4", mode="r", offset=NGRAM_HEADER.size, shape=(ALPHABET_LENGTH,) * n)
+		return cls(log_probs)
+
+	def indices(self, texts: np.ndarray) -> np.ndarray:
+		"""
+		Get the index in `self.flat` of every n-gram of each text.
+
+		:param np.ndarray texts: array of shape (..., L) of positions between 0 and 25.
+		:return: array of shape (..., L - n + 1).
+		"""
+		texts = np.asarray(texts)
+		n_grams = texts.shape[-1] - self.n + 1
+		if n_grams <= 0:
+			return np.zeros(texts.shape[:-1] + (0,), dtype=np.intp)
+		indices = texts[..., :n_grams].astype(np.intp) * self._weights[0]
+		for i in range(1, self.n):
+			indices += texts[..., i:i + n_grams] * self._weights[i]
+		return indices
+
+	def score(self, text: Text) -> float:
+		"""Get the log-probability of a text, as the sum of the log-probabilities of its n-grams."""
+		return float(self.flat[self.indices(np.asarray(text))].sum(dtype=np.float64))
+
+	def score_batch(self, texts: np.ndarray) -> np.ndarray:
+		"""
+		Score each row of a 2-D array of candidate decryptions at once.
+
+		:param np.ndarray texts: array of shape (K, L) of positions between 0 and 25.
+		:return: array of shape (K,).
+		"""
+		return self.flat[self.indices(texts)].sum(axis=-1, dtype=np.float64)
+
+	def value(self, index: int) -> float:
+		"""Get the log-probability of the n-gram with index `index` in `self.flat`."""
+		return self._values[index] if self._values is not None else float(self.flat[index])
+
+
+class IncrementalScore:
+	"""
+	The score of a text that changes a few letters at a time.
+
+	Only the n-grams overlapping the changed letters are scored again, so each update costs
+	O(n * changed letters) instead of O(length).
+	"""
+	def __init__(self, table: NgramTable, text: Text):
+		self.table = table
+		self.text = [int(x) for x in text]
+		self.score = table.score(self.text)
+
+	def _starts(self, positions) -> list[int]:
+		"""Get the start of every n-gram containing at least one of `positions`."""
+		last = len(self.text) - self.table.n
+		starts = set()
+		for position in positions:
+			starts.update(range(max(0, position - self.table.n + 1), min(position, last) + 1))
+		return sorted(starts)
+
+	def _sum(self, starts: list[int], changes: dict[int, int]) -> float:
+		n, text, value = self.table.n, self.text, self.table.value
+		total = 0.0
+		for start in starts:
+			index = 0
+			for position in range(start, start + n):
+				index = index * ALPHABET_LENGTH + changes.get(position, text[position])
+			total += value(index)
+		return total
+
+	def delta(self, changes: dict[int, int]) -> float:
+		"""
+		Get the change of score if the letters at the positions of `changes` were replaced by the given letters.
+		The text is not modified.
+		"""
+		starts = self._starts(changes)
+		return self._sum(starts, changes) - self._sum(starts, {})
+
+	def apply(self, changes: dict[int, int], delta: Optional[float] = None) -> float:
+		"""
+		Replace letters of the text, and update the score.
+
+		:param Optional[float] delta: the result of `self.delta(changes)`, if already known.
+		:return: the new score.
+		"""
+		if delta is None:
+			delta = self.delta(changes)
+		for position, x in changes.items():
+			self.text[position] = x
+		self.score += delta
+		return self.score
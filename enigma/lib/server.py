@@ -0,0 +1,302 @@
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import logging
+import string
+import time
+from typing import Optional
+
+from .cache import configuration_key, default_cache
+from .compiled import CompiledEnigma
+from .config import Configuration
+
+INLINE_THRESHOLD = 4096
+MAX_BATCH = 32
+BATCH_DELAY = 0.002
+MAX_IN_FLIGHT = 64
+# Limit of a request line, i.e., roughly of a message
+MAX_LINE = 1 << 24
+
+_ALPHABET = frozenset(string.ascii_lowercase)
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+	"""Keep the latencies of the last requests, and summarize them as percentiles."""
+	def __init__(self, window: int = 10000):
+		self.latencies: collections.deque[float] = collections.deque(maxlen=window)
+		self.count = 0
+
+	def record(self, seconds: float):
+		self.latencies.append(seconds)
+		self.count += 1
+
+	def percentiles(self, ps: tuple[float, ...] = (50, 90, 99)) -> dict[str, float]:
+		"""Get the given percentiles of the recent latencies, in milliseconds."""
+		latencies = sorted(self.latencies)
+		if not latencies:
+			return {f"p{p:g}": 0.0 for p in ps}
+		return {f"p{p:g}": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] for p in ps}
+
+
+class Session:
+	"""The machine of a session, which continues where the previous message ended."""
+	def __init__(self, configuration: Configuration):
+		self.configuration_json = configuration.model_dump_json()
+		self.key = configuration_key(configuration)
+		self.machine = default_cache.machine(configuration)
+
+
+_worker_machines: collections.OrderedDict[str, CompiledEnigma] = collections.OrderedDict()
+
+
+def _encrypt_batch(jobs: list[tuple[str, str, int, str]]) -> list[str]:
+	"""Encrypt messages in a worker process. Each job is a configuration key and JSON, a machine position, and a text."""
+	results = []
+	for key, configuration_json, position, text in jobs:
+		machine = _worker_machines.get(key)
+		if machine is None:
+			machine = default_cache.machine(Configuration.model_validate_json(configuration_json))
+			_worker_machines[key] = machine
+			if len(_worker_machines) > default_cache.maxsize:
+				_worker_machines.popitem(last=False)
+		_worker_machines.move_to_end(key)
+		machine.position = position
+		results.append(machine.encrypt(text))
+	return results
+
+
+class Batcher:
+	"""
+	Group long messages into batches encrypted by a process pool, so that the event loop never stalls.
+
+	A batch is sent as soon as it is full, or `delay` seconds after its first message.
+	"""
+	def __init__(self, executor: concurrent.futures.Executor, max_batch: int = MAX_BATCH, delay: float = BATCH_DELAY):
+		self.executor = executor
+		self.max_batch = max_batch
+		self.delay = delay
+		self.queue: asyncio.Queue = asyncio.Queue(maxsize=4 * max_batch)
+		self.batches = 0
+		self._task = asyncio.create_task(self._run())
+		# The event loop only keeps weak references to tasks
+		self._in_progress: set[asyncio.Task] = set()
+
+	async def submit(self, session: Session, position: int, text: str) -> str:
+		future = asyncio.get_running_loop().create_future()
+		# Waits when the queue is full, which slows down the clients
+		await self.queue.put(((session.key, session.configuration_json, position, text), future))
+		return await future
+
+	async def _run(self):
+		loop = asyncio.get_running_loop()
+		while True:
+			batch = [await self.queue.get()]
+			deadline = loop.time() + self.delay
+			while len(batch) < self.max_batch:
+				try:
+					batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+				except asyncio.TimeoutError:
+					break
+			self.batches += 1
+			task = asyncio.create_task(self._process(batch))
+			self._in_progress.add(task)
+			task.add_done_callback(self._in_progress.discard)
+
+	async def _process(self, batch):
+		jobs, futures = zip(*batch)
+		try:
+			results = await asyncio.get_running_loop().run_in_executor(self.executor, _encrypt_batch, list(jobs))
+		except Exception as e:
+			for future in futures:
+				if not future.done():
+					future.set_exception(e)
+			return
+		for future, result in zip(futures, results):
+			if not future.done():
+				future.set_result(result)
+
+	def close(self):
+		self._task.cancel()
+
+
+class EncryptionServer:
+	"""
+	A TCP server encrypting messages for many sessions at once.
+
+	Each session has its own machine, built from a `Configuration`: like `Enigma.encrypt`, consecutive messages
+	of a session continue where the previous one ended. Requests and responses are JSON objects, one per line:
+
+	- {"id": 1, "op": "open", "configuration": {...}} -> {"id": 1, "session": 7}
+	- {"id": 2, "op": "encrypt", "session": 7, "text": "hello"} -> {"id": 2, "text": "..."}
+	  ("decrypt" is the same as "encrypt")
+	- {"id": 3, "op": "close", "session": 7} -> {"id": 3}
+	- {"id": 4, "op": "stats"} -> {"id": 4, "sessions": ..., "requests": ..., "latency_ms": {"p50": ...}}
+
+	Failed requests get {"id": ..., "error": "..."}. Sessions belong to the connection that opened them.
+	Requests of a connection are processed concurrently, and responses may come out of order:
+	clients match them by id. Positions in a session are assigned in the order requests arrive.
+
+	Short messages are encrypted on the event loop. Longer ones are batched to a process pool.
+	"""
+	def __init__(
+		self,
+		n_workers: Optional[int] = None,
+		inline_threshold: int = INLINE_THRESHOLD,
+		max_batch: int = MAX_BATCH,
+		batch_delay: float = BATCH_DELAY,
+		max_in_flight: int = MAX_IN_FLIGHT,
+	):
+		"""
+		:param Optional[int] n_workers: the number of worker processes. Default is the number of CPUs.
+		:param int inline_threshold: messages longer than this are encrypted by the worker processes.
+		:param int max_batch: the maximum number of messages sent to a worker at once.
+		:param float batch_delay: how long to wait for more messages before sending a batch, in seconds.
+		:param int max_in_flight: the maximum number of requests of a connection being processed at once.
+		Further requests are not read until one finishes.
+		"""
+		self.n_workers = n_workers
+		self.inline_threshold = inline_threshold
+		self.max_batch = max_batch
+		self.batch_delay = batch_delay
+		self.max_in_flight = max_in_flight
+		self.latency = LatencyTracker()
+		self.sessions: dict[int, Session] = {}
+		self._session_ids = itertools.count(1)
+		self._compiling: dict[str, asyncio.Future] = {}
+		self._server: Optional[asyncio.Server] = None
+		self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+		self._batcher: Optional[Batcher] = None
+
+	async def start(self, host: str = "127.0.0.1", port: int = 0) -> tuple[str, int]:
+		"""Start listening, and return the address of the server. Port 0 picks a free port."""
+		self._executor = concurrent.futures.ProcessPoolExecutor(self.n_workers)
+		self._batcher = Batcher(self._executor, self.max_batch, self.batch_delay)
+		self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_LINE)
+		return self._server.sockets[0].getsockname()[:2]
+
+	async def serve_forever(self):
+		await self._server.serve_forever()
+
+	async def close(self):
+		self._server.close()
+		await self._server.wait_closed()
+		self._batcher.close()
+		self._executor.shutdown(cancel_futures=True)
+
+	async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		in_flight = asyncio.Semaphore(self.max_in_flight)
+		write_lock = asyncio.Lock()
+		sessions: set[int] = set()
+		tasks: set[asyncio.Task] = set()
+		try:
+			while True:
+				await in_flight.acquire()
+				try:
+					line = await reader.readline()
+				except (ValueError, ConnectionError):
+					# The line is too long, or the client is gone
+					in_flight.release()
+					break
+				if not line:
+					in_flight.release()
+					break
+				task = asyncio.create_task(self._respond(line, sessions, writer, write_lock, in_flight))
+				tasks.add(task)
+				task.add_done_callback(tasks.discard)
+			if tasks:
+				await asyncio.gather(*tasks, return_exceptions=True)
+		finally:
+			for session_id in sessions:
+				self.sessions.pop(session_id, None)
+			writer.close()
+
+	async def _respond(self, line: bytes, sessions: set[int], writer: asyncio.StreamWriter, write_lock: asyncio.Lock, in_flight: asyncio.Semaphore):
+		start = time.perf_counter()
+		request_id = None
+		try:
+			request = json.loads(line)
+			request_id = request.get("id")
+			response = await self._dispatch(request, sessions)
+		except (ValueError, KeyError, TypeError) as e:
+			response = {"error": str(e)}
+		except Exception as e:
+			logger.exception("request failed")
+			response = {"error": f"internal error: {e}"}
+		response["id"] = request_id
+
+		try:
+			async with write_lock:
+				writer.write(json.dumps(response).encode("ascii") + b"\n")
+				# Waits when the client does not read its responses
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			self.latency.record(time.perf_counter() - start)
+			in_flight.release()
+
+	async def _dispatch(self, request: dict, sessions: set[int]) -> dict:
+		op = request.get("op")
+		if op == "open":
+			configuration = Configuration.model_validate(request["configuration"])
+			await self._compile(configuration)
+			# Computing the orbit of the rotors takes a few milliseconds too
+			session = await asyncio.get_running_loop().run_in_executor(None, Session, configuration)
+			session_id = next(self._session_ids)
+			self.sessions[session_id] = session
+			sessions.add(session_id)
+			return {"session": session_id}
+		if op in ("encrypt", "decrypt"):
+			return {"text": await self._encrypt(self._session(request, sessions), request["text"])}
+		if op == "close":
+			self._session(request, sessions)
+			sessions.discard(request["session"])
+			del self.sessions[request["session"]]
+			return {}
+		if op == "stats":
+			return {
+				"sessions": len(self.sessions),
+				"requests": self.latency.count,
+				"batches": self._batcher.batches,
+				"latency_ms": self.latency.percentiles(),
+			}
+		raise ValueError(f"operation {op} does not exist: operations are open, encrypt, decrypt, close, stats")
+
+	async def _compile(self, configuration: Configuration):
+		"""
+		Make sure that the table of a configuration is cached.
+
+		Compiling a table takes a while, so it happens in a thread, once, however many sessions wait for it.
+		"""
+		key = configuration_key(configuration)
+		if key not in self._compiling:
+			loop = asyncio.get_running_loop()
+			self._compiling[key] = loop.run_in_executor(None, default_cache.table, configuration)
+		try:
+			await self._compiling[key]
+		finally:
+			self._compiling.pop(key, None)
+
+	def _session(self, request: dict, sessions: set[int]) -> Session:
+		session_id = request.get("session")
+		if session_id not in sessions:
+			raise ValueError(f"session {session_id} is not open on this connection")
+		return self.sessions[session_id]
+
+	async def _encrypt(self, session: Session, text: str) -> str:
+		if not isinstance(text, str):
+			raise ValueError("text must be a string")
+		if len(text) <= self.inline_threshold:
+			return session.machine.encrypt(text)
+
+		# Validate before reserving the letters, so that a failed request leaves the session untouched
+		invalid_characters = ", ".join(set(text) - _ALPHABET)
+		if invalid_characters:
+			raise ValueError(f"plaintext should be lowercase ASCII characters only, invalid characters found: {invalid_characters}")
+		position = session.machine.position
+		session.machine.jump(len(text))
+		return await self._batcher.submit(session, position, text)
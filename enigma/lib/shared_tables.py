@@ -0,0 +1,231 @@
+import hashlib
+import itertools
+import multiprocessing
+import os
+import string
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+import numpy as np
+
+from .batched import BatchedEnigma
+from .internals import N_ROTORS, Enigma, Reflector, Rotor
+
+ALPHABET_LENGTH = len(string.ascii_lowercase)
+
+STORE_MAGIC = b"ENIGMAST"
+STORE_VERSION = 1
+# Magic, version, number of available rotors, number of rotors in use, padding, hash of the wiring
+STORE_HEADER = struct.Struct("<8sBBB5x32s")
+
+
+def wiring_hash(rotor_mappings: np.ndarray, reflector_mapping: np.ndarray) -> bytes:
+	data = np.asarray(rotor_mappings, dtype=np.uint8).tobytes() + np.asarray(reflector_mapping, dtype=np.uint8).tobytes()
+	return hashlib.sha256(data).digest()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+	try:
+		# Only the process that created the block should destroy it
+		return shared_memory.SharedMemory(name=name, track=False)
+	except TypeError:
+		# Before Python 3.13, the block is tracked anyway, and the resource tracker of a process started separately
+		# from the creator would destroy it when that process exits
+		memory = shared_memory.SharedMemory(name=name)
+		if os.name == "posix":
+			resource_tracker.unregister(memory._name, "shared_memory")
+		return memory
+
+
+def _unlink(memory: shared_memory.SharedMemory):
+	# Processes started by the creator share its resource tracker, and may have unregistered the block when
+	# attaching to it: register it again, so that the tracker does not fail when the block is unregistered
+	if os.name == "posix":
+		resource_tracker.register(memory._name, "shared_memory")
+	memory.unlink()
+
+
+class SharedTableStore:
+	"""
+	The core tables of every rotor order, computed once in shared memory, for all the processes of a machine.
+
+	The wiring of `Enigma.available_rotors` and `Reflector.mapping` is random and class-wide: each process that
+	imports the package draws its own. A store is pinned to one explicit wiring, written in the shared block
+	along with the tables, so workers attaching to it get the same wiring as the process that created it.
+	Attaching maps the block without copying it: memory does not grow with the number of workers,
+	and attaching takes a few milliseconds.
+
+	A store can be used wherever a `BatchedEnigma` is only used for its wiring and `core_table`,
+	e.g. by `ciphertext_only.search_rotor_order` or `rejewski.order_signatures`.
+
+	Layout of the block: the header, the rotor wiring (n_available_rotors, 26), the reflector wiring (26,),
+	then the tables, of shape (n_rotor_orders, 26 ** n_rotors, 26), rotor orders in the order
+	of `itertools.permutations`.
+	"""
+	def __init__(self, memory: shared_memory.SharedMemory, owner: bool, writable: bool = False):
+		self.memory = memory
+		self.owner = owner
+		magic, version, n_available_rotors, n_rotors, wiring = STORE_HEADER.unpack_from(memory.buf)
+		if magic != STORE_MAGIC or version != STORE_VERSION:
+			raise ValueError(f"shared memory {memory.name} is not a table store, or has an unsupported version")
+
+		self.n_rotors = n_rotors
+		self.wiring = wiring
+		self.rotor_orders = list(itertools.permutations(range(n_available_rotors), n_rotors))
+		self._index = {order: i for i, order in enumerate(self.rotor_orders)}
+
+		offset = STORE_HEADER.size
+		self.rotor_mappings = np.ndarray((n_available_rotors, ALPHABET_LENGTH), np.uint8, memory.buf, offset)
+		offset += self.rotor_mappings.nbytes
+		self.reflector_mapping = np.ndarray((ALPHABET_LENGTH,), np.uint8, memory.buf, offset)
+		offset += self.reflector_mapping.nbytes
+		self.tables = np.ndarray(
+			(len(self.rotor_orders), ALPHABET_LENGTH ** n_rotors, ALPHABET_LENGTH), np.uint8, memory.buf, offset
+		)
+		if not writable:
+			for array in (self.rotor_mappings, self.reflector_mapping, self.tables):
+				array.flags.writeable = False
+
+	@staticmethod
+	def size(n_available_rotors: int, n_rotors: int) -> int:
+		"""Get the size of the block of a store, in bytes."""
+		n_orders = len(list(itertools.permutations(range(n_available_rotors), n_rotors)))
+		return STORE_HEADER.size + (n_available_rotors + 1 + n_orders * ALPHABET_LENGTH ** n_rotors) * ALPHABET_LENGTH
+
+	@classmethod
+	def create(
+		cls,
+		rotor_mappings: Optional[np.ndarray] = None,
+		reflector_mapping: Optional[np.ndarray] = None,
+		n_rotors: int = N_ROTORS,
+		name: Optional[str] = None,
+		n_workers: Optional[int] = 1,
+	) -> "SharedTableStore":
+		"""
+		Compute the tables of every rotor order into a new block of shared memory.
+
+		The block lives until the creator calls `unlink`, or exits.
+
+		:param Optional[np.ndarray] rotor_mappings: the wiring of the available rotors.
+		Default is the wiring of `Enigma.available_rotors` in this process.
+		:param Optional[np.ndarray] reflector_mapping: the wiring of the reflector. Default is `Reflector.mapping`.
+		:param int n_rotors: the number of rotors in use.
+		:param Optional[str] name: the name of the block. Default is a random one.
+		:param Optional[int] n_workers: the number of worker processes computing the tables, which write them
+		directly in the block. If None, the number of CPUs. Default is 1, i.e., everything runs in this process.
+		"""
+		engine = BatchedEnigma(rotor_mappings, reflector_mapping)
+		n_available_rotors = len(engine.rotor_mappings)
+		memory = shared_memory.SharedMemory(name=name, create=True, size=cls.size(n_available_rotors, n_rotors))
+		try:
+			STORE_HEADER.pack_into(
+				memory.buf, 0, STORE_MAGIC, STORE_VERSION, n_available_rotors, n_rotors,
+				wiring_hash(engine.rotor_mappings, engine.reflector_mapping),
+			)
+			store = cls(memory, owner=True, writable=True)
+			store.rotor_mappings[:] = engine.rotor_mappings
+			store.reflector_mapping[:] = engine.reflector_mapping
+
+			if n_workers == 1:
+				for i, rotor_order in enumerate(store.rotor_orders):
+					store.tables[i] = engine.core_table(list(rotor_order))
+			else:
+				with multiprocessing.Pool(n_workers, initializer=_init_builder, initargs=(memory.name,)) as pool:
+					pool.map(_fill_table, range(len(store.rotor_orders)))
+			store.rotor_mappings.flags.writeable = False
+			store.reflector_mapping.flags.writeable = False
+			store.tables.flags.writeable = False
+		except BaseException:
+			memory.close()
+			_unlink(memory)
+			raise
+		return store
+
+	@classmethod
+	def attach(cls, name: str) -> "SharedTableStore":
+		"""
+		Map the store created under `name`, read-only.
+
+		:raises ValueError: if the wiring in the block does not match the hash in its header.
+		"""
+		store = cls(_attach(name), owner=False)
+		if wiring_hash(store.rotor_mappings, store.reflector_mapping) != store.wiring:
+			store.close()
+			raise ValueError(f"the wiring in shared memory {name} does not match its hash: the store is corrupted")
+		return store
+
+	@property
+	def name(self) -> str:
+		return self.memory.name
+
+	def core_table(self, rotor_order: list[int]) -> np.ndarray:
+		"""
+		Get the table of a rotor order, like `BatchedEnigma.core_table`, without computing or copying it.
+
+		:raises KeyError: if the store was built for fewer rotors in use.
+		"""
+		return self.tables[self._index[tuple(rotor_order)]]
+
+	def pin(self):
+		"""
+		Make this process use the wiring of the store: `Enigma()` and `Reflector()` then build the same machines
+		as in the process that created the store.
+		"""
+		Enigma.available_rotors = [Rotor([int(x) for x in mapping]) for mapping in self.rotor_mappings]
+		Reflector.mapping.clear()
+		Reflector.mapping.update((x, int(y)) for x, y in enumerate(self.reflector_mapping))
+
+	def close(self):
+		"""Unmap the block in this process. Arrays taken from the store must not be used afterwards."""
+		# The arrays are views of the block, which cannot be unmapped while they exist
+		del self.rotor_mappings, self.reflector_mapping, self.tables
+		self.memory.close()
+
+	def unlink(self):
+		"""Destroy the block, once every process has closed it. Only the creator may call it."""
+		if not self.owner:
+			raise ValueError("only the process that created the store can destroy it")
+		_unlink(self.memory)
+
+	def __enter__(self) -> "SharedTableStore":
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+		if self.owner:
+			self.unlink()
+
+
+_worker_store: dict = {}
+
+
+def _init_builder(name: str):
+	# Workers building the store write the tables of their rotor orders directly in the block
+	_worker_store["store"] = SharedTableStore(_attach(name), owner=False, writable=True)
+
+
+def _fill_table(i: int):
+	store = _worker_store["store"]
+	engine = BatchedEnigma(store.rotor_mappings, store.reflector_mapping)
+	store.tables[i] = engine.core_table(list(store.rotor_orders[i]))
+
+
+def init_worker(name: str, pin: bool = True):
+	"""
+	Initializer of pool workers using a store: attach to it, and optionally pin its wiring.
+
+	The store is then available in the worker through `worker_store`.
+	"""
+	store = SharedTableStore.attach(name)
+	if pin:
+		store.pin()
+	_worker_store["store"] = store
+
+
+def worker_store() -> SharedTableStore:
+	"""Get the store attached by `init_worker` in this worker."""
+	try:
+		return _worker_store["store"]
+	except KeyError:
+		raise RuntimeError("no table store in this process: start the pool with initializer=init_worker") from None
@@ -0,0 +1,130 @@
+import mmap
+import re
+import string
+from typing import BinaryIO, Iterable, Iterator, Union
+
+from .compiled import CompiledEnigma
+from .internals import Enigma
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+INVALID_CHARACTER_MODES = ("error", "strip", "pass")
+
+_LETTERS = string.ascii_lowercase.encode("ascii")
+_NON_LETTERS = bytes(b for b in range(256) if b not in _LETTERS)
+_LETTER_RUNS = re.compile(b"[a-z]+")
+
+
+class StreamEncryptor:
+	"""
+	Encrypt a stream of chunks with constant memory, carrying the state of the machine from one chunk to the next.
+
+	The output of the stream is the same as encrypting the concatenation of the chunks at once.
+	Characters outside the alphabet are handled according to the mode:
+	- "error": raise a `ValueError`, like `Enigma.encrypt`;
+	- "strip": drop them from the output;
+	- "pass": copy them to the output unchanged, without stepping the rotors.
+	"""
+	def __init__(self, machine: Union[Enigma, CompiledEnigma], invalid: str = "error", chunk_size: int = DEFAULT_CHUNK_SIZE):
+		"""
+		:param machine: the machine to encrypt with. An `Enigma` is compiled, and kept in sync with the stream.
+		:param str invalid: how to handle characters outside the alphabet, one of `INVALID_CHARACTER_MODES`.
+		:param int chunk_size: the size of the preallocated output buffer. Larger chunks are split.
+		"""
+		if invalid not in INVALID_CHARACTER_MODES:
+			raise ValueError(f"invalid character mode {invalid} does not exist: modes are {', '.join(INVALID_CHARACTER_MODES)}")
+
+		self.machine = machine
+		self.compiled = CompiledEnigma.from_enigma(machine) if isinstance(machine, Enigma) else machine
+		self.invalid = invalid
+		self.chunk_size = chunk_size
+		self._buffer = bytearray(chunk_size)
+		self.n_letters = 0
+
+	def encrypt_chunk(self, chunk: bytes) -> memoryview:
+		"""
+		Encrypt a chunk of at most `self.chunk_size` bytes.
+
+		The result is a view on the output buffer, which is only valid until the next call.
+		"""
+		if len(chunk) > self.chunk_size:
+			raise ValueError(f"chunk of {len(chunk)} bytes does not fit in a buffer of {self.chunk_size} bytes")
+
+		out = memoryview(self._buffer)
+		if self.invalid == "strip":
+			chunk = chunk.translate(None, _NON_LETTERS)
+		elif self.invalid == "error":
+			invalid_characters = chunk.translate(None, _LETTERS)
+			if invalid_characters:
+				found = ", ".join(set(invalid_characters.decode("utf-8", errors="replace")))
+				raise ValueError(f"plaintext should be lowercase ASCII characters only, invalid characters found: {found}")
+
+		if self.invalid == "pass":
+			out[:len(chunk)] = chunk
+			n_letters = 0
+			for run in _LETTER_RUNS.finditer(chunk):
+				n_letters += self.compiled.encrypt_into(run.group(), out[run.start():run.end()])
+		else:
+			n_letters = self.compiled.encrypt_into(chunk, out)
+
+		self.n_letters += n_letters
+		if isinstance(self.machine, Enigma):
+			self.machine.jump(n_letters)
+		return out[:len(chunk)]
+
+	def stream(self, chunks: Iterable[Union[str, bytes]]) -> Iterator[Union[str, bytes]]:
+		"""
+		Encrypt each chunk of an iterable, yielding the encrypted chunks as they are ready.
+
+		Chunks may be strings or bytes, and are yielded back with the same type. Strings are encoded as UTF-8.
+		"""
+		for chunk in chunks:
+			if isinstance(chunk, str):
+				# Splitting may cut multi-byte characters, so decode the whole chunk at once
+				data = chunk.encode("utf-8")
+				pieces = [bytes(self.encrypt_chunk(piece)) for piece in self._split(data)]
+				yield b"".join(pieces).decode("utf-8")
+			else:
+				for piece in self._split(bytes(chunk)):
+					yield bytes(self.encrypt_chunk(piece))
+
+	def _split(self, data: bytes) -> Iterator[bytes]:
+		for start in range(0, len(data), self.chunk_size):
+			yield data[start:start + self.chunk_size]
+
+	def encrypt_file(self, src: BinaryIO, dst: BinaryIO, use_mmap: bool = False) -> int:
+		"""
+		Encrypt the contents of a binary file, writing the output to another one as it is produced.
+
+		:param bool use_mmap: map the input file in memory instead of reading it. Requires a regular file.
+		:return: the number of bytes written.
+		"""
+		written = 0
+		for chunk in _read_chunks(src, self.chunk_size, use_mmap):
+			written += dst.write(self.encrypt_chunk(chunk))
+		return written
+
+
+def _read_chunks(src: BinaryIO, chunk_size: int, use_mmap: bool) -> Iterator[bytes]:
+	if not use_mmap:
+		while chunk := src.read(chunk_size):
+			yield chunk
+		return
+
+	try:
+		mapped = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+	except ValueError:
+		# Empty files can't be mapped
+		return
+	with mapped:
+		for start in range(0, len(mapped), chunk_size):
+			yield mapped[start:start + chunk_size]
+
+
+def encrypt_stream(
+	machine: Union[Enigma, CompiledEnigma],
+	chunks: Iterable[Union[str, bytes]],
+	invalid: str = "error",
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Union[str, bytes]]:
+	"""Encrypt an iterable of chunks, yielding encrypted chunks. See `StreamEncryptor` for more details."""
+	return StreamEncryptor(machine, invalid, chunk_size).stream(chunks)
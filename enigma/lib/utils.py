@@ -18,3 +18,19 @@ def choose_k(L: list[T], k: int) -> list[T]:
 
 def is_a_valid_position(x: int, alphabet_length: int = len(string.ascii_lowercase)) -> bool:
 	return (x >= 0 and x < alphabet_length)
+
+
+def pairings_to_permutation(pairings: list[int], alphabet_length: int = len(string.ascii_lowercase)) -> list[int]:
+	"""
+	Convert a list of positions where two adjacent positions are paired into the corresponding permutation,
+	which swaps the paired positions and leaves the others in place.
+	"""
+	if len(pairings) % 2 != 0:
+		raise ValueError(f"length of pairings cannot be {len(pairings)}: pairings must be even")
+	permutation = list(range(alphabet_length))
+	for x, y in zip(pairings[::2], pairings[1::2]):
+		for position in (x, y):
+			if not is_a_valid_position(position, alphabet_length):
+				raise InvalidPosition(position, alphabet_length)
+		permutation[x], permutation[y] = y, x
+	return permutation
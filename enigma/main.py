@@ -1,14 +1,77 @@
+import argparse
 import logging
 import os
+import sys
 
 from lib import Enigma
+from lib import instrumentation
+from lib.streaming import DEFAULT_CHUNK_SIZE, INVALID_CHARACTER_MODES, StreamEncryptor
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Encrypt with a randomly configured Enigma machine.")
+    parser.add_argument("--input", help="encrypt this file, or standard input if '-', instead of prompting")
+    parser.add_argument("--output", help="write the output to this file instead of standard output")
+    parser.add_argument(
+        "--invalid",
+        choices=INVALID_CHARACTER_MODES,
+        default="error",
+        help="how to handle characters outside the alphabet when encrypting a file",
+    )
+    parser.add_argument("--mmap", action="store_true", help="map the input file in memory instead of reading it")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="size of the chunks to encrypt")
+    return parser.parse_args()
+
+
+def encrypt_file(machine: Enigma, args: argparse.Namespace):
+    encryptor = StreamEncryptor(machine, invalid=args.invalid, chunk_size=args.chunk_size)
+    src = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    dst = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        encryptor.encrypt_file(src, dst, use_mmap=args.mmap and args.input != "-")
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+        if dst is not sys.stdout.buffer:
+            dst.close()
 
 
 if __name__ == "__main__":
+    args = parse_args()
     log_level = os.environ.get("LOG_LEVEL", logging.INFO)
     logging.basicConfig(level=log_level)
 
+    # DEBUG traces the signal path of every letter into the file at ENIGMA_TRACE, or counts calls to each component
+    # like STATS if it is not set
+    mode = instrumentation.mode_for_log_level(log_level)
+    if args.input and mode != "off":
+        sys.exit(
+            f"error: LOG_LEVEL={log_level} is not supported with --input: files are encrypted by the compiled engine, "
+            "which does not go through the instrumented components"
+        )
+    trace_path = os.environ.get("ENIGMA_TRACE")
+    if mode == "trace" and trace_path is None:
+        mode = "counters"
+    trace_file = open(trace_path, "wb") if mode == "trace" else None
+    if trace_file is not None:
+        logging.getLogger(__name__).debug(f"tracing the signal path to {trace_path}")
+    counters = instrumentation.install(mode, trace_file)
+
     machine = Enigma()
-    while True:
-        m = input("Provide input: ")
-        print(machine.encrypt(m))
\ No newline at end of file
+    try:
+        if args.input:
+            encrypt_file(machine, args)
+        else:
+            while True:
+                m = input("Provide input: ")
+                print(machine.encrypt(m))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        if mode == "counters":
+            logging.getLogger(__name__).log(instrumentation.STATS, "\n" + counters.report())
+        instrumentation.uninstall()
+        if trace_file is not None:
+            trace_file.close()
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+from lib.client import load_test
+from lib.config import Configuration
+from lib.server import BATCH_DELAY, INLINE_THRESHOLD, MAX_BATCH, MAX_IN_FLIGHT, EncryptionServer
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve Enigma sessions over TCP, or benchmark a server.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the server")
+    run_parser.add_argument("--host", default="127.0.0.1")
+    run_parser.add_argument("--port", type=int, default=8765)
+    run_parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    run_parser.add_argument("--inline-threshold", type=int, default=INLINE_THRESHOLD,
+                            help="longer messages are encrypted by the worker processes")
+    run_parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="messages sent to a worker at once")
+    run_parser.add_argument("--batch-delay", type=float, default=BATCH_DELAY, help="seconds to wait to fill a batch")
+    run_parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="concurrent requests per connection")
+
+    load_parser = subparsers.add_parser("load", help="send random messages to a server and report latency")
+    load_parser.add_argument("--host", default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=8765)
+    load_parser.add_argument("--configuration", required=True, help="JSON file with the configuration of the sessions")
+    load_parser.add_argument("--sessions", type=int, default=10)
+    load_parser.add_argument("--requests", type=int, default=100, help="requests per session")
+    load_parser.add_argument("--length", type=int, default=100, help="letters per message")
+    load_parser.add_argument("--concurrency", type=int, default=4, help="requests in flight per session")
+    return parser.parse_args()
+
+
+async def serve(args: argparse.Namespace):
+    server = EncryptionServer(args.workers, args.inline_threshold, args.max_batch, args.batch_delay, args.max_in_flight)
+    host, port = await server.start(args.host, args.port)
+    logging.getLogger(__name__).info(f"serving on {host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+async def load(args: argparse.Namespace):
+    with open(args.configuration) as f:
+        configuration = Configuration.model_validate_json(f.read())
+    results = await load_test(
+        args.host, args.port, configuration, args.sessions, args.requests, args.length, args.concurrency,
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", logging.INFO))
+    try:
+        asyncio.run(serve(args) if args.command == "run" else load(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,69 @@
+import random
+import unittest
+
+import numpy as np
+
+from lib.banburismus import Banburismus, decibans, letter_spectra, repeat_counts
+from lib.compiled import CompiledEnigma
+from lib.internals import Enigma
+
+
+class TestRepeats(unittest.TestCase):
+    def test_repeat_counts(self):
+        rng = np.random.default_rng(0)
+        messages = [rng.integers(0, 4, n).astype(np.uint8) for n in (13, 7, 20)]
+        size = 40
+        spectra = letter_spectra(messages, size)
+        counts = repeat_counts(spectra, 0, slice(1, 3), size)
+        for row, second in enumerate(messages[1:]):
+            for offset in range(-len(second) + 1, len(messages[0])):
+                expected = sum(
+                    messages[0][k + offset] == second[k]
+                    for k in range(len(second))
+                    if 0 <= k + offset < len(messages[0])
+                )
+                self.assertEqual(counts[row, offset % size], expected)
+
+    def test_decibans(self):
+        self.assertGreater(decibans(np.array(10), np.array(100)), 0)
+        self.assertLess(decibans(np.array(2), np.array(100)), 0)
+
+
+class TestBanburismus(unittest.TestCase):
+    def setUp(self):
+        # Messages of the same day, the last two started 25 letters apart, the others far away in the period.
+        # Plaintexts use 6 letters, so that repeats in depth are frequent and the test is reliable.
+        machine = Enigma()
+        compiled = CompiledEnigma.from_enigma(machine)
+        rng = random.Random(0)
+        self.messages = []
+        for start in (1000, 5000, 9000, 12000, 200, 225):
+            compiled.position = start
+            self.messages.append(compiled.encrypt("".join(rng.choice("etaoin") for _ in range(400))))
+
+    def attack(self, **kwargs):
+        return Banburismus(self.messages, language_rate=1 / 6, **kwargs)
+
+    def test_finds_depth(self):
+        alignments = self.attack(top_k=3).run(n_workers=1)
+        best = alignments[0]
+        self.assertEqual((best.first, best.second, best.offset), (4, 5, 25))
+        self.assertEqual(best.fast_rotor_offset, 25)
+        self.assertGreater(best.score, 100)
+        self.assertEqual(self.attack(top_k=3).run(n_workers=2), alignments)
+
+    def test_stop_early(self):
+        seen = []
+        alignments = self.attack().run(
+            n_workers=1, stop_at=-1000, progress=lambda done, total, elapsed: seen.append(done)
+        )
+        self.assertEqual(seen, [5])
+        self.assertTrue(alignments)
+
+    def test_too_few_messages(self):
+        with self.assertRaises(ValueError):
+            Banburismus(["abc"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import copy
+import random
+import string
+import unittest
+
+import numpy as np
+
+from lib.internals import Enigma
+from lib.batched import BatchedEnigma, rotor_offsets, to_indices, to_strings
+from lib.compiled import compile_table
+
+
+def key_arrays(machines: list[Enigma]) -> tuple[np.ndarray, ...]:
+    alphabet = string.ascii_lowercase
+    available = Enigma.get_available_rotors()
+    orders = [[available.index(r.rotor) for r in m.rotors] for m in machines]
+    positions = [[r.offset for r in m.rotors] for m in machines]
+    notches = [[r.turnover for r in m.rotors] for m in machines]
+    plug_boards = [[alphabet.index(m.plug_board.mapping[c]) for c in alphabet] for m in machines]
+    return np.array(orders), np.array(positions), np.array(notches), np.array(plug_boards)
+
+
+class TestBatchedEnigma(unittest.TestCase):
+    def setUp(self):
+        self.machines = [Enigma() for _ in range(50)]
+        self.engine = BatchedEnigma()
+
+    def test_same_output_as_enigma(self):
+        msg = "".join(random.choice(string.ascii_lowercase) for _ in range(2000))
+        keys = key_arrays(self.machines)
+        decryptions = to_strings(self.engine.decrypt(msg, *keys))
+        for machine, decryption in zip(self.machines, decryptions):
+            self.assertEqual(decryption, machine.decrypt(msg))
+
+    def test_without_plug_board(self):
+        msg = "attackatdawn"
+        orders, positions, notches, _ = key_arrays(self.machines)
+        decryptions = to_strings(self.engine.decrypt(to_indices(msg), orders, positions, notches))
+        for machine, decryption in zip(self.machines, decryptions):
+            machine.plug_board.mapping = {c: c for c in string.ascii_lowercase}
+            self.assertEqual(decryption, machine.decrypt(msg))
+
+    def test_rotor_offsets_match_stepping(self):
+        _, positions, notches, _ = key_arrays(self.machines[:1])
+        machine = copy.deepcopy(self.machines[0])
+        offsets = rotor_offsets(positions, notches, 1000)[0]
+        for t in range(1000):
+            machine.encrypt("a")
+            self.assertEqual(list(offsets[t]), [r.offset % 26 for r in machine.rotors])
+
+    def test_core_table_matches_compiled_table(self):
+        machine = self.machines[0]
+        orders, _, _, _ = key_arrays([machine])
+        expected = compile_table([r.rotor.mapping for r in machine.rotors], machine.reflector.mapping)
+        self.assertEqual(self.engine.core_table(list(orders[0])).tobytes(), expected)
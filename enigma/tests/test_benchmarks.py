@@ -0,0 +1,29 @@
+import unittest
+
+from benchmarks import compare, result
+
+
+def run_with(**values):
+    return {"results": {name: result(value, "", higher_is_better) for name, (value, higher_is_better) in values.items()}}
+
+
+class TestCompare(unittest.TestCase):
+    def test_throughput_regression(self):
+        baseline = run_with(speed=(100.0, True))
+        self.assertEqual(compare(baseline, run_with(speed=(95.0, True)), 0.1), [])
+        self.assertEqual(compare(baseline, run_with(speed=(85.0, True)), 0.1), ["speed"])
+        self.assertEqual(compare(baseline, run_with(speed=(200.0, True)), 0.1), [])
+
+    def test_cost_regression(self):
+        baseline = run_with(memory=(100.0, False))
+        self.assertEqual(compare(baseline, run_with(memory=(105.0, False)), 0.1), [])
+        self.assertEqual(compare(baseline, run_with(memory=(115.0, False)), 0.1), ["memory"])
+        self.assertEqual(compare(baseline, run_with(memory=(50.0, False)), 0.1), [])
+
+    def test_missing_benchmarks_are_ignored(self):
+        baseline = run_with(speed=(100.0, True), memory=(100.0, False))
+        self.assertEqual(compare(baseline, run_with(memory=(200.0, False)), 0.1), ["memory"])
+
+
+if __name__ == "__main__":
+    unittest.main()
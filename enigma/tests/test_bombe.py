@@ -0,0 +1,61 @@
+import string
+import unittest
+
+from lib.internals import Enigma
+from lib.bombe import Bombe, Menu
+from tests.test_ciphertext_only import PLAINTEXT
+
+
+def index(c: str) -> int:
+    return string.ascii_lowercase.index(c)
+
+
+class TestMenu(unittest.TestCase):
+    def test_edges(self):
+        menu = Menu("abc", "xxbca", 2)
+        self.assertEqual([(e.plain, e.cipher, e.position) for e in menu.edges], [(0, 1, 2), (1, 2, 3), (2, 0, 4)])
+
+    def test_loops(self):
+        # a-b, b-c, c-a form a loop, d-e does not close any
+        menu = Menu("abcd", "bcae", 0)
+        loops = menu.loops()
+        self.assertEqual(len(loops), 1)
+        self.assertEqual(sorted(e.position for e in loops[0]), [0, 1, 2])
+
+    def test_letter_cannot_encrypt_to_itself(self):
+        with self.assertRaises(ValueError):
+            Menu("abc", "xbz", 0)
+
+    def test_crib_must_fit(self):
+        with self.assertRaises(ValueError):
+            Menu("abc", "xyz", 1)
+
+
+class TestBombe(unittest.TestCase):
+    def setUp(self):
+        self.machine = Enigma()
+        for rotor in self.machine.rotors:
+            rotor.set_starting_position(rotor.offset % 26)
+            rotor.set_turnover_notch(0)
+        available = Enigma.get_available_rotors()
+        self.rotor_order = tuple(available.index(r.rotor) for r in self.machine.rotors)
+        self.starting_positions = tuple(r.offset for r in self.machine.rotors)
+        self.steckers = {index(a): index(b) for a, b in self.machine.plug_board.mapping.items()}
+
+        offset = 7
+        ctx = self.machine.encrypt(PLAINTEXT)
+        self.menu = Menu(PLAINTEXT[offset:offset + 30], ctx, offset)
+
+    def test_stops_at_the_key(self):
+        result = Bombe(self.menu).run_order(self.rotor_order)
+        stops = [s for s in result.stops if s.starting_positions == self.starting_positions]
+        self.assertEqual(len(stops), 1)
+        for a, b in stops[0].steckers.items():
+            self.assertEqual(self.steckers[a], b)
+        self.assertGreater(result.seconds, 0)
+
+    def test_parallel_run_reports_every_order(self):
+        orders = [self.rotor_order, self.rotor_order[::-1]]
+        results = list(Bombe(self.menu).run(orders, n_workers=2))
+        self.assertEqual([r.rotor_order for r in results], orders)
+        self.assertIn(self.starting_positions, [s.starting_positions for s in results[0].stops])
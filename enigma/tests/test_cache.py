@@ -0,0 +1,85 @@
+import tempfile
+import unittest
+
+from lib.internals import Enigma
+from lib.cache import TableCache, configuration_key
+from tests.data import test_configuration
+
+
+def with_starting_positions(configuration, positions):
+    configuration = configuration.model_copy(deep=True)
+    for rotor, position in zip(configuration.rotors_in_use, positions):
+        rotor.starting_position = position
+    return configuration
+
+
+class TestFromConfiguration(unittest.TestCase):
+    def test_settings(self):
+        machine = Enigma.from_configuration(test_configuration)
+        self.assertEqual([r.offset for r in machine.rotors], [10, 23, 1])
+        self.assertEqual([r.turnover for r in machine.rotors], [2, 0, 13])
+        self.assertEqual(machine.rotors[0].rotor.mapping, test_configuration.available_rotors[3].permutation)
+        self.assertEqual(machine.plug_board.map("o"), "z")
+        self.assertEqual(machine.reflector.map(10), 25)
+
+    def test_class_wide_wiring_is_untouched(self):
+        reflector = dict(Enigma().reflector.mapping)
+        available_rotors = Enigma.get_available_rotors()
+        Enigma.from_configuration(test_configuration)
+        self.assertEqual(Enigma().reflector.mapping, reflector)
+        self.assertIs(Enigma.get_available_rotors(), available_rotors)
+
+    def test_reproducible(self):
+        a, b = Enigma.from_configuration(test_configuration), Enigma.from_configuration(test_configuration)
+        self.assertEqual(a.encrypt("attackatdawn"), b.encrypt("attackatdawn"))
+        ctx = Enigma.from_configuration(test_configuration).encrypt("again")
+        self.assertEqual(Enigma.from_configuration(test_configuration).decrypt(ctx), "again")
+
+
+class TestTableCache(unittest.TestCase):
+    def test_same_output_as_enigma(self):
+        cache = TableCache()
+        msg = "attackatdawn" * 100
+        self.assertEqual(cache.machine(test_configuration).encrypt(msg), Enigma.from_configuration(test_configuration).encrypt(msg))
+
+    def test_key_ignores_starting_positions(self):
+        other = with_starting_positions(test_configuration, [0, 0, 0])
+        self.assertEqual(configuration_key(other), configuration_key(test_configuration))
+
+    def test_key_ignores_pairing_order(self):
+        other = test_configuration.model_copy(deep=True)
+        pairings = other.plug_board.pairings
+        other.plug_board.pairings = pairings[2:] + pairings[1::-1]
+        self.assertEqual(configuration_key(other), configuration_key(test_configuration))
+
+    def test_key_depends_on_rotor_order(self):
+        other = test_configuration.model_copy(deep=True)
+        other.rotors_in_use = other.rotors_in_use[::-1]
+        self.assertNotEqual(configuration_key(other), configuration_key(test_configuration))
+
+    def test_sessions_share_the_table(self):
+        cache = TableCache()
+        a = cache.machine(test_configuration)
+        b = cache.machine(with_starting_positions(test_configuration, [1, 2, 3]))
+        self.assertIs(a.table, b.table)
+        self.assertEqual(cache.stats["hits"], 1)
+        self.assertEqual(cache.stats["misses"], 1)
+
+        a.encrypt("hello")
+        self.assertEqual(cache.machine(test_configuration).offsets, [10, 23, 1])
+
+    def test_eviction(self):
+        cache = TableCache(maxsize=1)
+        other = test_configuration.model_copy(deep=True)
+        other.rotors_in_use = other.rotors_in_use[::-1]
+        cache.table(test_configuration)
+        cache.table(other)
+        cache.table(test_configuration)
+        self.assertEqual(cache.stats, {"hits": 0, "misses": 3, "evictions": 2, "disk_hits": 0, "size": 1})
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            table = TableCache(directory=directory).table(test_configuration)
+            cache = TableCache(directory=directory)
+            self.assertEqual(cache.table(test_configuration), table)
+            self.assertEqual(cache.stats["disk_hits"], 1)
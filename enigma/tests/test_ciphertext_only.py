@@ -0,0 +1,79 @@
+import string
+import unittest
+
+import numpy as np
+
+from lib.internals import Enigma
+from lib.batched import BatchedEnigma, to_indices
+from lib.ciphertext_only import (
+    CiphertextOnlyAttack,
+    all_starting_positions,
+    decrypt_all_positions,
+    index_of_coincidence,
+    letter_states,
+)
+
+PLAINTEXT = (
+    "theenigmamachinewasusedbythenazisduringthesecondworldwartoencryptwarcommunications"
+    "themachinewasusedalreadybeforethestartofthewarinthenineteenthirtiesthepolishcryptologists"
+    "hadalreadybrokenenigmahoweverbythestartofthewarthegermancryptographershadincreasedits"
+)
+
+
+class TestIndexOfCoincidence(unittest.TestCase):
+    def test_constant_text(self):
+        self.assertAlmostEqual(index_of_coincidence(np.zeros((1, 10), dtype=np.uint8))[0], 1.0)
+
+    def test_all_distinct_letters(self):
+        text = np.arange(26, dtype=np.uint8)[None, :]
+        self.assertAlmostEqual(index_of_coincidence(text)[0], 0.0)
+
+    def test_rows_are_independent(self):
+        texts = np.array([[0, 0, 1, 1], [0, 1, 2, 3]], dtype=np.uint8)
+        np.testing.assert_allclose(index_of_coincidence(texts), [4 / 12, 0.0])
+
+
+class TestCiphertextOnlyAttack(unittest.TestCase):
+    def setUp(self):
+        self.machine = Enigma()
+        self.machine.plug_board.mapping = {c: c for c in string.ascii_lowercase}
+        for rotor in self.machine.rotors:
+            rotor.set_starting_position(rotor.offset % 26)
+            rotor.set_turnover_notch(0)
+        available = Enigma.get_available_rotors()
+        self.rotor_order = tuple(available.index(r.rotor) for r in self.machine.rotors)
+        self.starting_positions = tuple(r.offset for r in self.machine.rotors)
+
+    def test_decrypt_all_positions(self):
+        engine = BatchedEnigma()
+        ctx = to_indices("hello")
+        states = letter_states(3, (0, 0, 0), len(ctx))
+        decryptions = decrypt_all_positions(engine, ctx, self.rotor_order, states)
+        positions = all_starting_positions(3)
+        rows = [0, 1, 700, 17575]
+        expected = engine.decrypt(
+            ctx, np.tile(self.rotor_order, (len(rows), 1)), positions[rows], np.zeros((len(rows), 3), dtype=int)
+        )
+        np.testing.assert_array_equal(decryptions[rows], expected)
+
+    def test_shards_partition_the_units(self):
+        attack = CiphertextOnlyAttack("abc")
+        units = attack.units()
+        self.assertEqual(len(units), 60)
+        sharded = [u for shard in range(7) for u in attack.units(shard, 7)]
+        self.assertEqual(sorted(sharded), sorted(units))
+
+    def test_finds_the_key(self):
+        attack = CiphertextOnlyAttack(self.machine.encrypt(PLAINTEXT), top_k=3)
+        units = attack.units()
+        n_shards = 30
+        shard = units.index(self.rotor_order) % n_shards
+        candidates = attack.run(n_workers=2, shard=shard, n_shards=n_shards)
+
+        self.assertEqual(len(candidates), 3)
+        self.assertEqual(candidates[0].rotor_order, self.rotor_order)
+        self.assertEqual(candidates[0].starting_positions, self.starting_positions)
+
+    def test_sequential_and_parallel_runs_agree(self):
+        attack = CiphertextOnlyAttack(self.machine.encrypt(PLAINTEXT[:80]), top_k=5)
+        self.assertEqual(attack.run(n_workers=1, shard=0, n_shards=20), attack.run(n_workers=2, shard=0, n_shards=20))
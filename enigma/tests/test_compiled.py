@@ -0,0 +1,71 @@
+import copy
+import random
+import string
+import unittest
+
+from lib.internals import Enigma, N_ROTORS
+from lib.compiled import CompiledEnigma, compile_table, orbit, state_index, state_offsets
+
+
+def random_message(length: int) -> str:
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+class TestCompileTable(unittest.TestCase):
+    def test_table_size(self):
+        e = Enigma()
+        table = compile_table([r.rotor.mapping for r in e.rotors], e.reflector.mapping)
+        self.assertEqual(len(table), len(string.ascii_lowercase) ** (N_ROTORS + 1))
+
+    def test_every_state_is_an_involution_without_fixed_points(self):
+        e = Enigma()
+        n = len(string.ascii_lowercase)
+        table = compile_table([r.rotor.mapping for r in e.rotors], e.reflector.mapping)
+        for state in random.sample(range(n ** N_ROTORS), 100):
+            with self.subTest(state=state):
+                permutation = table[state * n:(state + 1) * n]
+                for x in range(n):
+                    self.assertNotEqual(permutation[x], x)
+                    self.assertEqual(permutation[permutation[x]], x)
+
+    def test_state_index_roundtrip(self):
+        for offsets in [[0, 0, 0], [25, 0, 3], [1, 2, 3]]:
+            self.assertEqual(state_offsets(state_index(offsets), len(offsets)), offsets)
+
+    def test_orbit_covers_all_states(self):
+        states = orbit([3, 7, 11], [5, 9, 13])
+        self.assertEqual(len(states), len(string.ascii_lowercase) ** 3)
+        self.assertEqual(len(set(states)), len(states))
+
+
+class TestCompiledEnigma(unittest.TestCase):
+    def setUp(self):
+        self.reference = Enigma()
+        self.compiled = CompiledEnigma.from_enigma(self.reference)
+
+    def test_same_output_as_enigma(self):
+        msg = random_message(5000)
+        self.assertEqual(self.compiled.encrypt(msg), self.reference.encrypt(msg))
+
+    def test_consecutive_messages(self):
+        for length in [0, 1, 26, 700, 20000]:
+            with self.subTest(length=length):
+                msg = random_message(length)
+                self.assertEqual(self.compiled.encrypt(msg), self.reference.encrypt(msg))
+                self.assertEqual(self.compiled.offsets, [r.offset % 26 for r in self.reference.rotors])
+
+    def test_decrypt(self):
+        msg = random_message(1000)
+        compiled = CompiledEnigma.from_enigma(self.reference)
+        self.assertEqual(compiled.decrypt(self.compiled.encrypt(msg)), msg)
+
+    def test_source_machine_is_untouched(self):
+        before = copy.deepcopy(self.reference)
+        self.compiled.encrypt(random_message(100))
+        self.assertEqual(self.reference.encrypt("hello"), before.encrypt("hello"))
+
+    def test_invalid_characters(self):
+        for msg in ["Hello", "hello world", "héllo"]:
+            with self.subTest(msg=msg):
+                with self.assertRaises(ValueError):
+                    self.compiled.encrypt(msg)
@@ -0,0 +1,121 @@
+import random
+import unittest
+
+import numpy as np
+
+from lib.config import PADDING, Configuration, ConfigurationArrays, validate_many
+from tests.data import test_configuration
+
+
+def to_arrays(datas, max_wires=13):
+    """Convert configurations in the JSON form to arrays."""
+    def padded(pairings, length):
+        return pairings + [PADDING] * (length - len(pairings))
+
+    def rotors(field):
+        return np.array([[r[field] for r in d["rotors_in_use"]] for d in datas])
+
+    return ConfigurationArrays(
+        np.array([[r["permutation"] for r in d["available_rotors"]] for d in datas]),
+        rotors("type"),
+        rotors("starting_position"),
+        rotors("turnover_notch"),
+        np.array([padded(d["plug_board"]["pairings"], 2 * max_wires) for d in datas]),
+        np.array([padded(d["reflector"]["pairings"], 26) for d in datas]),
+    )
+
+
+def corrupt(rng, data):
+    """Change one field of a configuration in the JSON form, possibly making it invalid."""
+    field = rng.choice(["rotor", "type", "position", "notch", "plug_board", "reflector"])
+    if field == "rotor":
+        permutation = data["available_rotors"][rng.randrange(5)]["permutation"]
+        permutation[rng.randrange(26)] = rng.choice([rng.randrange(26), -1, 26])
+    elif field in ("type", "position", "notch"):
+        name = {"type": "type", "position": "starting_position", "notch": "turnover_notch"}[field]
+        data["rotors_in_use"][rng.randrange(3)][name] = rng.choice([rng.randrange(5), -1, 26, rng.randrange(26)])
+    else:
+        pairings = data[field]["pairings"]
+        if pairings and rng.random() < 0.3:
+            pairings.pop(rng.randrange(len(pairings)))
+        elif pairings:
+            pairings[rng.randrange(len(pairings))] = rng.choice([rng.randrange(26), -2, 26])
+    return data
+
+
+def is_valid(data):
+    try:
+        Configuration.model_validate(data).reflector_maps_all_and_only_rotor_positions()
+    except ValueError:
+        return False
+    return True
+
+
+class TestConfig(unittest.TestCase):
+    def test_valid(self):
+        arrays = to_arrays([test_configuration.model_dump()] * 3)
+        validation = validate_many(arrays)
+        self.assertTrue(validation.valid.all())
+        self.assertEqual(validation.invalid_rows(), {})
+        self.assertEqual(arrays.configuration(1), test_configuration)
+
+        shared = arrays._replace(available_rotors=arrays.available_rotors[0], reflectors=arrays.reflectors[0])
+        self.assertTrue(validate_many(shared).valid.all())
+        self.assertEqual(shared.configuration(2), test_configuration)
+        self.assertEqual(list(shared.configurations()), [test_configuration] * 3)
+
+    def test_configurations_are_independent(self):
+        arrays = to_arrays([test_configuration.model_dump()] * 2)
+        shared = arrays._replace(available_rotors=arrays.available_rotors[0], reflectors=arrays.reflectors[0])
+        first, second = shared.configurations()
+        first.available_rotors[0].permutation.reverse()
+        first.rotors_in_use[0].starting_position += 1
+        first.reflector.pairings.pop()
+        self.assertEqual(second, test_configuration)
+
+    def test_agrees_with_validators(self):
+        rng = random.Random(0)
+        datas = [corrupt(rng, test_configuration.model_dump()) for _ in range(300)]
+        # The bulk check only takes well-formed arrays: rotors of the same size, and at most 13 wires
+        datas = [
+            d for d in datas
+            if len({len(r["permutation"]) for r in d["available_rotors"]}) == 1 and len(d["plug_board"]["pairings"]) <= 26
+        ]
+        arrays = to_arrays(datas)
+        validation = validate_many(arrays)
+        for i, data in enumerate(datas):
+            with self.subTest(i=i, reasons=validation.reasons(i)):
+                self.assertEqual(bool(validation.valid[i]), is_valid(data))
+        self.assertTrue(0 < validation.valid.sum() < len(datas))
+
+    def test_reasons(self):
+        arrays = to_arrays([test_configuration.model_dump()] * 6)
+        arrays.rotor_types[1, 0] = arrays.rotor_types[1, 1]
+        arrays.starting_positions[2, 2] = 26
+        arrays.plug_boards[3, 0] = PADDING
+        arrays.reflectors[4, :2] = PADDING
+        arrays.available_rotors[5, 0, :2] = 0
+        self.assertEqual(validate_many(arrays).invalid_rows(), {
+            1: ["rotor_used_twice"],
+            2: ["invalid_starting_position"],
+            3: ["plug_board_odd_length"],
+            4: ["reflector_incomplete"],
+            5: ["rotor_not_a_permutation"],
+        })
+        with self.assertRaises(ValueError):
+            validate_many(arrays._replace(plug_boards=arrays.plug_boards[:, 1:]))
+
+    def test_trusted(self):
+        data = test_configuration.model_dump()
+        configuration = Configuration.trusted(
+            [r["permutation"] for r in data["available_rotors"]],
+            [(r["type"], r["starting_position"], r["turnover_notch"]) for r in data["rotors_in_use"]],
+            data["plug_board"]["pairings"],
+            data["reflector"]["pairings"],
+        )
+        self.assertEqual(configuration, test_configuration)
+        self.assertEqual(configuration.model_dump(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from lib.corpus import NgramCounter, blocks, count_ngrams, normalize
+from lib.scoring import NgramTable, table_path
+from tests.test_ciphertext_only import PLAINTEXT
+
+GERMAN = "Über die Brücke läuft ein großer Bär. Die Größe des Flusses ist äußerst überraschend! "
+
+
+class TestNormalize(unittest.TestCase):
+    def test_ascii(self):
+        self.assertEqual(normalize(b"Hello, World! 123"), b"helloworld")
+
+    def test_german(self):
+        self.assertEqual(normalize("Grüße aus Köln, Äpfel".encode()), b"gruesseauskoelnaepfel")
+
+    def test_accents(self):
+        self.assertEqual(normalize("Café crème à Noël".encode()), b"cafecremeanoel")
+
+
+class TestBlocks(unittest.TestCase):
+    def test_never_split_characters(self):
+        data = GERMAN.encode()
+        bounds = blocks(len(data), data, 7)
+        self.assertEqual(bounds[0][0], 0)
+        self.assertEqual(bounds[-1][1], len(data))
+        for start, stop in bounds:
+            data[start:stop].decode()
+
+
+class TestNgramCounter(unittest.TestCase):
+    def write(self, directory, name, text):
+        path = os.path.join(directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_blocks_match_whole_text(self):
+        texts = [GERMAN * 20, "ab", "", PLAINTEXT]
+        expected = normalize("".join(texts).encode())
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [self.write(directory, f"{i}.txt", text) for i, text in enumerate(texts)]
+            for n_workers, block_size in [(1, 5), (1, 1 << 20), (2, 13)]:
+                with self.subTest(n_workers=n_workers, block_size=block_size):
+                    counter = NgramCounter()
+                    counter.add_files(paths, n_workers=n_workers, block_size=block_size)
+                    self.assertEqual(counter.n_letters, len(expected))
+                    self.assertEqual(counter.n_bytes, sum(len(text.encode()) for text in texts))
+                    for n in counter.ns:
+                        np.testing.assert_array_equal(counter.counts[n], count_ngrams(expected, n))
+
+    def test_add_text(self):
+        counter = NgramCounter((2, 3))
+        for word in ["the", "e", "nigma", "machine"]:
+            counter.add_text(word)
+        for n in (2, 3):
+            np.testing.assert_array_equal(counter.counts[n], count_ngrams(b"theenigmamachine", n))
+
+    def test_progress(self):
+        reports = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, "corpus.txt", PLAINTEXT)
+            NgramCounter((2,)).add_files([path], n_workers=1, block_size=100, progress=lambda *args: reports.append(args))
+        self.assertEqual(reports[-1][:2], (len(PLAINTEXT), len(PLAINTEXT)))
+        self.assertEqual(len(reports), -(-len(PLAINTEXT) // 100))
+
+    def test_write_tables(self):
+        counter = NgramCounter((2, 4))
+        counter.add_text(PLAINTEXT)
+        with tempfile.TemporaryDirectory() as directory:
+            counter.write_tables(directory, metadata={"language": "en"})
+            table = NgramTable.open(table_path(directory, 4))
+            self.assertEqual(table.n, 4)
+            with open(os.path.join(directory, "metadata.json")) as f:
+                self.assertEqual(json.load(f)["language"], "en")
+            del table
+
+
+if __name__ == "__main__":
+    unittest.main()
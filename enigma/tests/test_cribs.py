@@ -0,0 +1,57 @@
+import random
+import unittest
+
+import numpy as np
+
+from lib.cribs import CribDragger, from_bitset, menus, to_bitset
+
+
+def brute_force(messages: list[str], crib: str) -> list[tuple[int, int]]:
+    return [
+        (m, offset)
+        for m, message in enumerate(messages)
+        for offset in range(len(message) - len(crib) + 1)
+        if all(c != p for c, p in zip(message[offset:offset + len(crib)], crib))
+    ]
+
+
+class TestCribs(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        # A small alphabet, so that many offsets are ruled out
+        self.messages = ["".join(rng.choice("abcde") for _ in range(rng.randint(0, 60))) for _ in range(30)]
+        self.cribs = ["".join(rng.choice("abcdef") for _ in range(rng.randint(1, 8))) for _ in range(20)]
+        self.dragger = CribDragger(self.messages)
+
+    def test_bitsets(self):
+        mask = np.array([True, False, False, True] * 5 + [True])
+        self.assertEqual(to_bitset(mask), sum(1 << i for i in np.flatnonzero(mask)))
+        np.testing.assert_array_equal(from_bitset(to_bitset(mask), len(mask)), np.flatnonzero(mask))
+
+    def test_placements(self):
+        for placements in self.dragger.drag(self.cribs):
+            expected = brute_force(self.messages, placements.crib)
+            self.assertEqual(list(zip(placements.messages.tolist(), placements.offsets.tolist())), expected)
+            self.assertEqual(self.dragger.count(placements.crib), len(expected))
+
+    def test_crib_spanning_messages(self):
+        dragger = CribDragger(["ab", "ab"])
+        placements = dragger.placements("cd")
+        self.assertEqual(list(zip(placements.messages.tolist(), placements.offsets.tolist())), [(0, 0), (1, 0)])
+        self.assertEqual(len(dragger.placements("cdc")), 0)
+        self.assertEqual(dragger.placements("c").offsets.tolist(), [0, 1, 0, 1])
+
+    def test_invalid_cribs(self):
+        with self.assertRaises(ValueError):
+            self.dragger.placements("")
+        self.assertEqual(len(CribDragger(["abc"]).placements("defgh")), 0)
+        self.assertEqual(len(CribDragger([]).placements("a")), 0)
+
+    def test_menus(self):
+        placements = list(self.dragger.drag(self.cribs[:3]))
+        built = list(menus(self.messages, placements))
+        self.assertEqual(len(built), sum(len(p) for p in placements))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import random
+import unittest
+
+import numpy as np
+
+from lib.batched import BatchedEnigma, to_indices
+from lib.ciphertext_only import decrypt_all_positions, letter_states
+from lib.depth import DepthAttack, letter_counts, orbit_windows
+from lib.internals import Enigma, Reflector
+from tests.test_ciphertext_only import PLAINTEXT
+
+N_ROTORS = 2
+
+
+class TestDepth(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A small machine, so that the whole attack takes a moment
+        cls.rotor_mappings = np.array([rotor.mapping for rotor in Enigma.get_available_rotors()[:3]])
+        mapping = Reflector().mapping
+        cls.reflector_mapping = np.array([mapping[x] for x in range(26)])
+        cls.engine = BatchedEnigma(cls.rotor_mappings, cls.reflector_mapping)
+
+    def test_letter_counts(self):
+        ctx = to_indices(PLAINTEXT[:40])
+        table = self.engine.core_table([1, 2])
+        for notches in [(4, 0), (26, 7)]:
+            sequence, starts = orbit_windows(N_ROTORS, notches, len(ctx))
+            decryptions = decrypt_all_positions(self.engine, ctx, (1, 2), letter_states(N_ROTORS, notches, len(ctx)))
+            expected = np.stack([np.bincount(row, minlength=26) for row in decryptions])
+            np.testing.assert_array_equal(letter_counts(table, ctx, sequence, starts), expected)
+
+    def test_attack(self):
+        rng = random.Random(0)
+        notches = (9, 0)
+        rotor_order = (2, 0)
+        # Messages of different lengths, each from its own starting positions
+        positions = [(rng.randrange(26), rng.randrange(26)) for _ in range(6)]
+        texts = [PLAINTEXT[i * 30:i * 30 + 80 + rng.randrange(20)] for i in range(len(positions))]
+        messages = [
+            self.engine.encrypt(text, np.array([rotor_order]), np.array([p]), np.array([notches]))[0]
+            for text, p in zip(texts, positions)
+        ]
+
+        attack = DepthAttack(
+            messages, self.rotor_mappings, self.reflector_mapping, turnover_notches=notches, n_rotors=N_ROTORS, top_k=3
+        )
+        candidates = attack.run(n_workers=2)
+        self.assertEqual(len(candidates), 3)
+        best = candidates[0]
+        self.assertEqual(best.rotor_order, rotor_order)
+        self.assertGreaterEqual(sum(p == q for p, q in zip(best.starting_positions, positions)), 5)
+        self.assertEqual(attack.run(n_workers=1), candidates)
+
+    def test_no_messages(self):
+        with self.assertRaises(ValueError):
+            DepthAttack([])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+from multiprocessing.connection import Client
+
+import numpy as np
+
+from lib.batched import BatchedEnigma
+from lib.ciphertext_only import CiphertextOnlyAttack
+from lib.distributed import KeySearchCoordinator, all_turnover_notches, run_worker
+from lib.internals import Enigma, Reflector
+from tests.test_ciphertext_only import PLAINTEXT
+
+N_ROTORS = 2
+NOTCHES = [(3, 0), (11, 0), (20, 0)]
+
+
+class TestKeySearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A small machine, so that the whole search takes a moment
+        cls.rotor_mappings = np.array([rotor.mapping for rotor in Enigma.get_available_rotors()[:3]])
+        mapping = Reflector().mapping
+        cls.reflector_mapping = np.array([mapping[x] for x in range(26)])
+        engine = BatchedEnigma(cls.rotor_mappings, cls.reflector_mapping)
+        cls.ctx = engine.encrypt(PLAINTEXT, np.array([[2, 0]]), np.array([[7, 19]]), np.array([NOTCHES[1]]))[0]
+
+    def coordinator(self, **kwargs):
+        return KeySearchCoordinator(
+            self.ctx, self.rotor_mappings, self.reflector_mapping, n_rotors=N_ROTORS, turnover_notches=NOTCHES, top_k=5, **kwargs
+        )
+
+    def test_all_turnover_notches(self):
+        notches = all_turnover_notches(3)
+        self.assertEqual(len(notches), 26 ** 2)
+        self.assertTrue(all(n[-1] == 0 for n in notches))
+
+    def test_matches_ciphertext_only_attack(self):
+        candidates = self.coordinator().run(n_local_workers=2)
+        self.assertEqual(candidates[0][1:], ((2, 0), (7, 19), NOTCHES[1]))
+
+        for notches in NOTCHES:
+            attack = CiphertextOnlyAttack(self.ctx, self.rotor_mappings, self.reflector_mapping, notches, n_rotors=N_ROTORS, top_k=5)
+            expected = [c._replace(turnover_notches=notches) for c in attack.run(n_workers=1)]
+            for candidate in expected:
+                if candidate.score > candidates[-1].score:
+                    self.assertIn(candidate, candidates)
+
+    def test_worker_stats(self):
+        coordinator = self.coordinator()
+        coordinator.run(n_local_workers=2)
+        stats = coordinator.stats
+        self.assertEqual(sum(s.units for s in stats.values()), len(coordinator.units))
+        self.assertEqual(sum(s.keys for s in stats.values()), len(coordinator.units) * 26 ** N_ROTORS)
+        self.assertTrue(all(s.keys_per_second > 0 for s in stats.values()))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "search.json")
+            expected = self.coordinator(checkpoint=checkpoint).run(n_local_workers=1)
+
+            # Forget some units, as if the search had been interrupted
+            with open(checkpoint) as f:
+                state = json.load(f)
+            forgotten = state["done"][::3]
+            state["done"] = [unit for unit in state["done"] if unit not in forgotten]
+            state["candidates"] = [c for c in state["candidates"] if [c[1], c[3]] not in forgotten]
+            with open(checkpoint, "w") as f:
+                json.dump(state, f)
+
+            coordinator = self.coordinator(checkpoint=checkpoint)
+            self.assertEqual(len(coordinator.done), len(coordinator.units) - len(forgotten))
+            self.assertEqual(coordinator.run(n_local_workers=1), expected)
+            self.assertEqual(sum(s.units for s in coordinator.stats.values()), len(forgotten))
+
+            # A finished search does not start any worker
+            self.assertEqual(self.coordinator(checkpoint=checkpoint).run(n_local_workers=1), expected)
+
+    def test_checkpoint_of_another_search(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "search.json")
+            self.coordinator(checkpoint=checkpoint).run(n_local_workers=1)
+            with self.assertRaises(ValueError):
+                KeySearchCoordinator(self.ctx[:-1], self.rotor_mappings, self.reflector_mapping, n_rotors=N_ROTORS,
+                                     turnover_notches=NOTCHES, checkpoint=checkpoint)
+
+    def test_remote_workers(self):
+        coordinator = self.coordinator()
+        authkey = b"secret"
+        workers = []
+
+        def start_workers(address):
+            for i in range(2):
+                worker = multiprocessing.Process(target=run_worker, args=(address, authkey, f"remote-{i}"))
+                worker.start()
+                workers.append(worker)
+
+        thread = threading.Thread(target=lambda: setattr(self, "result", coordinator.run(
+            n_local_workers=0, authkey=authkey, on_listen=start_workers,
+        )))
+        thread.start()
+        thread.join(timeout=60)
+        for worker in workers:
+            worker.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.result[0][1:], ((2, 0), (7, 19), NOTCHES[1]))
+        self.assertTrue(coordinator.stats)
+        self.assertLessEqual(set(coordinator.stats), {"remote-0", "remote-1"})
+
+    def test_disconnected_worker(self):
+        coordinator = self.coordinator()
+        authkey = b"secret"
+        workers = []
+
+        def start_workers(address):
+            # This worker takes a unit and leaves without finishing it
+            with Client(address, authkey=authkey) as connection:
+                connection.send(("hello", "quitter"))
+                connection.recv()
+                connection.send(("ready", None))
+                message, unit = connection.recv()
+                self.assertEqual(message, "unit")
+            worker = multiprocessing.Process(target=run_worker, args=(address, authkey, "worker"))
+            worker.start()
+            workers.append(worker)
+
+        candidates = coordinator.run(n_local_workers=0, authkey=authkey, on_listen=start_workers)
+        workers[0].join(timeout=10)
+        self.assertEqual(candidates[0][1:], ((2, 0), (7, 19), NOTCHES[1]))
+        self.assertEqual(set(coordinator.stats), {"worker"})
+        self.assertEqual(coordinator.stats["worker"].units, len(coordinator.units))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+
+from lib.fuzz import (
+    ENGINES, LONG_MESSAGE, REFERENCE, Case, DifferentialFuzzer, check_seed, compare, random_case, register_engine, replay,
+    shrink,
+)
+from lib.internals import Enigma
+
+
+class _StuckThirdRotor:
+    """A broken engine: the third rotor never steps."""
+    def __init__(self, configuration):
+        self.machine = Enigma.from_configuration(configuration)
+
+    def encrypt(self, msg):
+        ctx = ""
+        for letter in msg:
+            offsets = [rotor.offset for rotor in self.machine.rotors]
+            ctx += self.machine.encrypt(letter)
+            for rotor, offset in list(zip(self.machine.rotors, offsets))[2:]:
+                rotor.offset = offset
+        return ctx
+
+
+def _sometimes_raises(configuration):
+    if len(configuration.plug_board.pairings) > 20:
+        raise RuntimeError("too many wires")
+    return Enigma.from_configuration(configuration)
+
+
+BROKEN_ENGINES = {"stuck-third-rotor": _StuckThirdRotor, "sometimes-raises": _sometimes_raises}
+
+
+class TestFuzz(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engines = list(ENGINES)
+        for name, factory in BROKEN_ENGINES.items():
+            register_engine(name)(factory)
+
+    @classmethod
+    def tearDownClass(cls):
+        for name in BROKEN_ENGINES:
+            del ENGINES[name]
+
+    def test_engines_agree(self):
+        engines = self.engines
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                report = check_seed(seed, engines, max_length=2 * LONG_MESSAGE)
+                self.assertEqual(report.mismatches, [])
+                self.assertEqual(set(report.stats), set(engines))
+
+    def test_random_case(self):
+        self.assertEqual(random_case(3), random_case(3))
+        cases = [random_case(seed) for seed in range(50)]
+        self.assertTrue(any(case.n_letters >= LONG_MESSAGE for case in cases))
+        self.assertTrue(any(len(case.messages) > 1 for case in cases))
+        self.assertEqual({len(case.configuration.rotors_in_use) for case in cases}, {1, 2, 3})
+        self.assertEqual(Case.from_json(cases[0].to_json()), cases[0])
+
+    def test_shrink(self):
+        mismatch = next(
+            mismatch for mismatch, _ in (compare("stuck-third-rotor", random_case(seed)) for seed in range(200))
+            if mismatch is not None and mismatch.index > 100
+        )
+        shrunk = shrink(mismatch)
+        # The rotors start right before the second one turns over
+        self.assertEqual(shrunk.case.n_letters, shrunk.index + 1)
+        self.assertLessEqual(shrunk.case.n_letters, 2)
+        self.assertEqual(shrunk.case.configuration.plug_board.pairings, [])
+        self.assertEqual(len(shrunk.case.configuration.available_rotors), 3)
+        self.assertEqual(len(shrunk.case.messages), 1)
+
+        self.assertIsNotNone(replay(shrunk.reproducer()))
+        self.assertIsNone(compare(REFERENCE, shrunk.case)[0])
+
+    def test_engine_errors(self):
+        fuzzer = DifferentialFuzzer(["sometimes-raises"], max_length=100)
+        mismatches = fuzzer.run(range(20), n_workers=1)
+        self.assertTrue(mismatches)
+        for mismatch in mismatches:
+            self.assertEqual(mismatch.index, -1)
+            self.assertIn("too many wires", mismatch.got)
+            # Wires are only dropped while the engine still fails
+            self.assertEqual(len(mismatch.case.configuration.plug_board.pairings), 22)
+            self.assertEqual(mismatch.case.n_letters, 0)
+
+    def test_parallel(self):
+        engines = [REFERENCE, "compiled", "batched"]
+        fuzzer = DifferentialFuzzer(engines, max_length=2 * LONG_MESSAGE)
+        self.assertEqual(fuzzer.run(range(16), n_workers=2), [])
+        self.assertEqual(fuzzer.n_cases, 16)
+        self.assertEqual(fuzzer.n_letters, sum(random_case(seed, 2 * LONG_MESSAGE).n_letters for seed in range(16)))
+        self.assertEqual(fuzzer.stats["compiled"].letters, fuzzer.n_letters)
+        self.assertIn("compiled:", fuzzer.speed_report())
+
+        n_cases = fuzzer.n_cases
+        fuzzer.run(iter(int, 1), n_workers=2, duration=0.5)
+        self.assertGreater(fuzzer.n_cases, n_cases)
+
+        with self.assertRaises(ValueError):
+            DifferentialFuzzer(["nope"])
+
+
+if __name__ == "__main__":
+    unittest.main()
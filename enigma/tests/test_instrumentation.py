@@ -0,0 +1,58 @@
+import copy
+import io
+import logging
+import string
+import unittest
+
+from lib.internals import Enigma, PlugBoard
+from lib import instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        instrumentation.uninstall()
+
+    def test_off_leaves_methods_untouched(self):
+        original = PlugBoard.__dict__["map"]
+        instrumentation.install("counters")
+        self.assertIsNot(PlugBoard.__dict__["map"], original)
+        instrumentation.install("off")
+        self.assertIs(PlugBoard.__dict__["map"], original)
+
+    def test_counters(self):
+        counters = instrumentation.install("counters")
+        Enigma().encrypt("hello")
+        self.assertEqual(counters.calls["plug_board.map"], 10)
+        self.assertEqual(counters.calls["rotor.map"], 15)
+        self.assertEqual(counters.calls["rotor.inverse_map"], 15)
+        self.assertEqual(counters.calls["reflector.map"], 5)
+        self.assertEqual(sum(counters.histograms["rotor.map"].values()), 15)
+        self.assertIn("reflector.map: 5 calls", counters.report())
+
+    def test_trace(self):
+        machine = Enigma()
+        reference = copy.deepcopy(machine)
+        trace_file = io.BytesIO()
+        trace_file.close = lambda: None
+        instrumentation.install("trace", trace_file)
+        ctx = machine.encrypt("hello")
+        instrumentation.uninstall()
+
+        self.assertEqual(ctx, reference.encrypt("hello"))
+        records = list(instrumentation.read_trace(io.BytesIO(trace_file.getvalue())))
+        self.assertEqual(len(records), 5)
+        for record, ptx_letter, ctx_letter in zip(records, "hello", ctx):
+            self.assertEqual(len(record.path), 2 * len(machine.rotors) + 4)
+            self.assertEqual(record.path[0], string.ascii_lowercase.index(ptx_letter))
+            self.assertEqual(record.path[-1], string.ascii_lowercase.index(ctx_letter))
+        self.assertEqual(list(records[-1].offsets), [r.offset for r in machine.rotors])
+
+    def test_trace_requires_a_file(self):
+        with self.assertRaises(ValueError):
+            instrumentation.install("trace")
+
+    def test_mode_for_log_level(self):
+        self.assertEqual(instrumentation.mode_for_log_level("DEBUG"), "trace")
+        self.assertEqual(instrumentation.mode_for_log_level("STATS"), "counters")
+        self.assertEqual(instrumentation.mode_for_log_level(logging.INFO), "off")
+        self.assertEqual(instrumentation.mode_for_log_level("20"), "off")
@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import random
+import string
+import tempfile
+import unittest
+
+from lib.internals import Enigma
+from lib.keysheet import BatchDecryption, Message, group_by_key, load_key_sheet, load_manifest
+from tests.data import test_configuration
+
+
+def key_sheet(n_keys):
+    rng = random.Random(n_keys)
+    sheet = {}
+    for i in range(n_keys):
+        rotors = [
+            rotor.model_copy(update={"starting_position": rng.randrange(26), "turnover_notch": rng.randrange(26)})
+            for rotor in test_configuration.rotors_in_use
+        ]
+        sheet[f"day-{i}"] = test_configuration.model_copy(update={"rotors_in_use": rotors})
+    return sheet
+
+
+class TestKeySheet(unittest.TestCase):
+    def setUp(self):
+        self.sheet = key_sheet(5)
+        rng = random.Random(0)
+        self.messages, self.plaintexts = [], {}
+        for i in range(40):
+            key = rng.choice(list(self.sheet))
+            ptx = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 300)))
+            self.plaintexts[str(i)] = ptx
+            self.messages.append(Message(str(i), key, Enigma.from_configuration(self.sheet[key]).encrypt(ptx)))
+
+    def test_decrypt(self):
+        for n_workers in [1, 2]:
+            with self.subTest(n_workers=n_workers):
+                job = BatchDecryption(self.sheet)
+                output = io.StringIO()
+                stats = job.run(self.messages, output, n_workers=n_workers)
+                results = [json.loads(line) for line in output.getvalue().splitlines()]
+                self.assertEqual({r["id"]: r["text"] for r in results}, self.plaintexts)
+                self.assertEqual(sorted(s.key for s in stats), sorted({m.key for m in self.messages}))
+                self.assertEqual(job.n_messages, 40)
+                self.assertEqual(job.n_letters, sum(len(ptx) for ptx in self.plaintexts.values()))
+                self.assertIn("40 messages", job.report())
+
+    def test_group_by_key(self):
+        groups = group_by_key(self.messages, self.sheet)
+        self.assertEqual(sum(len(group) for group in groups.values()), 40)
+        for key, group in groups.items():
+            self.assertTrue(all(m.key == key for m in group))
+            self.assertEqual([int(m.id) for m in group], sorted(int(m.id) for m in group))
+        with self.assertRaises(KeyError):
+            group_by_key([Message("x", "unknown", "abc")], self.sheet)
+
+    def test_files_and_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "sheet.json"), "w") as f:
+                json.dump({key: configuration.model_dump() for key, configuration in self.sheet.items()}, f)
+            with open(os.path.join(directory, "0.txt"), "w") as f:
+                f.write(self.messages[0].text + "\n")
+            with open(os.path.join(directory, "manifest.jsonl"), "w") as f:
+                f.write(json.dumps({"id": "0", "key": self.messages[0].key, "path": "0.txt"}) + "\n\n")
+                f.write(json.dumps({"id": "1", "key": self.messages[1].key, "text": "Not valid"}) + "\n")
+                f.write(json.dumps({"id": "2", "key": self.messages[2].key, "path": "missing.txt"}) + "\n")
+
+            sheet = load_key_sheet(os.path.join(directory, "sheet.json"))
+            self.assertEqual(sheet, self.sheet)
+            messages = list(load_manifest(os.path.join(directory, "manifest.jsonl")))
+            self.assertEqual(messages[0].path, os.path.join(directory, "0.txt"))
+
+            output = os.path.join(directory, "output.jsonl")
+            stats = BatchDecryption(sheet).decrypt_to_file(messages, output, n_workers=1)
+            with open(output) as f:
+                results = {r["id"]: r for r in map(json.loads, f)}
+        self.assertEqual(results["0"]["text"], self.plaintexts["0"])
+        self.assertIn("invalid characters", results["1"]["error"])
+        self.assertIn("missing.txt", results["2"]["error"])
+        self.assertEqual(sum(s.errors for s in stats), 2)
+
+    def test_invalid_characters(self):
+        ctx = self.messages[0].text
+        grouped = " ".join(ctx[i:i + 5] for i in range(0, len(ctx), 5))
+        output = io.StringIO()
+        BatchDecryption(self.sheet, invalid="strip").run([self.messages[0]._replace(text=grouped)], output, n_workers=1)
+        self.assertEqual(json.loads(output.getvalue())["text"], self.plaintexts["0"])
+
+    def test_manifest_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "manifest.jsonl")
+            for entry in [{"id": "0", "text": "abc"}, {"id": "0", "key": "day-0"}]:
+                with open(path, "w") as f:
+                    f.write(json.dumps(entry) + "\n")
+                with self.assertRaises(ValueError):
+                    list(load_manifest(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import math
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from lib.internals import Enigma
+from lib.keyspace import Key, KeyArrays, KeySpace
+
+
+def random_key(rng, key_space):
+    order = tuple(rng.sample(range(key_space.n_available_rotors), key_space.n_rotors))
+    positions = tuple(rng.randrange(26) for _ in range(key_space.n_rotors))
+    notches = tuple(rng.randrange(26) for _ in range(key_space.n_rotors))
+    letters = rng.sample(range(26), 2 * key_space.n_wires)
+    plug_board = list(range(26))
+    for a, b in zip(letters[::2], letters[1::2]):
+        plug_board[a], plug_board[b] = b, a
+    return Key(order, positions, notches, tuple(plug_board))
+
+
+def stack(keys):
+    return KeyArrays(*(np.array(part) for part in zip(*keys)))
+
+
+class TestKeySpace(unittest.TestCase):
+    def test_size(self):
+        key_space = KeySpace()
+        self.assertEqual(key_space.n_orders, 60)
+        self.assertEqual(key_space.n_plug_boards, 150738274937250)
+        self.assertEqual(key_space.size, 60 * 26 ** 6 * 150738274937250)
+        self.assertEqual(key_space.record_size, 11)
+
+    def test_bijection_on_small_space(self):
+        key_space = KeySpace(n_available_rotors=3, n_rotors=1, n_wires=1)
+        self.assertEqual(key_space.size, 3 * 26 ** 2 * math.comb(26, 2))
+        keys = set()
+        for rank in range(0, key_space.size, 331):
+            key = key_space.unrank(rank)
+            self.assertEqual(key_space.rank(key), rank)
+            keys.add(key)
+        self.assertEqual(len(keys), len(range(0, key_space.size, 331)))
+
+    def test_plug_board_ranks_are_dense(self):
+        key_space = KeySpace(n_wires=2)
+        ranks = np.arange(key_space.n_plug_boards, dtype=np.uint64)
+        plug_boards = key_space.unrank_plug_boards(ranks)
+        self.assertEqual(len({row.tobytes() for row in plug_boards}), key_space.n_plug_boards)
+        np.testing.assert_array_equal(key_space.rank_plug_boards(plug_boards), ranks)
+
+    def test_round_trip(self):
+        rng = random.Random(0)
+        for n_wires in [0, 6, 10, 13]:
+            with self.subTest(n_wires=n_wires):
+                key_space = KeySpace(n_wires=n_wires)
+                keys = [random_key(rng, key_space) for _ in range(200)]
+                ranks = key_space.rank_many(stack(keys))
+                decoded = key_space.unrank_many(*ranks)
+                self.assertEqual([decoded.key(i) for i in range(len(keys))], keys)
+                for key in keys[:10]:
+                    self.assertEqual(key_space.unrank(key_space.rank(key)), key)
+
+    def test_unrank_range(self):
+        key_space = KeySpace()
+        start = key_space.n_plug_boards * 12345 - 3
+        keys = key_space.unrank_range(start, 6)
+        self.assertEqual([keys.key(i) for i in range(6)], [key_space.unrank(start + i) for i in range(6)])
+        self.assertEqual(key_space.unrank(key_space.size - 1), key_space.unrank_range(key_space.size - 1, 1).key(0))
+        with self.assertRaises(ValueError):
+            key_space.unrank_range(key_space.size - 1, 2)
+
+    def test_invalid_keys(self):
+        key_space = KeySpace()
+        key = random_key(random.Random(1), key_space)
+        with self.assertRaises(ValueError):
+            key_space.rank(key._replace(rotor_order=(0, 0, 1)))
+        with self.assertRaises(ValueError):
+            key_space.rank(key._replace(starting_positions=(0, 26, 1)))
+        with self.assertRaises(ValueError):
+            key_space.rank(key._replace(plug_board=tuple(range(26))))
+        with self.assertRaises(ValueError):
+            key_space.rank(key._replace(plug_board=(1,) + key.plug_board[1:]))
+        with self.assertRaises(ValueError):
+            key_space.unrank(key_space.size)
+
+    def test_from_enigma(self):
+        machine = Enigma()
+        for rotor in machine.rotors:
+            rotor.set_turnover_notch(rotor.turnover % 26)
+        key = Key.from_enigma(machine)
+        self.assertEqual(KeySpace().unrank(KeySpace().rank(key)), key)
+
+
+class TestPackedFormat(unittest.TestCase):
+    def test_pack_round_trip(self):
+        key_space = KeySpace()
+        rng = random.Random(2)
+        keys = stack([random_key(rng, key_space) for _ in range(100)])
+        ranks = key_space.rank_many(keys)
+        records = key_space.pack(*ranks)
+        self.assertEqual(records.shape, (100, 11))
+        for unpacked, original in zip(key_space.unpack(records), ranks):
+            np.testing.assert_array_equal(unpacked, original)
+
+    def test_file_round_trip(self):
+        key_space = KeySpace(n_wires=7)
+        rng = random.Random(3)
+        keys = stack([random_key(rng, key_space) for _ in range(50)])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "candidates.keys")
+            key_space.save(path, keys)
+            self.assertEqual(os.path.getsize(path), 16 + 50 * key_space.record_size)
+            loaded_space, loaded = KeySpace.load(path)
+        self.assertEqual(loaded_space.n_wires, 7)
+        for part, original in zip(loaded, keys):
+            np.testing.assert_array_equal(part, original)
+
+
+if __name__ == "__main__":
+    unittest.main()
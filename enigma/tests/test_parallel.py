@@ -0,0 +1,72 @@
+import copy
+import random
+import string
+import unittest
+
+from lib.internals import Enigma, Rotor, ConfiguredRotor
+from lib.compiled import CompiledEnigma
+from lib.parallel import decrypt_window, encrypt_parallel
+
+
+def random_message(length: int) -> str:
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+class TestJump(unittest.TestCase):
+    def test_advance_matches_stepping(self):
+        for n_steps in [0, 1, 25, 26, 27, 100, 1000]:
+            for turnover in [0, 5, 26]:
+                with self.subTest(n_steps=n_steps, turnover=turnover):
+                    stepped, advanced = ConfiguredRotor(Rotor()), ConfiguredRotor(Rotor())
+                    stepped.offset = advanced.offset = random.randint(0, 26)
+                    stepped.turnover = advanced.turnover = turnover
+
+                    turnovers = sum([stepped.step() for _ in range(n_steps)])
+                    self.assertEqual(advanced.advance(n_steps), turnovers)
+                    self.assertEqual(advanced.offset, stepped.offset)
+
+    def test_jump_matches_encryption(self):
+        for n_letters in [0, 1, 26, 676, 17576, 20000]:
+            with self.subTest(n_letters=n_letters):
+                machine = Enigma()
+                jumped = copy.deepcopy(machine)
+                machine.encrypt("a" * n_letters)
+                jumped.jump(n_letters)
+                self.assertEqual(jumped.encrypt("hello"), machine.encrypt("hello"))
+
+    def test_compiled_jump(self):
+        machine = Enigma()
+        compiled = CompiledEnigma.from_enigma(machine)
+        machine.jump(12345)
+        compiled.jump(12345)
+        self.assertEqual(compiled.offsets, [r.offset % 26 for r in machine.rotors])
+
+    def test_cannot_jump_backwards(self):
+        with self.assertRaises(ValueError):
+            Enigma().jump(-1)
+
+
+class TestParallelEncryption(unittest.TestCase):
+    def test_same_output_as_serial(self):
+        msg = random_message(50000)
+        machine = Enigma()
+        reference = copy.deepcopy(machine)
+        self.assertEqual(encrypt_parallel(machine, msg, n_workers=2, chunk_size=7000), reference.encrypt(msg))
+        self.assertEqual(machine.encrypt("continued"), reference.encrypt("continued"))
+
+    def test_single_worker(self):
+        msg = random_message(3000)
+        machine = Enigma()
+        reference = copy.deepcopy(machine)
+        self.assertEqual(encrypt_parallel(machine, msg, n_workers=1, chunk_size=1000), reference.encrypt(msg))
+
+    def test_invalid_characters(self):
+        with self.assertRaises(ValueError):
+            encrypt_parallel(Enigma(), "Hello")
+
+    def test_decrypt_window(self):
+        machine = Enigma()
+        msg = random_message(5000)
+        ctx = copy.deepcopy(machine).encrypt(msg)
+        self.assertEqual(decrypt_window(machine, ctx, 3000, 3100), msg[3000:3100])
+        self.assertEqual(decrypt_window(machine, ctx, 4990), msg[4990:])
@@ -0,0 +1,125 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from lib.batched import BatchedEnigma
+from lib.ciphertext_only import Candidate, index_of_coincidence
+from lib.keyspace import Key, KeySpace
+from lib.pipeline import Decrypt, NgramScorer, Pipeline, Score, TopK, candidate_keys, key_file, key_range
+from lib.scoring import NgramTable, log_probs_from_counts, write_table
+from tests.test_ciphertext_only import PLAINTEXT
+from tests.test_scoring import count_ngrams
+
+KEY = Key((3, 1), (7, 20), (0, 0), tuple(range(26)))
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.key_space = KeySpace(n_rotors=2, n_wires=0)
+        engine = BatchedEnigma()
+        self.ctx = engine.encrypt(
+            PLAINTEXT[:120], np.array([KEY.rotor_order]), np.array([KEY.starting_positions]), np.array([KEY.turnover_notches])
+        )[0]
+        # Every starting position of the rotor order of the key, with its notches
+        self.start = self.key_space.rank(KEY._replace(starting_positions=(0, 0)))
+
+    def keys(self, batch_size=100):
+        return key_range(self.key_space, self.start, 26 ** 2, batch_size)
+
+    def test_key_range(self):
+        batches = list(self.keys())
+        self.assertEqual([batch.size for batch in batches], [100] * 6 + [76])
+        self.assertIn(KEY, [batch.keys.key(i) for batch in batches for i in range(batch.size)])
+
+    def test_executors_agree(self):
+        expected = None
+        for executor in [None, "thread", "process"]:
+            with self.subTest(executor=executor):
+                pipeline = Pipeline(self.keys(), executor=executor, n_workers=2, queue_size=2).then(
+                    Decrypt(self.ctx), Score(index_of_coincidence)
+                )
+                top = TopK(5)
+                list(top.stream(pipeline))
+                self.assertEqual(top.results()[0].key, KEY)
+                if expected is None:
+                    expected = top.results()
+                self.assertEqual(top.results(), expected)
+
+    def test_threshold_and_stats(self):
+        pipeline = Pipeline(self.keys(), executor="thread", n_workers=2).then(
+            Decrypt(self.ctx, plug_boards=False), Score(index_of_coincidence, threshold=0.055)
+        )
+        kept = [batch.keys.key(i) for batch in list(pipeline) for i in range(batch.size)]
+        self.assertIn(KEY, kept)
+        self.assertLess(len(kept), 5)
+        stats = {s.name: s for s in pipeline.stats()}
+        self.assertEqual(list(stats), ["source", "decrypt", "index_of_coincidence"])
+        self.assertEqual(stats["source"].keys_out, 26 ** 2)
+        self.assertEqual(stats["decrypt"].keys_in, stats["decrypt"].keys_out)
+        self.assertEqual(stats["index_of_coincidence"].keys_out, len(kept))
+        self.assertEqual(stats["decrypt"].batches, 7)
+        self.assertGreater(stats["decrypt"].keys_per_second, 0)
+        self.assertIn("decrypt: 7 batches", pipeline.report())
+
+    def test_coarse_then_fine(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trigrams.bin")
+            write_table(path, log_probs_from_counts(count_ngrams(PLAINTEXT, 3)))
+            scorer = NgramScorer(path)
+            self.assertIsNone(pickle.loads(pickle.dumps(scorer))._table)
+
+            coarse = TopK(20)
+            list(coarse.stream(Pipeline(self.keys(), executor=None).then(Decrypt(self.ctx), Score(index_of_coincidence))))
+            fine = Pipeline(candidate_keys(coarse.results()), executor="process", n_workers=2).then(
+                Decrypt(self.ctx), Score(scorer, name="trigrams")
+            )
+            top = TopK(3)
+            entered = list(top.stream(fine))
+            self.assertEqual(top.results()[0].key, KEY)
+            self.assertIn(top.results()[0], entered)
+            self.assertEqual([s.keys_in for s in fine.stats()], [20, 20, 20])
+            expected = NgramTable.open(path).score_batch(BatchedEnigma().decrypt(
+                self.ctx, np.array([KEY.rotor_order]), np.array([KEY.starting_positions]), np.array([KEY.turnover_notches])
+            ))[0]
+            self.assertAlmostEqual(top.results()[0].score, expected, places=3)
+
+    def test_candidate_keys(self):
+        candidates = [Candidate(0.07, (3, 1), (7, 20)), Candidate(0.05, (0, 2), (1, 1), (4, 5))]
+        batch, = candidate_keys(candidates, turnover_notches=(0, 0))
+        self.assertEqual(batch.keys.key(0), KEY)
+        self.assertEqual(batch.keys.key(1).turnover_notches, (4, 5))
+
+    def test_key_file(self):
+        batch = next(self.keys(batch_size=50))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "keys.bin")
+            self.key_space.save(path, batch.keys)
+            batches = list(key_file(path, batch_size=20))
+        self.assertEqual([b.size for b in batches], [20, 20, 10])
+        for part, original in zip(zip(*(b.keys for b in batches)), batch.keys):
+            np.testing.assert_array_equal(np.concatenate(part), original)
+
+    def test_top_k(self):
+        top = TopK(2)
+        batch = next(self.keys(batch_size=4))._replace(scores=np.array([1.0, 3.0, 2.0, 3.0]))
+        entered = top.push(batch)
+        self.assertEqual([r.score for r in entered], [3.0, 3.0])
+        self.assertEqual(top.threshold, 3.0)
+        self.assertEqual(top.push(batch), [])
+        # Of equal scores, the first key found comes first
+        self.assertEqual(top.results()[0].key, batch.keys.key(1))
+
+    def test_early_stop(self):
+        pipeline = Pipeline(self.keys(batch_size=10), executor="process", n_workers=2).then(
+            Decrypt(self.ctx), Score(index_of_coincidence)
+        )
+        for batch in pipeline:
+            break
+        self.assertLess(pipeline.stats()[0].batches, 68)
+
+
+if __name__ == "__main__":
+    unittest.main()
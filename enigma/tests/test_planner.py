@@ -0,0 +1,84 @@
+import itertools
+import unittest
+
+import numpy as np
+
+from lib.batched import BatchedEnigma, rotor_offsets
+from lib.ciphertext_only import letter_states
+from lib.planner import PlannedAttack, SearchPlan
+
+PLAINTEXT = (
+    "theenigmamachinewasusedbythenazisduringthesecondworldwartoencryptwarcommunications"
+    "themachinewasusedalreadybeforethestartofthewarinthenineteenthirtiesthepolishcryptologists"
+)
+
+
+def stepping(starting_positions, turnover_notches, length):
+    """Get the rotor states of each key, brute force."""
+    offsets = rotor_offsets(starting_positions, turnover_notches, length).astype(np.int64)
+    return (offsets * 26 ** np.arange(offsets.shape[-1])).sum(axis=-1)
+
+
+class TestSearchPlan(unittest.TestCase):
+    def test_classes_are_exact(self):
+        # Every key of 2 rotors: keys are in the same class if and only if they step the rotors the same way
+        keys = np.array(list(itertools.product(range(26), repeat=4)))
+        for length in [5, 30]:
+            with self.subTest(length=length):
+                plan = SearchPlan(length, n_rotors=2)
+                sequences = stepping(keys[:, :2], keys[:, 2:], length)
+                _, sequences = np.unique(sequences.view(f"V{sequences.strides[0]}"), return_inverse=True)
+                classes = {}
+                for key, sequence in zip(keys.tolist(), sequences.ravel().tolist()):
+                    classes.setdefault(plan.classify(tuple(key[:2]), tuple(key[2:])), set()).add(sequence)
+                self.assertTrue(all(len(sequences) == 1 for sequences in classes.values()))
+                self.assertEqual(len(classes), plan.n_classes)
+                self.assertEqual(len(set(sequences.ravel().tolist())), plan.n_classes)
+
+    def test_reduction(self):
+        plan = SearchPlan(20)
+        self.assertEqual(len(plan.patterns), 39)
+        self.assertGreater(plan.reduction, 400)
+        self.assertEqual(sum(p.keys_per_class for p in plan.patterns) * 26 ** 3, plan.n_keys)
+        # Long messages go through every step of the middle rotor: only the notch of the last rotor is dropped
+        self.assertEqual(SearchPlan(1000).reduction, 26)
+
+    def test_expand(self):
+        plan = SearchPlan(30)
+        for key in [((0, 0, 0), (0, 0, 0)), ((25, 3, 7), (4, 5, 6)), ((10, 25, 1), (11, 0, 9))]:
+            pattern, offsets = plan.classify(*key)
+            keys = list(plan.expand(pattern, offsets))
+            self.assertIn(key, keys)
+            self.assertEqual(len(keys), len(set(keys)))
+            self.assertEqual(len(keys), plan.patterns[pattern].keys_per_class)
+            self.assertTrue(all(plan.classify(*k) == (pattern, offsets) for k in keys))
+            sequences = stepping(np.array([k[0] for k in keys]), np.array([k[1] for k in keys]), 30)
+            self.assertTrue((sequences == sequences[0]).all())
+
+    def test_letter_states(self):
+        plan = SearchPlan(60)
+        for pattern in [0, len(plan.patterns) // 2, len(plan.patterns) - 1]:
+            positions, notches = plan.representatives(pattern)
+            np.testing.assert_array_equal(plan.letter_states(pattern), stepping(positions, notches, 60))
+            rows = [0, 1234, 17575]
+            for row in rows:
+                expected = letter_states(3, tuple(notches[row]), 60)[np.ravel_multi_index(positions[row][::-1], (26,) * 3)]
+                np.testing.assert_array_equal(plan.letter_states(pattern)[row], expected)
+
+
+class TestPlannedAttack(unittest.TestCase):
+    def test_finds_notches(self):
+        engine = BatchedEnigma()
+        rotor_order, positions, notches = (2, 4), (20, 7), (3, 9)
+        ctx = engine.encrypt(PLAINTEXT, np.array([rotor_order]), np.array([positions]), np.array([notches]))[0]
+        attack = PlannedAttack(ctx, n_rotors=2, top_k=3)
+        candidates = attack.run(n_workers=2)
+        self.assertEqual(candidates[0].rotor_order, rotor_order)
+        # Keys stepping the middle rotor near the end of the message decrypt almost the same, and may score a bit better
+        plan = attack.plan
+        classes = [plan.classify(c.starting_positions, c.turnover_notches) for c in candidates]
+        self.assertIn(plan.classify(positions, notches), classes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import random
+import string
+import unittest
+
+import numpy as np
+
+from lib.internals import Enigma
+from lib.batched import BatchedEnigma, to_indices
+from lib.plugboard_solver import PlugBoardSolver, rotor_core_permutations
+from tests.test_ciphertext_only import PLAINTEXT
+
+
+class TestPlugBoardSolver(unittest.TestCase):
+    def setUp(self):
+        self.machine = Enigma()
+        self.machine.plug_board.mapping = {c: c for c in string.ascii_lowercase}
+        self.machine.plug_board.configure(["a", "q", "e", "z", "t", "k"])
+        for rotor in self.machine.rotors:
+            rotor.set_starting_position(rotor.offset % 26)
+            rotor.set_turnover_notch(0)
+        available = Enigma.get_available_rotors()
+        rotor_order = tuple(available.index(r.rotor) for r in self.machine.rotors)
+        starting_positions = tuple(r.offset for r in self.machine.rotors)
+
+        self.ctx = self.machine.encrypt(PLAINTEXT)
+        self.permutations = rotor_core_permutations(BatchedEnigma(), rotor_order, starting_positions, (0, 0, 0), len(self.ctx))
+        self.truth = [string.ascii_lowercase.index(self.machine.plug_board.mapping[c]) for c in string.ascii_lowercase]
+
+        ptx = to_indices(PLAINTEXT)
+        counts = np.ones((26, 26))
+        np.add.at(counts, (ptx[:-1], ptx[1:]), 1)
+        self.bigram_log_probs = np.log(counts / counts.sum(axis=1, keepdims=True))
+
+    def test_true_plug_board_decrypts(self):
+        solver = PlugBoardSolver(self.ctx, self.permutations)
+        solver.reset(self.truth)
+        self.assertEqual("".join(string.ascii_lowercase[x] for x in solver.ptx), PLAINTEXT)
+
+    def test_deltas_match_full_score(self):
+        letters = random.Random(0).sample(range(26), 12)
+        wired = list(range(26))
+        for x, y in zip(letters[::2], letters[1::2]):
+            wired[x], wired[y] = y, x
+        for bigram_log_probs in [None, self.bigram_log_probs]:
+            solver = PlugBoardSolver(self.ctx, self.permutations, bigram_log_probs, max_wires=6)
+            # From an empty plug board, and from one with the maximum number of wires
+            for plug_board in [list(range(26)), wired]:
+                solver.reset(plug_board)
+                pairs, letters, inputs = solver.swaps()
+                deltas = solver.evaluate_many(letters, inputs)
+                before = solver.full_score()
+                for (a, b), delta in zip(pairs, deltas):
+                    with self.subTest(bigrams=bigram_log_probs is not None, plug_board=plug_board, a=a, b=b):
+                        changes = solver.swap(a, b)
+                        self.assertAlmostEqual(solver.evaluate(changes), delta)
+                        solver.apply(changes)
+                        self.assertAlmostEqual(delta, solver.full_score() - before)
+                        self.assertLessEqual(solver.n_wires, solver.max_wires)
+                        solver.reset(plug_board)
+
+    def test_swap_toggles_a_wire(self):
+        solver = PlugBoardSolver(self.ctx, self.permutations)
+        solver.apply(solver.swap(0, 1))
+        self.assertEqual(solver.plug_board[:2], [1, 0])
+        changes = solver.swap(0, 1)
+        self.assertEqual(changes, {0: 0, 1: 1})
+
+    def test_recovers_the_plug_board(self):
+        solver = PlugBoardSolver(self.ctx, self.permutations, self.bigram_log_probs, max_wires=3)
+        solution = solver.solve(n_restarts=8, n_workers=1)
+        self.assertEqual(list(solution.plug_board), self.truth)
+
+    def test_parallel_restarts_are_deterministic(self):
+        solver = PlugBoardSolver(self.ctx, self.permutations, self.bigram_log_probs)
+        self.assertEqual(solver.solve(n_restarts=4, n_workers=1, seed=3), solver.solve(n_restarts=4, n_workers=2, seed=3))
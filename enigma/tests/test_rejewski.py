@@ -0,0 +1,97 @@
+import os
+import random
+import string
+import tempfile
+import unittest
+
+import numpy as np
+
+from lib.batched import BatchedEnigma, to_strings
+from lib.rejewski import N_STRUCTURES, STRUCTURES, CycleCatalog, cycle_structure, indicator_products
+
+N_ROTORS = 2
+NOTCHES = (5, 0)
+
+
+def random_plug_board(rng: random.Random, n_wires: int = 6) -> np.ndarray:
+    letters = rng.sample(range(26), 2 * n_wires)
+    plug_board = np.arange(26)
+    for a, b in zip(letters[::2], letters[1::2]):
+        plug_board[a], plug_board[b] = b, a
+    return plug_board
+
+
+class TestRejewski(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A small machine, so that the catalog takes a moment to build. The wiring is explicit: the one of
+        # `Enigma.available_rotors` and `Reflector.mapping` is drawn again in each process.
+        rng = np.random.default_rng(0)
+        cls.rotor_mappings = np.array([rng.permutation(26) for _ in range(3)])
+        letters = rng.permutation(26)
+        cls.reflector_mapping = np.empty(26, dtype=np.int64)
+        cls.reflector_mapping[letters[::2]], cls.reflector_mapping[letters[1::2]] = letters[1::2], letters[::2]
+        cls.engine = BatchedEnigma(cls.rotor_mappings, cls.reflector_mapping)
+        cls.catalog = CycleCatalog.build(
+            cls.rotor_mappings, cls.reflector_mapping, NOTCHES, n_rotors=N_ROTORS, n_workers=2
+        )
+
+    def indicators(self, rotor_order, starting_positions, n_messages=300, seed=0):
+        """Encrypt doubled message keys at the daily setting, like operators did before 1938."""
+        rng = random.Random(seed)
+        plug_board = random_plug_board(rng)
+        keys = ["".join(rng.choice(string.ascii_lowercase) for _ in range(3)) for _ in range(n_messages)]
+        return [
+            to_strings(self.engine.encrypt(
+                2 * key, np.array([rotor_order]), np.array([starting_positions]), np.array([NOTCHES]), plug_board[None]
+            ))[0]
+            for key in keys
+        ]
+
+    def test_structures(self):
+        self.assertEqual(N_STRUCTURES, 101)
+        self.assertTrue(all(sum(partition) == 13 for partition in STRUCTURES))
+
+    def test_cycle_structure(self):
+        self.assertEqual(cycle_structure(list(range(26))), (1,) * 26)
+        self.assertEqual(cycle_structure([1, 0, 3, 4, 2] + list(range(5, 26))), (3, 2) + (1,) * 21)
+
+    def test_build(self):
+        self.assertEqual(len(self.catalog), 6 * 26 ** N_ROTORS)
+        self.assertTrue((np.diff(self.catalog.signatures.astype(np.int64)) >= 0).all())
+        single = CycleCatalog.build(self.rotor_mappings, self.reflector_mapping, NOTCHES, n_rotors=N_ROTORS, n_workers=1)
+        np.testing.assert_array_equal(single.signatures, self.catalog.signatures)
+
+    def test_query(self):
+        rng = random.Random(1)
+        for seed in range(5):
+            rotor_order = tuple(rng.sample(range(3), N_ROTORS))
+            starting_positions = tuple(rng.randrange(26) for _ in range(N_ROTORS))
+            settings = self.catalog.query(self.indicators(rotor_order, starting_positions, seed=seed))
+            self.assertIn((rotor_order, starting_positions), settings)
+            self.assertLess(len(settings), len(self.catalog) // 4)
+
+    def test_invalid_indicators(self):
+        indicators = self.indicators((0, 1), (3, 4))
+        with self.assertRaisesRegex(ValueError, "more indicators"):
+            indicator_products(indicators[:3])
+        with self.assertRaisesRegex(ValueError, "inconsistent"):
+            indicator_products(indicators + [indicators[0][:3] + "".join(
+                string.ascii_lowercase[(string.ascii_lowercase.index(c) + 1) % 26] for c in indicators[0][3:]
+            )])
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.bin")
+            self.catalog.save(path)
+            loaded = CycleCatalog.load(path)
+            np.testing.assert_array_equal(loaded.signatures, self.catalog.signatures)
+            self.assertTrue(loaded.is_for(self.rotor_mappings, self.reflector_mapping, NOTCHES))
+            self.assertFalse(loaded.is_for(self.rotor_mappings, self.reflector_mapping, (6, 0)))
+            indicators = self.indicators((2, 0), (17, 8))
+            self.assertEqual(loaded.query(indicators), self.catalog.query(indicators))
+            del loaded
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from lib.batched import to_indices
+from lib.scoring import IncrementalScore, NgramTable, log_probs_from_counts, table_path, write_table
+from tests.test_ciphertext_only import PLAINTEXT
+
+
+def count_ngrams(text, n):
+    counts = np.zeros((26,) * n)
+    indices = to_indices(text)
+    for start in range(len(indices) - n + 1):
+        counts[tuple(indices[start:start + n])] += 1
+    return counts
+
+
+def naive_score(log_probs, text):
+    return sum(float(log_probs[tuple(text[i:i + log_probs.ndim])]) for i in range(len(text) - log_probs.ndim + 1))
+
+
+class TestNgramTable(unittest.TestCase):
+    def setUp(self):
+        self.tables = {n: log_probs_from_counts(count_ngrams(PLAINTEXT, n)) for n in (2, 3, 4)}
+
+    def test_score_matches_naive(self):
+        text = list(to_indices(PLAINTEXT[:80]))
+        for n, log_probs in self.tables.items():
+            with self.subTest(n=n):
+                self.assertAlmostEqual(NgramTable(log_probs).score(text), naive_score(log_probs, text), places=3)
+
+    def test_batch_matches_single(self):
+        rng = np.random.default_rng(0)
+        texts = rng.integers(0, 26, size=(20, 50))
+        table = NgramTable(self.tables[4])
+        np.testing.assert_allclose(table.score_batch(texts), [table.score(text) for text in texts], rtol=1e-6)
+
+    def test_language_scores_higher(self):
+        table = NgramTable(self.tables[3])
+        english = to_indices(PLAINTEXT[:100])
+        shuffled = np.random.default_rng(0).permutation(english)
+        self.assertGreater(table.score(english), table.score(shuffled))
+
+    def test_short_texts(self):
+        table = NgramTable(self.tables[4])
+        self.assertEqual(table.score([1, 2, 3]), 0.0)
+        self.assertEqual(table.score_batch(np.zeros((3, 2), dtype=np.uint8)).tolist(), [0.0] * 3)
+
+    def test_file_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = table_path(directory, 3)
+            write_table(path, self.tables[3])
+            table = NgramTable.open(path)
+            self.assertIsInstance(table.log_probs, np.memmap)
+            np.testing.assert_array_equal(table.log_probs, self.tables[3])
+            text = to_indices(PLAINTEXT[:60])
+            self.assertEqual(table.score(text), NgramTable(self.tables[3]).score(text))
+            del table
+
+    def test_open_rejects_other_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "table.bin")
+            with open(path, "wb") as f:
+                f.write(b"not a table at all")
+            with self.assertRaises(ValueError):
+                NgramTable.open(path)
+
+    def test_invalid_shape(self):
+        with self.assertRaises(ValueError):
+            NgramTable(np.zeros((26, 25), dtype=np.float32))
+
+
+class TestIncrementalScore(unittest.TestCase):
+    def test_matches_full_rescoring(self):
+        rng = random.Random(0)
+        for n in (2, 3, 4):
+            with self.subTest(n=n):
+                table = NgramTable(log_probs_from_counts(count_ngrams(PLAINTEXT, n)))
+                incremental = IncrementalScore(table, to_indices(PLAINTEXT[:40]))
+                for _ in range(50):
+                    changes = {rng.randrange(40): rng.randrange(26) for _ in range(rng.randint(1, 3))}
+                    text = list(incremental.text)
+                    delta = incremental.delta(changes)
+                    self.assertEqual(incremental.text, text)
+
+                    incremental.apply(changes, delta)
+                    self.assertAlmostEqual(incremental.score, table.score(incremental.text), places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+
+from lib.client import EnigmaClient, load_test
+from lib.internals import Enigma
+from lib.server import EncryptionServer, LatencyTracker
+from tests.data import test_configuration
+from tests.test_ciphertext_only import PLAINTEXT
+
+
+class TestLatencyTracker(unittest.TestCase):
+    def test_percentiles(self):
+        tracker = LatencyTracker()
+        for ms in range(1, 101):
+            tracker.record(ms / 1000)
+        self.assertEqual(tracker.percentiles(), {"p50": 51.0, "p90": 91.0, "p99": 100.0})
+        self.assertEqual(LatencyTracker().percentiles((50,)), {"p50": 0.0})
+
+
+class TestEncryptionServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Messages longer than 50 letters go to the worker processes
+        self.server = EncryptionServer(n_workers=2, inline_threshold=50)
+        self.address = await self.server.start()
+        self.client = await EnigmaClient.connect(*self.address)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_sessions_continue_like_enigma(self):
+        machine = Enigma.from_configuration(test_configuration)
+        session = await self.client.open(test_configuration)
+        for message in ["hello", PLAINTEXT, "world", PLAINTEXT[:51], "a"]:
+            self.assertEqual(await self.client.encrypt(session, message), machine.encrypt(message))
+
+    async def test_concurrent_requests_keep_arrival_order(self):
+        session = await self.client.open(test_configuration)
+        messages = [PLAINTEXT[i:i + 20 + 17 * (i % 5)] for i in range(30)]
+        expected_machine = Enigma.from_configuration(test_configuration)
+        expected = [expected_machine.encrypt(message) for message in messages]
+
+        # Requests are written in order, so the server assigns positions in order, whatever the completion order
+        results = await asyncio.gather(*(self.client.encrypt(session, m) for m in messages))
+        self.assertEqual(results, expected)
+
+    async def test_independent_sessions(self):
+        first = await self.client.open(test_configuration)
+        other_client = await EnigmaClient.connect(*self.address)
+        try:
+            second = await other_client.open(test_configuration)
+            await self.client.encrypt(first, "advance")
+            machine = Enigma.from_configuration(test_configuration)
+            self.assertEqual(await other_client.encrypt(second, "hello"), machine.encrypt("hello"))
+        finally:
+            await other_client.close()
+
+    async def test_errors(self):
+        session = await self.client.open(test_configuration)
+        with self.assertRaises(ValueError):
+            await self.client.encrypt(session, "Hello")
+        with self.assertRaises(ValueError):
+            await self.client.encrypt(session, "A" * 100)
+        with self.assertRaises(ValueError):
+            await self.client.encrypt(session + 1, "hello")
+        with self.assertRaises(ValueError):
+            await self.client.request("fly")
+        with self.assertRaises(ValueError):
+            await self.client.request("open", configuration={"rotors": []})
+
+        # Failed requests leave the session untouched
+        machine = Enigma.from_configuration(test_configuration)
+        self.assertEqual(await self.client.encrypt(session, "hello"), machine.encrypt("hello"))
+
+    async def test_close_session(self):
+        session = await self.client.open(test_configuration)
+        self.assertEqual((await self.client.stats())["sessions"], 1)
+        await self.client.close_session(session)
+        self.assertEqual((await self.client.stats())["sessions"], 0)
+        with self.assertRaises(ValueError):
+            await self.client.encrypt(session, "hello")
+
+    async def test_load_test(self):
+        results = await load_test(*self.address, test_configuration, n_sessions=3, n_requests=10, message_length=80)
+        self.assertEqual(results["requests"], 30)
+        self.assertGreater(results["server"]["batches"], 0)
+        self.assertLessEqual(results["latency_ms"]["p50"], results["latency_ms"]["p99"])
+        self.assertGreaterEqual(results["server"]["requests"], 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
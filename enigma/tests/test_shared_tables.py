@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+from lib.batched import BatchedEnigma
+from lib.ciphertext_only import CiphertextOnlyAttack
+from lib.internals import Enigma, Reflector
+from lib.shared_tables import STORE_HEADER, SharedTableStore, init_worker, worker_store
+
+N_ROTORS = 2
+
+
+def _worker_wiring(_) -> tuple:
+    store = worker_store()
+    rotors = [rotor.mapping for rotor in Enigma.get_available_rotors()]
+    return rotors, dict(Reflector.mapping), store.core_table([2, 0])[:3].tolist(), store.tables.flags.writeable
+
+
+class TestSharedTables(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = BatchedEnigma()
+        cls.store = SharedTableStore.create(n_rotors=N_ROTORS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store.close()
+        cls.store.unlink()
+
+    def test_tables(self):
+        self.assertEqual(len(self.store.rotor_orders), 20)
+        for rotor_order in [(0, 1), (4, 3)]:
+            np.testing.assert_array_equal(self.store.core_table(list(rotor_order)), self.engine.core_table(list(rotor_order)))
+        np.testing.assert_array_equal(self.store.rotor_mappings, self.engine.rotor_mappings)
+        with self.assertRaises(KeyError):
+            self.store.core_table([0, 1, 2])
+
+    def test_built_by_workers(self):
+        with SharedTableStore.create(n_rotors=N_ROTORS, n_workers=2) as store:
+            np.testing.assert_array_equal(store.tables, self.store.tables)
+
+    def test_attach(self):
+        store = SharedTableStore.attach(self.store.name)
+        self.assertFalse(store.owner)
+        self.assertEqual(store.wiring, self.store.wiring)
+        np.testing.assert_array_equal(store.core_table([3, 1]), self.store.core_table([3, 1]))
+        with self.assertRaises(ValueError):
+            store.core_table([3, 1])[0, 0] = 0
+        with self.assertRaises(ValueError):
+            store.unlink()
+        store.close()
+
+    def test_corrupted_wiring(self):
+        with SharedTableStore.create(n_rotors=1) as store:
+            store.memory.buf[STORE_HEADER.size] ^= 1
+            with self.assertRaises(ValueError):
+                SharedTableStore.attach(store.name)
+
+    def test_separate_process_keeps_block(self):
+        # A process started on its own has its own resource tracker, which must not destroy the block when it exits
+        script = f"from lib.shared_tables import SharedTableStore; SharedTableStore.attach({self.store.name!r}).close()"
+        directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, "-c", script], cwd=directory, check=True)
+        SharedTableStore.attach(self.store.name).close()
+
+    def test_workers_share_wiring(self):
+        # Spawned workers import the package again, and draw their own wiring unless it is pinned
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(2, initializer=init_worker, initargs=(self.store.name,)) as pool:
+            results = pool.map(_worker_wiring, range(2))
+        for rotors, reflector, table, writeable in results:
+            self.assertEqual(rotors, [rotor.mapping for rotor in Enigma.get_available_rotors()])
+            self.assertEqual(reflector, Reflector.mapping)
+            self.assertEqual(table, self.engine.core_table([2, 0])[:3].tolist())
+            self.assertFalse(writeable)
+
+    def test_ciphertext_only_attack(self):
+        ctx = "qwertyuiopasdfghjklzxcvbnmqwertyuiopasdfghjklzxcvbnm"
+        expected = CiphertextOnlyAttack(ctx, n_rotors=N_ROTORS, top_k=3).run(n_workers=1)
+        attack = CiphertextOnlyAttack(ctx, n_rotors=N_ROTORS, top_k=3, store=self.store)
+        self.assertEqual(attack.run(n_workers=1), expected)
+        self.assertEqual(attack.run(n_workers=2), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
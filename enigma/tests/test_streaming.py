@@ -0,0 +1,69 @@
+import copy
+import io
+import random
+import string
+import tempfile
+import unittest
+
+from lib.internals import Enigma
+from lib.compiled import CompiledEnigma
+from lib.streaming import StreamEncryptor, encrypt_stream
+
+
+def random_message(length: int) -> str:
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+class TestStreamEncryptor(unittest.TestCase):
+    def setUp(self):
+        self.machine = Enigma()
+        self.reference = copy.deepcopy(self.machine)
+
+    def test_chunks_carry_state(self):
+        msg = random_message(10000)
+        chunks = [msg[i:i + 777] for i in range(0, len(msg), 777)]
+        self.assertEqual("".join(encrypt_stream(self.machine, chunks, chunk_size=500)), self.reference.encrypt(msg))
+
+    def test_machine_is_kept_in_sync(self):
+        list(encrypt_stream(self.machine, [b"hello", b"world"]))
+        self.reference.encrypt("helloworld")
+        self.assertEqual(self.machine.encrypt("more"), self.reference.encrypt("more"))
+
+    def test_compiled_machine(self):
+        compiled = CompiledEnigma.from_enigma(self.machine)
+        self.assertEqual(list(encrypt_stream(compiled, [b"abc", b"def"])), [self.reference.encrypt("abc").encode(), self.reference.encrypt("def").encode()])
+
+    def test_error_mode(self):
+        with self.assertRaises(ValueError):
+            list(encrypt_stream(self.machine, ["hello world"]))
+
+    def test_strip_mode(self):
+        output = "".join(encrypt_stream(self.machine, ["hello, wörld!"], invalid="strip"))
+        self.assertEqual(output, self.reference.encrypt("hellowrld"))
+
+    def test_pass_mode(self):
+        output = "".join(encrypt_stream(self.machine, ["hello, wörld!\n"], invalid="pass", chunk_size=4))
+        expected = self.reference.encrypt("hellowrld")
+        self.assertEqual(output, f"{expected[:5]}, {expected[5]}ö{expected[6:]}!\n")
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            StreamEncryptor(self.machine, invalid="ignore")
+
+    def test_encrypt_file(self):
+        msg = random_message(5000).encode()
+        for use_mmap in [False, True]:
+            with self.subTest(use_mmap=use_mmap):
+                machine = copy.deepcopy(self.machine)
+                with tempfile.TemporaryFile() as src:
+                    src.write(msg)
+                    src.seek(0)
+                    dst = io.BytesIO()
+                    written = StreamEncryptor(machine, chunk_size=1024).encrypt_file(src, dst, use_mmap=use_mmap)
+                self.assertEqual(written, len(msg))
+                self.assertEqual(dst.getvalue().decode(), copy.deepcopy(self.reference).encrypt(msg.decode()))
+
+    def test_empty_file(self):
+        with tempfile.TemporaryFile() as src:
+            dst = io.BytesIO()
+            self.assertEqual(StreamEncryptor(self.machine).encrypt_file(src, dst, use_mmap=True), 0)